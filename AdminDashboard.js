@@ -5,6 +5,7 @@ import { CircularProgressbar, buildStyles } from 'react-circular-progressbar';
 import PredictionRow from './PredictionRow';
 import { PieChart, Pie, Cell, Tooltip, Legend } from 'recharts';
 import { useNavigate } from 'react-router-dom';
+import { subscribeToStream, appendStreamItems } from './eventStream';
 
 const metricIcons = {
   accuracy: <FaCheckCircle color="#13ffb9" size={28} />, 
@@ -40,7 +41,6 @@ function AdminDashboard() {
   // Analytics dashboard (charts, metrics, etc.)
   const [metrics, setMetrics] = useState({});
   const [results, setResults] = useState([]);
-  const [shapBarData, setShapBarData] = useState(null);
   const [lineData, setLineData] = useState(null);
   const [pieData, setPieData] = useState(null);
   const navigate = useNavigate();
@@ -60,40 +60,16 @@ function AdminDashboard() {
   const [toastMsg, setToastMsg] = useState('');
   const audioRef = useRef(null);
 
-  // Auto-refresh metrics and history every 1 second
-  useEffect(() => {
-    const fetchData = () => {
-      fetch('http://localhost:5000/metrics')
-        .then(res => res.json())
-        .then(setMetrics);
-      fetch('http://localhost:5000/history')
-        .then(res => res.json())
-        .then(data => {
-          setResults(data.history || []);
-          setLivePulse(true);
-          setTimeout(() => setLivePulse(false), 400);
-        });
-    };
-    fetchData();
-    const interval = setInterval(fetchData, 1000);
-    return () => clearInterval(interval);
-  }, []);
-
-  // Fetch system status
-  useEffect(() => {
-    const fetchSystemStatus = async () => {
-      try {
-        const response = await fetch('http://localhost:5000/system-status');
-        const data = await response.json();
-        setSystemStatus(data);
-      } catch (error) {
-        console.error('Error fetching system status:', error);
-      }
-    };
-    fetchSystemStatus();
-    const interval = setInterval(fetchSystemStatus, 5000);
-    return () => clearInterval(interval);
-  }, []);
+  // Metrics, history and system status are pushed by the server as they change
+  useEffect(() => subscribeToStream({
+    metrics: setMetrics,
+    history: data => {
+      setResults(prev => appendStreamItems(prev, data, 50));
+      setLivePulse(true);
+      setTimeout(() => setLivePulse(false), 400);
+    },
+    status: setSystemStatus,
+  }), []);
 
   useEffect(() => {
     // Pie chart for prediction distribution
@@ -116,29 +92,6 @@ function AdminDashboard() {
     } else {
       setPieData(null);
     }
-    // Bar chart for average SHAP values per feature
-    if (results.length && results[0].explanation) {
-      const nFeatures = results[0].explanation.length;
-      const avgShap = Array(nFeatures).fill(0);
-      results.forEach(r => {
-        r.explanation.forEach((v, i) => {
-          avgShap[i] += Math.abs(v);
-        });
-      });
-      for (let i = 0; i < nFeatures; i++) avgShap[i] /= results.length;
-      setShapBarData({
-        labels: Array.from({ length: nFeatures }, (_, i) => `Feature ${i + 1}`),
-        datasets: [
-          {
-            label: 'Avg |SHAP value|',
-            data: avgShap,
-            backgroundColor: '#36A2EB',
-          },
-        ],
-      });
-    } else {
-      setShapBarData(null);
-    }
     // Line chart for predictions over time
     if (results.length) {
       setLineData({
@@ -408,6 +361,30 @@ function AdminDashboard() {
                 <div className="empty-results">No predictions yet. Upload data or make a prediction to see results here.</div>
               )}
             </div>
+            <div className="results-table-section">
+              <h3>Recent Predictions</h3>
+              {results.length ? (
+                <table className="results-table">
+                  <thead>
+                    <tr>
+                      <th>#</th>
+                      <th>Time</th>
+                      <th>Protocol</th>
+                      <th>Prediction</th>
+                      <th>Explanation</th>
+                      <th>Label</th>
+                    </tr>
+                  </thead>
+                  <tbody>
+                    {results.slice().reverse().map((row, i) => (
+                      <PredictionRow key={row.id} idx={i} row={row} />
+                    ))}
+                  </tbody>
+                </table>
+              ) : (
+                <div className="empty-results">No predictions yet.</div>
+              )}
+            </div>
           </div>
         )}
         {activeTab === 'status' && (
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './NetworkDashboard.css';
+import { subscribeToStream, appendStreamItems } from './eventStream';
 
 function NetworkDashboard() {
   // Upload/capture interface
@@ -31,33 +32,6 @@ function NetworkDashboard() {
   const [showAlertModal, setShowAlertModal] = useState(false);
   const [currentAlert, setCurrentAlert] = useState(null);
 
-  // Add live polling for recent predictions
-  useEffect(() => {
-    const fetchHistory = () => {
-      fetch('http://localhost:5000/history')
-        .then(res => res.json())
-        .then(data => {
-          setResults(data.history || []);
-          setLivePulse(true);
-          setTimeout(() => setLivePulse(false), 400);
-        });
-    };
-    fetchHistory();
-    const interval = setInterval(fetchHistory, 1000);
-    return () => clearInterval(interval);
-  }, []);
-
-  // Poll live IDS predictions
-  const fetchLivePredictions = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/live-predictions');
-      const data = await response.json();
-      setLivePredictions(data.live_predictions || []);
-    } catch (error) {
-      console.error('Error fetching live predictions:', error);
-    }
-  };
-
   const handleFileChange = (e) => {
     setFile(e.target.files[0]);
   };
@@ -107,7 +81,7 @@ function NetworkDashboard() {
     try {
       setPredictLoading(true);
       const parsed = JSON.parse(data);
-      const res = await fetch('http://localhost:5000/predict', {
+      const res = await fetch('http://localhost:5000/predict?explain=full', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ data: parsed }),
@@ -344,26 +318,6 @@ function NetworkDashboard() {
     }
   };
 
-  const fetchSystemStatus = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/system-status');
-      const data = await response.json();
-      setSystemStatus(data);
-    } catch (error) {
-      console.error('Error fetching system status:', error);
-    }
-  };
-
-  const fetchThreatAnalysis = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/threat-analysis');
-      const data = await response.json();
-      setThreatAnalysis(data);
-    } catch (error) {
-      console.error('Error fetching threat analysis:', error);
-    }
-  };
-
   const fetchModelComparison = async () => {
     try {
       const response = await fetch('http://localhost:5000/model-comparison');
@@ -374,16 +328,6 @@ function NetworkDashboard() {
     }
   };
 
-  const fetchForensicLog = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/forensic-log');
-      const data = await response.json();
-      setForensicLog(data.log || []);
-    } catch (error) {
-      console.error('Error fetching forensic log:', error);
-    }
-  };
-
   const fetchAlerts = async () => {
     try {
       const response = await fetch('http://localhost:5000/alerts');
@@ -431,25 +375,24 @@ function NetworkDashboard() {
   };
 
   useEffect(() => {
-    // Initial data fetch
-    fetchLivePredictions();
-    fetchSystemStatus();
-    fetchThreatAnalysis();
     fetchModelComparison();
-    fetchForensicLog();
-    fetchAlerts();
-    fetchAlertStats();
-
-    // Set up polling
-    const interval = setInterval(() => {
-      fetchLivePredictions();
-      fetchSystemStatus();
-      fetchThreatAnalysis();
-      fetchAlerts();
-      fetchAlertStats();
-    }, 2000);
-
-    return () => clearInterval(interval);
+
+    // Everything else is pushed by the server as it changes
+    return subscribeToStream({
+      history: data => {
+        setResults(prev => appendStreamItems(prev, data, 50));
+        setLivePulse(true);
+        setTimeout(() => setLivePulse(false), 400);
+      },
+      live: data => setLivePredictions(prev => appendStreamItems(prev, data, 100)),
+      status: setSystemStatus,
+      threats: setThreatAnalysis,
+      forensic: data => setForensicLog(data.log || []),
+      alerts: data => {
+        setAlerts(data.alerts || []);
+        setAlertStats(data.stats || {});
+      },
+    });
   }, []);
 
   const renderSystemStatus = () => (
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './PDMSDashboard.css';
+import { subscribeToStream, appendStreamItems } from './eventStream';
 
 const PDMSDashboard = () => {
   const [livePredictions, setLivePredictions] = useState([]);
@@ -13,36 +14,6 @@ const PDMSDashboard = () => {
   const [hoveredBtn, setHoveredBtn] = useState(null);
   const navigate = useNavigate();
 
-  const fetchLivePredictions = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/live-predictions');
-      const data = await response.json();
-      setLivePredictions(data.live_predictions || []);
-    } catch (error) {
-      console.error('Error fetching live predictions:', error);
-    }
-  };
-
-  const fetchSystemStatus = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/system-status');
-      const data = await response.json();
-      setSystemStatus(data);
-    } catch (error) {
-      console.error('Error fetching system status:', error);
-    }
-  };
-
-  const fetchThreatAnalysis = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/threat-analysis');
-      const data = await response.json();
-      setThreatAnalysis(data);
-    } catch (error) {
-      console.error('Error fetching threat analysis:', error);
-    }
-  };
-
   const fetchModelComparison = async () => {
     try {
       const response = await fetch('http://localhost:5000/model-comparison');
@@ -53,16 +24,6 @@ const PDMSDashboard = () => {
     }
   };
 
-  const fetchForensicLog = async () => {
-    try {
-      const response = await fetch('http://localhost:5000/forensic-log');
-      const data = await response.json();
-      setForensicLog(data.log || []);
-    } catch (error) {
-      console.error('Error fetching forensic log:', error);
-    }
-  };
-
   const handleAction = async (action, data) => {
     setLoading(true);
     try {
@@ -75,8 +36,6 @@ const PDMSDashboard = () => {
       });
       const result = await response.json();
       console.log(`${action} result:`, result);
-      // Refresh data after action
-      fetchLivePredictions();
     } catch (error) {
       console.error(`Error performing ${action}:`, error);
     } finally {
@@ -85,21 +44,15 @@ const PDMSDashboard = () => {
   };
 
   useEffect(() => {
-    // Initial data fetch
-    fetchLivePredictions();
-    fetchSystemStatus();
-    fetchThreatAnalysis();
     fetchModelComparison();
-    fetchForensicLog();
-
-    // Set up polling
-    const interval = setInterval(() => {
-      fetchLivePredictions();
-      fetchSystemStatus();
-      fetchThreatAnalysis();
-    }, 2000);
 
-    return () => clearInterval(interval);
+    // Everything else is pushed by the server as it changes
+    return subscribeToStream({
+      live: data => setLivePredictions(prev => appendStreamItems(prev, data, 100)),
+      status: setSystemStatus,
+      threats: setThreatAnalysis,
+      forensic: data => setForensicLog(data.log || []),
+    });
   }, []);
 
   const renderSystemStatus = () => (
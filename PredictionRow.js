@@ -3,8 +3,33 @@ import React from 'react';
 function PredictionRow({ idx, row, highlight }) {
   const [open, setOpen] = React.useState(false);
   const [actionMsg, setActionMsg] = React.useState('');
+  const [topFeatures, setTopFeatures] = React.useState(null);
+  const [explainMsg, setExplainMsg] = React.useState('');
   const isMalicious = row.prediction && row.prediction.toLowerCase() === 'malicious';
 
+  // History rows carry no SHAP values; the backend explains a prediction
+  // on demand, so fetch it the first time the row is opened
+  React.useEffect(() => {
+    if (!open || topFeatures || row.explanation || row.id === undefined || row.id === null) return undefined;
+    let cancelled = false;
+    setExplainMsg('Loading explanation...');
+    fetch(`http://localhost:5000/explain/${row.id}?explain=topk`)
+      .then(res => res.json().then(info => ({ ok: res.ok, info })))
+      .then(({ ok, info }) => {
+        if (cancelled) return;
+        if (ok) {
+          setTopFeatures(info.top_features || []);
+          setExplainMsg('');
+        } else {
+          setExplainMsg(info.error || 'No explanation available');
+        }
+      })
+      .catch(() => {
+        if (!cancelled) setExplainMsg('Could not load explanation');
+      });
+    return () => { cancelled = true; };
+  }, [open, row.id, row.explanation, topFeatures]);
+
   // Helper to call backend action endpoints
   const handleAction = async (action) => {
     setActionMsg('');
@@ -76,6 +101,17 @@ function PredictionRow({ idx, row, highlight }) {
             ]
           </div>
         )}
+        {open && topFeatures && (
+          <div style={{ marginTop: 8, background: '#181c24', borderRadius: 8, padding: 8, color: '#fff', fontSize: 14, boxShadow: '0 2px 8px #00eaff44' }}>
+            <b>Top SHAP features:</b>
+            {topFeatures.map(f => (
+              <div key={f.feature}>
+                {f.feature}: <span style={{ color: f.value > 0 ? '#ff357a' : '#5ee6a6' }}>{f.value.toFixed(3)}</span>
+              </div>
+            ))}
+          </div>
+        )}
+        {open && explainMsg && <div style={{ color: '#b0b8d1', fontSize: 13, marginTop: 6 }}>{explainMsg}</div>}
       </td>
       <td style={{ padding: 8 }}>{row.label !== undefined && row.label !== null ? row.label : '--'}</td>
     </tr>
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory
 from flask_cors import CORS
 import os
 import pandas as pd
@@ -6,14 +6,28 @@ import joblib
 import numpy as np
 from collections import Counter
 import threading
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import glob
 import logging
 from werkzeug.utils import secure_filename
-from live_packet_capture import live_predictions, lock, capture_loop
-from threat_alert_system import process_threat, get_alerts, get_alert_stats
-import csv
+from live_packet_capture import live_predictions, alert_log, FORENSIC_LOG_DIR
+import forensic_store
+import instrumentation
+import profiling
+import shared_state
+from explanations import EXPLAIN_MODES, ExplanationCache, explain_rows, top_k
+import dataset_cache
+import chunked_training
+import model_comparison
+import model_store
+from model_store import ModelBundle
+from model_registry import ModelRegistry
+from parallel_scoring import ParallelScorer
+from retrain_jobs import QueueFull, TrainingLock, open_scheduler
+from event_stream import EventHub, LogTopic, SnapshotTopic, TooManyClients, STREAM_MAX_RATE
+from response_cache import ResponseCache, time_bucket
+from threat_alert_system import process_threat
 import time
+import json
 from datetime import datetime
 
 MODEL_PATH = 'rf_model.joblib'
@@ -25,34 +39,53 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-MODEL = None
-EXPLAINER = None
-FEATURE_LIST = []
-if os.path.exists(MODEL_PATH) and os.path.exists(EXPLAINER_PATH) and os.path.exists(FEATURES_PATH):
-    MODEL = joblib.load(MODEL_PATH)
-    EXPLAINER = joblib.load(EXPLAINER_PATH)
+MODELS_DIR = model_store.MODELS_DIR
+MODEL_POLL_SECONDS = 2.0  # How quickly a retrain/rollback by another process is picked up
+LEGACY_BUNDLE = None
+if model_store.current_version(MODELS_DIR) is None and os.path.exists(MODEL_PATH) \
+        and os.path.exists(EXPLAINER_PATH) and os.path.exists(FEATURES_PATH):
+    # Flat files from before versioned models: served as version 0
     with open(FEATURES_PATH) as f:
-        FEATURE_LIST = [line.strip() for line in f.readlines()]
-
-# Store prediction history and metrics
-PREDICTION_HISTORY = []  # Each entry: {'prediction': ..., 'explanation': ..., 'label': ...}
+        LEGACY_BUNDLE = ModelBundle(joblib.load(MODEL_PATH), joblib.load(EXPLAINER_PATH),
+                                    [line.strip() for line in f.readlines()])
+# Versioned models with memory-mapped trees, shared with the capture process
+REGISTRY = ModelRegistry(MODELS_DIR, poll_interval=MODEL_POLL_SECONDS, fallback=LEGACY_BUNDLE)
+# The active (model, explainer, feature list, metrics, version). Requests read
+# BUNDLE once and use only that object, so a retrain swapping it mid-request
+# can never mix a new feature list with an old model.
+BUNDLE = REGISTRY.current()
+BUNDLE_LOCK = threading.Lock()
+# Batches of IDS_PARALLEL_MIN_ROWS rows or more are split across a pool of
+# IDS_SCORING_WORKERS processes; smaller ones are scored in-process
+SCORER = ParallelScorer()
+
+# SHAP explanations are computed on demand (/predict?explain=..., /explain/<id>)
+EXPLANATION_CACHE = ExplanationCache(maxsize=4096)
+DEFAULT_TOP_K = 10
+# Encoded rows of recent predictions, so /explain/<id> can be answered later
+MAX_EXPLAINABLE = 10000
+# Training metrics of the served model; labelled /predict traffic overrides them
 METRICS = {'accuracy': None, 'precision': None, 'recall': None, 'f1_score': None}
+THREAT_WINDOW_MINUTES = 15
+# Prediction history, running counts, the labelled-traffic confusion matrix
+# (plus last-N / last-T windows), active threats and explainable rows. With
+# IDS_STATE_BACKEND=sqlite this lives in a database every worker shares.
+STATE = shared_state.open_state(window_count=1000, window_seconds=THREAT_WINDOW_MINUTES * 60,
+                                max_explainable=MAX_EXPLAINABLE)
 
 # PDMS System State
 SYSTEM_STATE = {
     'status': 'operational',
     'uptime': time.time(),
-    'total_packets_analyzed': 0,
-    'threats_detected': 0,
     'false_positives': 0,
-    'model_performance': {},
-    'active_threats': [],
-    'system_health': {
-        'cpu_usage': 0,
-        'memory_usage': 0,
-        'network_load': 0
-    }
+    'model_performance': {}
 }
+# Per-stage timings and CPU/RSS samples; system_health in /system-status comes from here
+instrumentation.start('api')
+# On-demand cProfile/stack-sampling sessions (see /admin/profile); off unless started
+PROFILER = profiling.Profiler()
+ADMIN_TOKEN = os.environ.get('IDS_ADMIN_TOKEN')  # If set, /admin/* requires it in X-Admin-Token
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')  # Without a token, /admin/* only answers these
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -70,64 +103,121 @@ ALLOWED_EXTENSIONS = {'csv'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def retrain_model_from_csv(data_path):
-    """Retrain the model from a CSV file and update global state."""
-    global MODEL, EXPLAINER, FEATURE_LIST, METRICS
+def retrain_model_from_csv(data_path, job=None):
+    """Train a new model version from a CSV file and make it current.
+
+    Runs on the retraining worker (see RETRAIN_JOBS); `job` receives
+    progress updates. Returns the new version number.
+    """
+    def report(progress, stage):
+        if job is not None:
+            job.report(progress, stage)
+
+    options = job.options if job is not None else {}
     try:
-        df = pd.read_csv(data_path, nrows=10000)
-        logger.info(f'Retrain: CSV shape: {df.shape}')
-        logger.info(f'Retrain: CSV head:\n{df.head()}')
-        # Find label column (case-insensitive)
-        label_col = None
-        for col in df.columns:
-            if col.strip().lower() == 'label':
-                label_col = col
-                break
-        if label_col is None:
-            logger.warning('Retrain: No "Label" column found, using last column as label.')
-            label_col = df.columns[-1]
-        y = df[label_col]
-        X = df.drop(columns=[label_col])
-        logger.info(f'Retrain: Using features: {list(X.columns)}')
-        logger.info(f'Retrain: Using label: {label_col}')
-        X_encoded = pd.get_dummies(X)
-        with open(FEATURES_PATH, 'w') as f:
-            f.write('\n'.join(X_encoded.columns))
-        from sklearn.ensemble import RandomForestClassifier
-        from sklearn.model_selection import train_test_split
         from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
         import shap
-        X_train, X_test, y_train, y_test = train_test_split(X_encoded, y, test_size=0.2, random_state=42)
-        clf = RandomForestClassifier(n_estimators=20, random_state=42)
-        clf.fit(X_train, y_train)
+        if chunked_training.find_label_column(dataset_cache.column_names(data_path)) is None:
+            logger.warning('Retrain: No "Label" column found, using last column as label.')
+        # Streams the whole cached dataset; see chunked_training for the modes
+        clf, encoder, X_test, y_test, training = chunked_training.train(
+            data_path, mode=options.get('mode'), sample_rows=options.get('sample_rows'), report=report)
+        feature_list = encoder.feature_list
+        logger.info(f"Retrain: {training['mode']} on {training['train_rows']} of {training['rows']} rows, "
+                    f"label {training['label']!r}, {len(feature_list)} features, "
+                    f"peak memory {training['memory']}")
+        report(0.7, 'evaluating')
         y_pred = clf.predict(X_test)
-        acc = accuracy_score(y_test, y_pred)
-        prec = precision_score(y_test, y_pred, average='macro', zero_division=0)
-        rec = recall_score(y_test, y_pred, average='macro', zero_division=0)
-        f1 = f1_score(y_test, y_pred, average='macro', zero_division=0)
-        joblib.dump(clf, MODEL_PATH)
-        explainer = shap.TreeExplainer(clf)
-        joblib.dump(explainer, EXPLAINER_PATH)
-        MODEL = clf
-        EXPLAINER = explainer
-        FEATURE_LIST = list(X_encoded.columns)
-        logger.info(f'Retrain: New FEATURE_LIST: {FEATURE_LIST}')
-        METRICS['accuracy'] = acc
-        METRICS['precision'] = prec
-        METRICS['recall'] = rec
-        METRICS['f1_score'] = f1
-        # Update system state
-        SYSTEM_STATE['model_performance'] = {
-            'accuracy': acc,
-            'precision': prec,
-            'recall': rec,
-            'f1_score': f1,
-            'last_updated': datetime.now().isoformat()
+        metrics = {
+            'accuracy': accuracy_score(y_test, y_pred),
+            'precision': precision_score(y_test, y_pred, average='macro', zero_division=0),
+            'recall': recall_score(y_test, y_pred, average='macro', zero_division=0),
+            'f1_score': f1_score(y_test, y_pred, average='macro', zero_division=0),
         }
+        report(0.8, 'building explainer')
+        explainer = shap.TreeExplainer(clf)
+        report(0.9, 'saving')
+        version = model_store.save(clf, explainer, feature_list, metrics,
+                                   directory=MODELS_DIR, source=os.path.basename(data_path),
+                                   check_X=X_test.astype(np.float64), training=training, encoder=encoder)
+        activate_model_version(version)
+        logger.info(f'Retrain: model version {version}, features: {feature_list}')
+        return version
     except Exception as e:
         logger.error(f'Retrain error: {e}')
         import traceback
         traceback.print_exc()
+        raise
+
+def activate_model_version(version):
+    """Point CURRENT at a saved version and swap it in here right away.
+
+    Other processes (the packet capture, other API workers) pick the
+    change up through their own registry within MODEL_POLL_SECONDS.
+    """
+    with BUNDLE_LOCK:
+        model_store.activate(version, directory=MODELS_DIR)
+        # Keep the flat files older tools load in step with CURRENT
+        model_store.publish_legacy(version, MODEL_PATH, EXPLAINER_PATH, FEATURES_PATH, directory=MODELS_DIR)
+        bundle = REGISTRY.refresh()
+    if bundle is None or bundle.version != version:
+        raise RuntimeError(f'Model version {version} could not be loaded')
+    return bundle
+
+def _warm_scorer(bundle):
+    try:
+        SCORER.start(bundle)
+    except Exception as e:
+        logger.warning(f'Could not pre-warm the scoring pool for model version {bundle.version}: {e}')
+
+def _on_model_change(bundle):
+    """Registry listener: serve the newly loaded bundle."""
+    global BUNDLE
+    METRICS.update(bundle.metrics)
+    SYSTEM_STATE['model_performance'] = dict(bundle.metrics, version=bundle.version,
+                                             last_updated=datetime.now().isoformat())
+    # Last: the bundle version keys cached responses built from the two above
+    BUNDLE = bundle
+    # Start the scoring pool (at import, in every server worker) and load each new
+    # version into it, so no large batch pays for process start or model load
+    if SCORER.workers > 1 and bundle.version:
+        threading.Thread(target=_warm_scorer, args=(bundle,), name='scorer-warm', daemon=True).start()
+
+REGISTRY.add_listener(_on_model_change)
+REGISTRY.refresh()
+REGISTRY.watch()
+
+# Retrains and model comparisons run one at a time, never alongside each
+# other; duplicate requests are merged. With the sqlite backend the queues
+# are shared, so any worker can report any job
+TRAINING_LOCK = TrainingLock()
+RETRAIN_JOBS = open_scheduler(retrain_model_from_csv, max_queued=8, lock=TRAINING_LOCK)
+
+def run_model_comparison(data_path, job=None):
+    """Benchmark the candidate models on a CSV file (see model_comparison)."""
+    options = job.options if job is not None else {}
+    comparison = model_comparison.run(data_path, job, directory=MODELS_DIR,
+                                      candidates=options.get('candidates'),
+                                      sample_rows=options.get('sample_rows', model_comparison.SAMPLE_ROWS))
+    return {'candidates': len(comparison['results']), 'recommendations': comparison['recommendations']}
+
+COMPARISON_JOBS = open_scheduler(run_model_comparison, max_queued=2, max_history=20, name='comparison',
+                                 lock=TRAINING_LOCK)
+
+# Serialized payloads of the polled endpoints, reused while their version holds
+RESPONSES = ResponseCache(epoch=STATE.epoch)
+
+def _model_version():
+    bundle = BUNDLE
+    return bundle.version if bundle is not None else None
+
+def _submit_retrain(data_path, options=None):
+    """Queue a retrain and build the job part of the response (or a 503)."""
+    try:
+        job, merged = RETRAIN_JOBS.submit(data_path, options)
+    except QueueFull as e:
+        return None, (jsonify({'error': str(e)}), 503)
+    return {'job_id': job.id, 'job': job.to_dict(), 'merged': merged}, None
 
 @app.route('/')
 def home():
@@ -136,24 +226,31 @@ def home():
 @app.route('/system-status', methods=['GET'])
 def system_status():
     """Get comprehensive system status and health metrics."""
+    versions = STATE.versions()
+    version = (versions['stats'], versions['threats'], _model_version(), SYSTEM_STATE['status'], time_bucket())
+    return RESPONSES.respond('system-status', version, _system_status_payload)
+
+def _system_status_payload():
     uptime_seconds = time.time() - SYSTEM_STATE['uptime']
     uptime_hours = uptime_seconds / 3600
     
-    # Calculate threat statistics
-    total_predictions = len(PREDICTION_HISTORY)
-    malicious_count = sum(1 for p in PREDICTION_HISTORY if p.get('prediction') == 'Malicious')
+    # Threat statistics come from running counters, not a history scan
+    stats = STATE.prediction_stats()
+    snapshots = instrumentation.collect()
     
-    return jsonify({
+    return {
         'status': SYSTEM_STATE['status'],
         'uptime_hours': round(uptime_hours, 2),
-        'total_packets_analyzed': total_predictions,
-        'threats_detected': malicious_count,
-        'threat_rate': round(malicious_count / max(total_predictions, 1) * 100, 2),
+        'total_packets_analyzed': stats['total'],
+        'threats_detected': stats['positive'],
+        'threat_rate': stats['rate'],
+        'recent_threat_rate': stats['window_rate'],
         'model_performance': SYSTEM_STATE['model_performance'],
-        'system_health': SYSTEM_STATE['system_health'],
-        'active_threats': SYSTEM_STATE['active_threats'][-10:],  # Last 10 threats
+        'system_health': instrumentation.health(snapshots),
+        'pipeline': instrumentation.summary(snapshots),
+        'active_threats': STATE.recent_threats(10),  # Last 10 threats
         'last_updated': datetime.now().isoformat()
-    })
+    }
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
@@ -172,57 +269,85 @@ def upload_file():
             return jsonify({'error': 'File too large. Max 100MB allowed.'}), 400
         filepath = os.path.join(UPLOAD_FOLDER, filename)
         file.save(filepath)
-        # Process in chunks if large
-        chunk_size = 10000
-        rows = 0
-        try:
-            for chunk in pd.read_csv(filepath, chunksize=chunk_size, encoding='utf-8'):
-                rows += len(chunk)
-        except UnicodeDecodeError:
-            for chunk in pd.read_csv(filepath, chunksize=chunk_size, encoding='utf-16'):
-                rows += len(chunk)
-        threading.Thread(target=retrain_model_from_csv, args=(filepath,)).start()
+        # Parse once into the columnar cache; retrain and scoring read from it
         try:
-            df = pd.read_csv(filepath, nrows=10, encoding='utf-8')
-        except UnicodeDecodeError:
-            df = pd.read_csv(filepath, nrows=10, encoding='utf-16')
-        return jsonify({'message': 'File uploaded and retraining started', 'columns': list(df.columns), 'rows': rows}), 200
+            schema = dataset_cache.ingest(filepath)
+        except Exception as e:
+            logger.error(f'Upload: could not parse {filepath}: {e}')
+            return jsonify({'error': f'Could not parse CSV: {e}'}), 400
+        queued, error = _submit_retrain(filepath)
+        if error:
+            return error
+        return jsonify({
+            **queued,
+            'message': 'File uploaded and retraining queued',
+            'columns': [col['name'] for col in schema['columns']],
+            'rows': schema['rows'],
+            'encoding': schema['encoding'],
+            # Numeric in the first rows but with text further down; stored as categorical
+            'retyped_columns': schema.get('retyped', []),
+            'schema': [{'name': col['name'], 'dtype': col['dtype'], **col['stats']} for col in schema['columns']],
+        }), 200
     else:
         return jsonify({'error': 'Only CSV files are supported for now.'}), 400
 
+def _explanation_payload(explain, vector, k, feature_list):
+    if explain == 'full':
+        return {'explanation': vector.tolist()}
+    if explain == 'topk':
+        return {'top_features': top_k(vector, feature_list, k)}
+    return {}
+
 @app.route('/predict', methods=['POST'])
 def predict():
+    """Score rows. ?explain=none (default)|topk|full controls SHAP output; ?k=N for topk."""
+    explain = request.args.get('explain', 'none')
+    if explain not in EXPLAIN_MODES:
+        return jsonify({'error': f'explain must be one of {", ".join(EXPLAIN_MODES)}'}), 400
+    k = request.args.get('k', DEFAULT_TOP_K, type=int)
     data = request.json.get('data', [])
     labels = request.json.get('labels', None)
     if not data:
         return jsonify({'error': 'No data provided'}), 400
-    X = pd.DataFrame(data)
-    X_enc = pd.get_dummies(X)
-    
-    # Fix DataFrame fragmentation by creating missing columns efficiently
-    missing_cols = set(FEATURE_LIST) - set(X_enc.columns)
-    if missing_cols:
-        # Create a DataFrame with missing columns filled with zeros
-        missing_df = pd.DataFrame(0, index=X_enc.index, columns=list(missing_cols))
-        # Concatenate efficiently
-        X_enc = pd.concat([X_enc, missing_df], axis=1)
-    
-    # Ensure correct column order
-    X_enc = X_enc.reindex(columns=FEATURE_LIST, fill_value=0)
-    
-    preds = MODEL.predict(X_enc)
-    shap_values = EXPLAINER.shap_values(X_enc)
-    explanations = [shap_values[np.argmax(np.bincount(preds))][i].tolist() for i in range(len(preds))]
+    bundle = BUNDLE
+    if bundle is None:
+        return jsonify({'error': 'No model loaded'}), 503
+    if not isinstance(data, list):
+        return jsonify({'error': 'data must be a list of rows'}), 400
+    clock = instrumentation.Stopwatch()
+    feature_list = bundle.feature_list
+    model_version = bundle.version
+    # Fitted at training time: same columns and order whichever categories this request has
+    try:
+        X_values = bundle.encoder.encode(data)
+    except TypeError as e:
+        return jsonify({'error': str(e)}), 400
+    clock.lap('predict.encode')
+    preds = SCORER.predict(bundle, X_values)
+    clock.lap('predict.score')
+    instrumentation.count('predict_rows', len(preds))
+    # Each row is explained for its own predicted class
+    class_index = {cls: n for n, cls in enumerate(bundle.classes)}
+    class_indices = [class_index[pred] for pred in preds]
+    if explain != 'none':
+        explanations = explain_rows(bundle.explainer, X_values, class_indices, model_version, EXPLANATION_CACHE)
+    else:
+        explanations = [None] * len(preds)
+    clock.lap('predict.explain')
+    row_labels = [labels[i] if labels and i < len(labels) else None for i in range(len(preds))]
+    # History, counts and the labelled confusion matrix are updated in one call
+    prediction_ids = STATE.record_predictions([(str(pred), label) for pred, label in zip(preds, row_labels)])
+    STATE.remember_rows([(prediction_id, model_version, X_values[i], class_indices[i])
+                         for i, prediction_id in enumerate(prediction_ids)])
+    clock.lap('predict.record')
     results = []
-    for i, (pred, explanation) in enumerate(zip(preds, explanations)):
-        label = labels[i] if labels and i < len(labels) else None
-        results.append({'prediction': str(pred), 'explanation': explanation, 'label': label})
-        PREDICTION_HISTORY.append({'prediction': str(pred), 'explanation': explanation, 'label': label})
-        # Update system state
-        SYSTEM_STATE['total_packets_analyzed'] += 1
+    for i, (pred, explanation, label, prediction_id) in enumerate(zip(preds, explanations, row_labels, prediction_ids)):
+        result = {'id': prediction_id, 'prediction': str(pred), 'label': label}
+        if explanation is not None:
+            result.update(_explanation_payload(explain, explanation, k, feature_list))
+        results.append(result)
         if str(pred) == 'Malicious':
-            SYSTEM_STATE['threats_detected'] += 1
-            SYSTEM_STATE['active_threats'].append({
+            STATE.add_threat({
                 'timestamp': datetime.now().isoformat(),
                 'prediction': str(pred),
                 'index': i
@@ -231,24 +356,54 @@ def predict():
             send_email('PDMS Alert: Malicious Threat Detected', f'A malicious threat was detected at row {i}.')
             play_alarm()
             auto_actions('Unknown', 'Unknown', i)
-    # Update metrics using sklearn if we have true labels
-    y_true = [r['label'] for r in PREDICTION_HISTORY if r['label'] is not None]
-    y_pred = [r['prediction'] for r in PREDICTION_HISTORY if r['label'] is not None]
-    if y_true and y_pred:
-        METRICS['accuracy'] = accuracy_score(y_true, y_pred)
-        METRICS['precision'] = precision_score(y_true, y_pred, average='macro', zero_division=0)
-        METRICS['recall'] = recall_score(y_true, y_pred, average='macro', zero_division=0)
-        METRICS['f1_score'] = f1_score(y_true, y_pred, average='macro', zero_division=0)
     return jsonify({'results': results})
 
+@app.route('/explain/<int:prediction_id>', methods=['GET'])
+def explain_prediction(prediction_id):
+    """SHAP explanation for one earlier prediction; ?explain=full (default)|topk, ?k=N."""
+    explain = request.args.get('explain', 'full')
+    if explain not in ('topk', 'full'):
+        return jsonify({'error': 'explain must be topk or full'}), 400
+    k = request.args.get('k', DEFAULT_TOP_K, type=int)
+    entry = STATE.explainable(prediction_id)
+    if entry is None:
+        return jsonify({'error': f'Prediction {prediction_id} is unknown or too old to explain'}), 404
+    model_version, row, class_index = entry
+    bundle = BUNDLE
+    if bundle is None or model_version != bundle.version:
+        return jsonify({'error': 'The model has been retrained since this prediction'}), 410
+    vector = EXPLANATION_CACHE.get(EXPLANATION_CACHE.key(model_version, row, class_index))
+    if vector is None:
+        vector = explain_rows(bundle.explainer, row.reshape(1, -1), [class_index], model_version, EXPLANATION_CACHE)[0]
+    response = {'id': prediction_id, 'model_version': model_version}
+    response.update(_explanation_payload(explain, vector, k, bundle.feature_list))
+    return jsonify(response)
+
 @app.route('/metrics', methods=['GET'])
 def metrics():
-    return jsonify(METRICS)
+    """Current model metrics; ?window=last_n|last_minutes for sliding-window metrics."""
+    window = request.args.get('window')
+    labelled = STATE.versions()['metrics']
+    if window is None:
+        return RESPONSES.respond('metrics', (labelled, _model_version()), _current_metrics)
+    if window not in STATE.windows:
+        return jsonify({'error': f'Unknown window {window!r}', 'windows': list(STATE.windows)}), 400
+    version = (labelled, time_bucket() if window == 'last_minutes' else None)
+    return RESPONSES.respond(f'metrics-{window}', version, lambda: STATE.metrics(window))
+
+def _current_metrics():
+    """Training metrics, replaced by live ones once labelled predictions have been seen."""
+    metrics = dict(METRICS)
+    live = STATE.metrics()
+    if live['samples']:
+        for key in ('accuracy', 'precision', 'recall', 'f1_score'):
+            metrics[key] = live[key]
+    return metrics
 
 @app.route('/history', methods=['GET'])
 def history():
     # Return the last 50 predictions
-    return jsonify({'history': PREDICTION_HISTORY[-50:]})
+    return RESPONSES.respond('history', STATE.versions()['history'], lambda: {'history': STATE.history(50)})
 
 @app.route('/retrain', methods=['POST'])
 def retrain():
@@ -261,67 +416,98 @@ def retrain():
         if not files:
             return jsonify({'error': 'No uploaded CSV found for retraining.'}), 400
         data_path = max(files, key=os.path.getctime)
-    threading.Thread(target=retrain_model_from_csv, args=(data_path,)).start()
-    return jsonify({'message': f'Retraining started on {data_path}. Model will reload automatically when done.'}), 200
+    if not os.path.exists(data_path):
+        return jsonify({'error': f'{data_path} not found'}), 400
+    options = {}
+    if data and data.get('mode'):
+        if data['mode'] not in chunked_training.TRAINING_MODES:
+            return jsonify({'error': f"mode must be one of {list(chunked_training.TRAINING_MODES)}"}), 400
+        options['mode'] = data['mode']
+    if data and data.get('sample_rows') is not None:
+        try:
+            options['sample_rows'] = int(data['sample_rows'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sample_rows must be an integer'}), 400
+        if options['sample_rows'] < 1:
+            return jsonify({'error': 'sample_rows must be positive'}), 400
+    queued, error = _submit_retrain(data_path, options)
+    if error:
+        return error
+    return jsonify({**queued, 'message': f'Retraining queued on {data_path}. Poll /jobs/{queued["job_id"]}; '
+                                         'the model is swapped in when the job succeeds.'}), 200
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """Recent retraining jobs, newest first."""
+    return jsonify({'jobs': [job.to_dict() for job in RETRAIN_JOBS.jobs()],
+                    'queued': RETRAIN_JOBS.queue_depth()})
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def job_status(job_id):
+    """State, progress and timing of one retraining job."""
+    job = RETRAIN_JOBS.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Saved model versions, newest first, and the one being served."""
+    bundle = BUNDLE
+    return jsonify({'active': bundle.version if bundle else None,
+                    'versions': model_store.describe(MODELS_DIR)})
+
+@app.route('/models/<int:version>/activate', methods=['POST'])
+def activate_model(version):
+    """Serve a previously trained version (rollback or roll forward)."""
+    try:
+        bundle = activate_model_version(version)
+    except KeyError as e:
+        return jsonify({'error': str(e.args[0])}), 404
+    return jsonify({'message': f'Model version {version} is now active', 'active': bundle.version,
+                    'metrics': bundle.metrics})
 
 @app.route('/predict_uploaded', methods=['POST'])
 def predict_uploaded():
-    print('predict_uploaded called')
+    """Score the first 1000 rows of the latest upload (see /predict_uploaded_stream for all rows)."""
     try:
         # Find the most recent CSV in uploads
-        files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
-        if not files:
-            print('No uploaded CSV found')
+        latest_file = _latest_upload()
+        if latest_file is None:
             return jsonify({'error': 'No uploaded CSV found'}), 400
-        latest_file = max(files, key=os.path.getctime)
-        df = pd.read_csv(latest_file)
-        print("CSV columns:", df.columns)
-        print("Model expects features:", FEATURE_LIST)
-        available_features = [col for col in FEATURE_LIST if col in df.columns]
-        print("Available features for prediction:", available_features)
+        bundle = BUNDLE
+        if bundle is None:
+            return jsonify({'error': 'No model loaded'}), 503
+        feature_list = bundle.feature_list
+        # Limit to 1000 rows for demo/performance
+        df = dataset_cache.read_frame(latest_file, columns=feature_list, nrows=1000)
+        available_features = [col for col in feature_list if col in df.columns]
         if not available_features:
-            print('No valid features found in uploaded file.')
             return jsonify({'error': 'No valid features found in uploaded file.'}), 400
         # Use only feature columns
         X = df[available_features]
-        # Limit to 1000 rows for demo/performance
-        X = X.head(1000)
-        print("X shape:", X.shape)
-        print("X columns:", X.columns)
-        print("First 5 rows of X:", X.head())
-        print("Before pd.get_dummies")
+        logger.debug(f'predict_uploaded: scoring {X.shape} from {latest_file}')
         X_enc = pd.get_dummies(X)
-        print("After pd.get_dummies, columns:", X_enc.columns)
 
         # Ensure all columns are numeric and fill NaN with 0
         X_enc = X_enc.apply(pd.to_numeric, errors='coerce')
         X_enc = X_enc.fillna(0)
-        print("After to_numeric and fillna, dtypes:", X_enc.dtypes)
 
         # Fix DataFrame fragmentation by creating missing columns efficiently
-        missing_cols = set(FEATURE_LIST) - set(X_enc.columns)
+        missing_cols = set(feature_list) - set(X_enc.columns)
         if missing_cols:
             missing_df = pd.DataFrame(0, index=X_enc.index, columns=list(missing_cols))
             X_enc = pd.concat([X_enc, missing_df], axis=1)
 
         # Ensure correct column order
-        X_enc = X_enc.reindex(columns=FEATURE_LIST, fill_value=0)
-        print("After reindex, dtypes:", X_enc.dtypes)
+        X_enc = X_enc.reindex(columns=feature_list, fill_value=0)
 
         # Force all data to float64
         X_enc = X_enc.astype(np.float64)
-        print("Final X_enc shape:", X_enc.shape, "dtypes:", X_enc.dtypes)
-
-        # Now try prediction
-        preds = MODEL.predict(X_enc)
-        print("After MODEL.predict")
-        # Temporarily skip SHAP explanations to isolate error
-        # shap_values = EXPLAINER.shap_values(X_enc)
-        # print("After EXPLAINER.shap_values")
-        # explanations = [shap_values[np.argmax(np.bincount(preds))][i].tolist() for i in range(len(preds))]
+
+        preds = SCORER.predict(bundle, X_enc)
         results = []
         for i, pred in enumerate(preds):
-            print(f'Prediction {i}: type={type(pred)}, value={pred}')
             result = {'prediction': str(pred)}
             if str(pred) == 'Malicious':
                 # Trigger backend actions automatically
@@ -329,7 +515,6 @@ def predict_uploaded():
                 auto_actions('Unknown', 'Unknown', i)
                 result['threat'] = True
             results.append(result)
-        print('predict_uploaded finished')
         return jsonify({'results': results, 'columns': list(X.columns)})
     except Exception as e:
         import traceback
@@ -340,20 +525,23 @@ def predict_uploaded():
 @app.route('/predict_uploaded_simple', methods=['POST'])
 def predict_uploaded_simple():
     try:
-        files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
-        if not files:
+        latest_file = _latest_upload()
+        if latest_file is None:
             return jsonify({'error': 'No uploaded CSV found'}), 400
-        latest_file = max(files, key=os.path.getctime)
-        df = pd.read_csv(latest_file)
-        # Only keep columns in FEATURE_LIST
-        X = df[[col for col in FEATURE_LIST if col in df.columns]].copy()
+        bundle = BUNDLE
+        if bundle is None:
+            return jsonify({'error': 'No model loaded'}), 503
+        feature_list = bundle.feature_list
+        # Only keep columns in the model's feature list
+        df = dataset_cache.read_frame(latest_file, columns=feature_list)
+        X = df[[col for col in feature_list if col in df.columns]].copy()
         # Convert to numeric, fill NaN
         X = X.apply(pd.to_numeric, errors='coerce').fillna(0)
         # Reindex to match model
-        X = X.reindex(columns=FEATURE_LIST, fill_value=0)
+        X = X.reindex(columns=feature_list, fill_value=0)
         # Force float64
         X = X.astype('float64')
-        preds = MODEL.predict(X)
+        preds = SCORER.predict(bundle, X)
         results = [{'prediction': str(pred)} for pred in preds]
         return jsonify({'results': results, 'columns': list(X.columns)})
     except Exception as e:
@@ -362,6 +550,100 @@ def predict_uploaded_simple():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+def _latest_upload():
+    """Path of the most recently uploaded CSV, or None."""
+    files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
+    return max(files, key=os.path.getctime) if files else None
+
+def _encode_numeric_chunk(chunk, feature_list):
+    """Same encoding as /predict_uploaded_simple: known numeric columns, NaN -> 0."""
+    X = chunk[[col for col in feature_list if col in chunk.columns]]
+    X = X.apply(pd.to_numeric, errors='coerce').fillna(0)
+    return X.reindex(columns=feature_list, fill_value=0).to_numpy(dtype=np.float64)
+
+STREAM_CHUNK_ROWS = 50000
+MAX_SUMMARY_INDICES = 100000
+
+@app.route('/predict_uploaded_stream', methods=['POST'])
+def predict_uploaded_stream():
+    """Score every row of an upload in fixed-size chunks, streaming the results.
+
+    ?format=ndjson (default) streams one {"row", "prediction"} object per
+    line, then a final {"summary": ...} line. ?format=summary returns just
+    the counts and the indices of malicious rows. ?chunksize=N sets the
+    rows read per chunk and ?filename= picks an upload other than the
+    latest. Memory stays bounded by the chunk size, not the file size.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'summary'):
+        return jsonify({'error': 'format must be ndjson or summary'}), 400
+    chunksize = max(1, request.args.get('chunksize', STREAM_CHUNK_ROWS, type=int))
+    filename = request.args.get('filename')
+    path = os.path.join(UPLOAD_FOLDER, secure_filename(filename)) if filename else _latest_upload()
+    if path is None or not os.path.exists(path):
+        return jsonify({'error': 'No uploaded CSV found'}), 400
+    bundle = BUNDLE
+    if bundle is None:
+        return jsonify({'error': 'No model loaded'}), 503
+    # Pin the bundle so a retrain mid-stream cannot mix models
+    feature_list = bundle.feature_list
+
+    def score_chunks():
+        row = 0
+        for chunk in dataset_cache.iter_frames(path, chunksize=chunksize, columns=feature_list):
+            preds = SCORER.predict(bundle, _encode_numeric_chunk(chunk, feature_list))
+            yield row, preds
+            row += len(preds)
+
+    def summarize(counts, rows, malicious_rows, started):
+        return {
+            'file': os.path.basename(path),
+            'rows': rows,
+            'counts': dict(counts),
+            'malicious_rows': malicious_rows,
+            'malicious_rows_truncated': counts.get('Malicious', 0) > len(malicious_rows),
+            'seconds': round(time.time() - started, 3),
+        }
+
+    def collect(counts, malicious_rows, start, preds):
+        labels = preds.astype(str)
+        values, n = np.unique(labels, return_counts=True)
+        for value, count in zip(values, n):
+            counts[value] += int(count)
+        if len(malicious_rows) < MAX_SUMMARY_INDICES:
+            hits = (np.flatnonzero(labels == 'Malicious') + start).tolist()
+            malicious_rows.extend(hits[:MAX_SUMMARY_INDICES - len(malicious_rows)])
+        return labels
+
+    if fmt == 'summary':
+        started = time.time()
+        counts, malicious_rows, rows = Counter(), [], 0
+        try:
+            for start, preds in score_chunks():
+                collect(counts, malicious_rows, start, preds)
+                rows = start + len(preds)
+        except Exception as e:
+            logger.error(f'predict_uploaded_stream error: {e}')
+            return jsonify({'error': str(e)}), 500
+        return jsonify(summarize(counts, rows, malicious_rows, started))
+
+    def generate():
+        started = time.time()
+        counts, malicious_rows, rows = Counter(), [], 0
+        try:
+            for start, preds in score_chunks():
+                labels = collect(counts, malicious_rows, start, preds)
+                rows = start + len(preds)
+                yield ''.join(json.dumps({'row': start + i, 'prediction': label}) + '\n'
+                              for i, label in enumerate(labels.tolist()))
+        except Exception as e:
+            logger.error(f'predict_uploaded_stream error: {e}')
+            yield json.dumps({'error': str(e)}) + '\n'
+            return
+        yield json.dumps({'summary': summarize(counts, rows, malicious_rows, started)}) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/block', methods=['POST'])
 def block():
     data = request.get_json()
@@ -395,45 +677,59 @@ def trace():
 
 @app.route('/live-predictions', methods=['GET'])
 def live_predictions_api():
-    with lock:
-        # Return the last 100 predictions
-        data = list(live_predictions)[-100:]
-    return jsonify({'live_predictions': data})
+    """Live predictions, incrementally: ?since=<seq>&limit=N returns only newer entries.
+
+    Without `since` the last `limit` (default 100) predictions are returned.
+    Pass the returned `next` cursor as `since` on the following poll.
+    """
+    since = request.args.get('since', type=int)
+    limit = min(request.args.get('limit', 100, type=int), live_predictions.capacity)
+    data, next_seq, dropped = live_predictions.snapshot(since=since, limit=limit)
+    return jsonify({'live_predictions': data, 'next': next_seq, 'dropped': dropped})
 
 @app.route('/forensic-log', methods=['GET'])
 def forensic_log():
-    log_path = 'forensic_log.csv'
-    if not os.path.exists(log_path):
-        return jsonify({'log': []})
-    rows = []
-    with open(log_path, 'r', newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
-    # Return the last 100 entries
-    return jsonify({'log': rows[-100:]})
+    """Forensic log entries: the last `limit` rows, or a from/to/src query.
+
+    `from` and `to` are inclusive 'YYYY-MM-DD HH:MM:SS' timestamps (a 'T'
+    separator is accepted too); `src` filters on source IP. Queries use the
+    segment indexes to seek to matching blocks instead of scanning history.
+    """
+    limit = min(request.args.get('limit', 100, type=int), 10000)
+    start = request.args.get('from')
+    end = request.args.get('to')
+    src = request.args.get('src')
+    if start is None and end is None and src is None:
+        return jsonify({'log': forensic_store.tail(FORENSIC_LOG_DIR, limit)})
+    start = start.replace('T', ' ') if start else None
+    end = end.replace('T', ' ') if end else None
+    rows = forensic_store.query(FORENSIC_LOG_DIR, start=start, end=end, src=src, limit=limit)
+    return jsonify({'log': rows})
 
 @app.route('/threat-analysis', methods=['GET'])
 def threat_analysis():
     """Comprehensive threat analysis and statistics."""
-    # Analyze recent predictions for threat patterns
-    recent_predictions = PREDICTION_HISTORY[-1000:] if len(PREDICTION_HISTORY) > 1000 else PREDICTION_HISTORY
+    return jsonify(_threat_analysis_payload())
+
+def _threat_analysis_payload():
+    # Last 1000 predictions and last THREAT_WINDOW_MINUTES, from running counters
+    stats = STATE.prediction_stats()
     
     threat_stats = {
-        'total_analyzed': len(recent_predictions),
-        'malicious_count': sum(1 for p in recent_predictions if p.get('prediction') == 'Malicious'),
-        'benign_count': sum(1 for p in recent_predictions if p.get('prediction') == 'Benign'),
-        'threat_rate': 0,
+        'total_analyzed': stats['recent_total'],
+        'malicious_count': stats['recent_positive'],
+        'benign_count': stats['recent_counts'].get('Benign', 0),
+        'threat_rate': stats['recent_rate'],
+        'window_minutes': THREAT_WINDOW_MINUTES,
+        'window_analyzed': stats['window_total'],
+        'window_malicious_count': stats['window_positive'],
+        'window_threat_rate': stats['window_rate'],
         'top_threat_sources': [],
         'threat_timeline': []
     }
     
-    if threat_stats['total_analyzed'] > 0:
-        threat_stats['threat_rate'] = round(threat_stats['malicious_count'] / threat_stats['total_analyzed'] * 100, 2)
-    
     # Extract source IPs from live predictions for threat source analysis
-    with lock:
-        live_data = list(live_predictions)[-500:]  # Last 500 live predictions
+    live_data = live_predictions.latest(500)  # Last 500 live predictions
     
     if live_data:
         src_ips = [p.get('src', 'Unknown') for p in live_data if p.get('prediction') == 'Malicious']
@@ -441,19 +737,19 @@ def threat_analysis():
             ip_counts = Counter(src_ips)
             threat_stats['top_threat_sources'] = [{'ip': ip, 'count': count} for ip, count in ip_counts.most_common(10)]
     
-    return jsonify(threat_stats)
+    return threat_stats
 
 @app.route('/alerts', methods=['GET'])
 def get_threat_alerts():
     """Get current threat alerts."""
-    alerts = get_alerts()
+    alerts = alert_log.alerts()
     return jsonify({'alerts': alerts})
 
 @app.route('/alert-stats', methods=['GET'])
 def get_alert_statistics():
     """Get alert statistics."""
-    stats = get_alert_stats()
-    return jsonify(stats)
+    version = (alert_log.version(), time_bucket())
+    return RESPONSES.respond('alert-stats', version, alert_log.stats)
 
 @app.route('/test-alert', methods=['POST'])
 def test_alert_system():
@@ -467,6 +763,8 @@ def test_alert_system():
     })
     
     alert = process_threat(threat_data)
+    if alert:
+        alert_log.record(alert)
     return jsonify({
         'alert_triggered': alert is not None,
         'alert': alert,
@@ -474,24 +772,182 @@ def test_alert_system():
     })
 
 @app.route('/model-comparison', methods=['GET'])
-def model_comparison():
-    """Compare different ML models for IDS performance."""
-    # This would typically compare multiple models, but for now return current model info
-    return jsonify({
-        'current_model': {
-            'type': 'Random Forest',
-            'n_estimators': 20,
-            'performance': METRICS,
-            'features_used': len(FEATURE_LIST),
-            'last_trained': datetime.now().isoformat()
-        },
-        'available_models': ['Random Forest', 'Decision Tree', 'SVM', 'Neural Network'],
-        'recommendations': [
-            'Random Forest shows best balance of accuracy and interpretability',
-            'Consider ensemble methods for improved robustness',
-            'Deep learning models may provide better feature learning'
-        ]
-    })
+def model_comparison_report():
+    """The served model and the latest candidate benchmark (POST to run a new one)."""
+    jobs = COMPARISON_JOBS.jobs()[:5]
+    version = (_model_version(), STATE.versions()['metrics'], model_comparison.stamp(MODELS_DIR),
+               tuple((job.id, job.state, job.stage, job.progress, job.merged) for job in jobs),
+               # Queued/running jobs report elapsed times
+               time_bucket() if any(job.finished is None for job in jobs) else None)
+    return RESPONSES.respond('model-comparison', version, lambda: _model_comparison_payload(jobs))
+
+def _model_comparison_payload(jobs):
+    bundle = BUNDLE
+    current = None
+    if bundle is not None:
+        version_info = next((v for v in model_store.describe(MODELS_DIR) if v['version'] == bundle.version), {})
+        params = bundle.model.get_params() if hasattr(bundle.model, 'get_params') else {}
+        current = {
+            'type': type(bundle.model).__name__,
+            'n_estimators': params.get('n_estimators'),
+            'performance': _current_metrics(),
+            'version': bundle.version,
+            'features_used': len(bundle.feature_list),
+            'last_trained': datetime.fromtimestamp(version_info['created']).isoformat()
+                            if version_info.get('created') else None,
+            'training': version_info.get('training'),
+        }
+    comparison = model_comparison.latest(MODELS_DIR)
+    return {
+        'current_model': current,
+        'available_models': list(model_comparison.CANDIDATES),
+        'comparison': comparison,
+        'recommendations': comparison['recommendations'] if comparison else [],
+        'jobs': [job.to_dict() for job in jobs],
+    }
+
+@app.route('/model-comparison', methods=['POST'])
+def start_model_comparison():
+    """Queue a benchmark of the candidate models on an uploaded CSV (default: the newest)."""
+    data = request.get_json(silent=True) or {}
+    if data.get('filename'):
+        data_path = os.path.join(UPLOAD_FOLDER, secure_filename(data['filename']))
+    else:
+        files = glob.glob(os.path.join(UPLOAD_FOLDER, '*.csv'))
+        if not files:
+            return jsonify({'error': 'No uploaded CSV to compare models on.'}), 400
+        data_path = max(files, key=os.path.getctime)
+    if not os.path.exists(data_path):
+        return jsonify({'error': f'{data_path} not found'}), 400
+    options = {}
+    if data.get('candidates'):
+        unknown = set(data['candidates']) - set(model_comparison.CANDIDATES)
+        if unknown:
+            return jsonify({'error': f'Unknown candidates: {sorted(unknown)}',
+                            'available_models': list(model_comparison.CANDIDATES)}), 400
+        options['candidates'] = tuple(data['candidates'])
+    if data.get('sample_rows') is not None:
+        try:
+            options['sample_rows'] = max(1, int(data['sample_rows']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sample_rows must be an integer'}), 400
+    try:
+        job, merged = COMPARISON_JOBS.submit(data_path, options)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify({'job_id': job.id, 'job': job.to_dict(), 'merged': merged,
+                    'message': 'Model comparison queued. GET /model-comparison for results.'}), 202
+
+# Push channel for the dashboards; see event_stream
+STREAM = EventHub()
+STREAM.add(LogTopic('history', STATE.history_since, lambda entry: entry['id'], backlog=50))
+STREAM.add(LogTopic('live', lambda since, limit: live_predictions.snapshot(since=since, limit=limit)[:2],
+                    lambda entry: entry['seq'], backlog=100))
+STREAM.add(SnapshotTopic('metrics', _current_metrics, interval=1.0))
+STREAM.add(SnapshotTopic('status', _system_status_payload, interval=5.0))
+STREAM.add(SnapshotTopic('threats', _threat_analysis_payload, interval=2.0))
+STREAM.add(SnapshotTopic('alerts', lambda: {'alerts': alert_log.alerts(), 'stats': alert_log.stats()}, interval=2.0))
+STREAM.add(SnapshotTopic('forensic', lambda: {'log': forensic_store.tail(FORENSIC_LOG_DIR, 100)}, interval=2.0))
+
+@app.route('/stream', methods=['GET'])
+def event_stream_api():
+    """Server-sent events. ?topics=history,live,... (default: all), ?max_rate=N flushes per second.
+
+    Log topics ('history', 'live') send {"items": [...], "dropped": n, "gap": bool};
+    the others send the same payload as their REST endpoint whenever it changes.
+    Reconnects resume from the Last-Event-ID header (or ?last_event_id=).
+    """
+    topics = [t.strip() for t in request.args.get('topics', ','.join(STREAM.topics)).split(',') if t.strip()]
+    max_rate = min(request.args.get('max_rate', STREAM_MAX_RATE, type=float), STREAM_MAX_RATE)
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        events = STREAM.stream(topics, last_event_id=last_event_id, max_rate=max_rate)
+    except KeyError as e:
+        return jsonify({'error': f'Unknown topic {e.args[0]!r}', 'topics': list(STREAM.topics)}), 400
+    except TooManyClients as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '5'}
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+instrumentation.gauge('retrain_queue', RETRAIN_JOBS.queue_depth)
+instrumentation.gauge('comparison_queue', COMPARISON_JOBS.queue_depth)
+instrumentation.gauge('stream_clients', lambda: STREAM.clients)
+
+@app.route('/telemetry', methods=['GET'])
+def telemetry():
+    """Stage latencies, rates, lock waits, queue depths and CPU/RSS of every process.
+
+    Prometheus text format by default; ?format=json for the raw snapshots and summary.
+    """
+    snapshots = instrumentation.collect()
+    if request.args.get('format') == 'json':
+        return jsonify({'summary': instrumentation.summary(snapshots), 'health': instrumentation.health(snapshots),
+                        'snapshots': snapshots})
+    return Response(instrumentation.prometheus(snapshots), mimetype='text/plain; version=0.0.4')
+
+def _admin_denied():
+    if ADMIN_TOKEN:
+        if request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+            return jsonify({'error': 'Admin token required'}), 403
+    elif request.remote_addr not in LOOPBACK_ADDRESSES:
+        return jsonify({'error': 'Admin endpoints are local-only unless IDS_ADMIN_TOKEN is set'}), 403
+    return None
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_status():
+    """The running profiling session, the last one and the saved reports."""
+    return _admin_denied() or jsonify(PROFILER.status())
+
+@app.route('/admin/profile', methods=['POST'])
+def start_profile():
+    """Profile for a bounded window: {"mode": "sampler"|"cprofile", "seconds", "fraction", "interval_ms"}.
+
+    Only this process is profiled: under serve.py, the one API worker
+    that received the POST, not the other workers or the capture process
+    (profile capture with `kill -USR1 <capture pid>`). 'sampler' samples
+    the stacks of all this process's threads, which include the capture
+    loop only under the single-process dev server; 'cprofile' profiles
+    `fraction` of this worker's API requests.
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    try:
+        session = PROFILER.start(mode=data.get('mode', 'sampler'), seconds=float(data.get('seconds', 30)),
+                                 fraction=float(data.get('fraction', 0.1)),
+                                 interval=float(data.get('interval_ms', profiling.DEFAULT_INTERVAL * 1000)) / 1000)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except profiling.ProfileBusy as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'session': session.to_dict(),
+                    'message': 'Profiling started. Reports are listed by GET /admin/profile when it ends.'}), 202
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def stop_profile():
+    """End the running session early and write its reports."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    session = PROFILER.stop()
+    if session is None:
+        return jsonify({'error': 'No profiling session is running'}), 409
+    return jsonify({'session': session.to_dict(), 'reports': PROFILER.reports()[:1]})
+
+@app.route('/admin/profile/<session_id>/<filename>', methods=['GET'])
+def download_profile(session_id, filename):
+    """Download a report file (top.txt, collapsed.txt, profile.pstats, session.json)."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if filename not in profiling.REPORT_FILES:
+        return jsonify({'error': f'Unknown report file {filename!r}', 'files': list(profiling.REPORT_FILES)}), 404
+    directory = os.path.abspath(os.path.join(PROFILER.directory, secure_filename(session_id)))
+    if not os.path.exists(os.path.join(directory, filename)):
+        return jsonify({'error': 'Report not found'}), 404
+    return send_from_directory(directory, filename, as_attachment=True,
+                               download_name=f'{secure_filename(session_id)}-{filename}')
 
 @app.route('/favicon.ico')
 def favicon():
@@ -517,20 +973,34 @@ def play_alarm():
 # Helper: Auto block/report/trace
 def auto_actions(src_ip, protocol, row):
     # Block
-    SYSTEM_STATE['active_threats'].append({'timestamp': datetime.now().isoformat(), 'prediction': 'Malicious', 'index': row, 'src_ip': src_ip})
+    STATE.add_threat({'timestamp': datetime.now().isoformat(), 'prediction': 'Malicious', 'index': row, 'src_ip': src_ip})
     # Simulate block/report/trace
     logger.info(f'Auto-blocked {src_ip} protocol {protocol} row {row}')
     # You can expand this to call real block/report/trace endpoints if needed
 
+@app.before_request
+def start_timer():
+    PROFILER.before_request()
+    g.request_started = time.perf_counter()
+
+@app.teardown_request
+def finish_profile(exc):
+    PROFILER.after_request()
+
 @app.after_request
 def after_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        instrumentation.observe(f"http.{request.endpoint or 'unmatched'}", time.perf_counter() - started)
+        instrumentation.count('http_requests')
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
 if __name__ == '__main__':
+    from live_packet_capture import capture_loop
     # Start live packet capture in a background thread
-    t = threading.Thread(target=capture_loop, daemon=True)
+    t = threading.Thread(target=capture_loop, name='capture-loop', daemon=True)
     t.start()
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
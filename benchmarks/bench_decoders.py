@@ -0,0 +1,84 @@
+"""Side-by-side benchmark of the packet decoder backends on one pcap.
+
+Usage: python benchmarks/bench_decoders.py trace.pcap [--repeat 3]
+
+Times the built-in header decoder against pyshark/tshark on the same file
+and checks that both report the same addresses, protocol, ports and length
+for every packet.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from packet_decoder import decode_pyshark, iter_pcap_packets
+
+try:
+    import pyshark
+except ImportError:
+    pyshark = None
+
+
+def builtin_packets(path):
+    return list(iter_pcap_packets(path))
+
+
+def pyshark_packets(path):
+    capture = pyshark.FileCapture(path, keep_packets=False)
+    try:
+        return [decode_pyshark(packet) for packet in capture]
+    finally:
+        capture.close()
+
+
+BACKENDS = {'builtin': builtin_packets, 'pyshark': pyshark_packets}
+
+
+def summary_key(packet):
+    if packet is None:
+        return None
+    return (packet.src, packet.dst, packet.transport_layer, packet.sport, packet.dport, packet.length)
+
+
+def run(path, repeat=3):
+    results = {}
+    decoded = {}
+    for name, fn in BACKENDS.items():
+        if name == 'pyshark' and pyshark is None:
+            print(f"{name:>8}: skipped (pyshark not installed)")
+            continue
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            packets = fn(path)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        decoded[name] = packets
+        results[name] = {
+            'packets': len(packets),
+            'seconds': round(best, 4),
+            'packets_per_s': round(len(packets) / best, 1) if best else 0,
+            'us_per_packet': round(best * 1e6 / max(len(packets), 1), 2),
+        }
+        print(f"{name:>8}: {len(packets)} packets in {best:.4f} s "
+              f"({results[name]['packets_per_s']:.0f} packets/s, {results[name]['us_per_packet']} us/packet)")
+
+    if len(decoded) == 2:
+        builtin, shark = decoded['builtin'], decoded['pyshark']
+        mismatches = sum(1 for a, b in zip(builtin, shark) if summary_key(a) != summary_key(b))
+        mismatches += abs(len(builtin) - len(shark))
+        speedup = results['pyshark']['seconds'] / results['builtin']['seconds']
+        print(f"builtin is {speedup:.1f}x faster; {mismatches} packets decoded differently")
+        results['speedup'] = round(speedup, 2)
+        results['mismatches'] = mismatches
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('pcap')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per backend; the best is reported')
+    args = parser.parse_args()
+    run(args.pcap, args.repeat)
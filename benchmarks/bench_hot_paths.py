@@ -0,0 +1,297 @@
+"""Hot-path benchmark suite on synthetic NSL-KDD data, compared against a baseline.
+
+Usage: python benchmarks/bench_hot_paths.py [--quick] [--output results.json]
+                                             [--baseline benchmarks/baseline.json]
+                                             [--save-baseline] [--tolerance 0.25]
+
+Runs fully offline in a scratch directory: it writes a synthetic
+NSL-KDD-shaped CSV, trains a model on it the way /retrain does, then
+times the capture path (extract_features, predict_packet, predict_batch,
+log_forensic) on synthetic packets and the API endpoints (/predict with
+and without SHAP, /predict_uploaded_simple, /history, /system-status)
+through the Flask test client, at several batch sizes and history
+lengths. Results are written as JSON. With a baseline file, every case
+whose p50 is slower than the baseline by more than --tolerance is
+reported and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+KDD_NUMERIC = [
+    'duration', 'src_bytes', 'dst_bytes', 'land', 'wrong_fragment', 'urgent', 'hot',
+    'num_failed_logins', 'logged_in', 'num_compromised', 'root_shell', 'su_attempted', 'num_root',
+    'num_file_creations', 'num_shells', 'num_access_files', 'num_outbound_cmds', 'is_host_login',
+    'is_guest_login', 'count', 'srv_count', 'serror_rate', 'srv_serror_rate', 'rerror_rate',
+    'srv_rerror_rate', 'same_srv_rate', 'diff_srv_rate', 'srv_diff_host_rate', 'dst_host_count',
+    'dst_host_srv_count', 'dst_host_same_srv_rate', 'dst_host_diff_srv_rate',
+    'dst_host_same_src_port_rate', 'dst_host_srv_diff_host_rate', 'dst_host_serror_rate',
+    'dst_host_srv_serror_rate', 'dst_host_rerror_rate', 'dst_host_srv_rerror_rate',
+]
+PROTOCOLS = ['tcp', 'udp', 'icmp']
+SERVICES = ['http', 'private', 'domain_u', 'smtp', 'ftp_data', 'ecr_i', 'other', 'telnet', 'eco_i', 'ftp']
+FLAGS = ['SF', 'S0', 'REJ', 'RSTO', 'RSTR', 'SH', 'S1']
+
+BATCH_SIZES = [1, 10, 100, 1000]
+SHAP_BATCH_SIZES = [1, 10, 100]
+UPLOAD_ROWS = [1000, 10000]
+HISTORY_LENGTHS = [50, 500, 1000]
+
+
+def synthetic_kdd(rows, seed=0):
+    """A DataFrame with the NSL-KDD columns and a Benign/Malicious Label.
+
+    Malicious rows lean towards the patterns of floods and scans (S0/REJ
+    flags, high counts and error rates) so a model has something to learn.
+    """
+    rng = np.random.RandomState(seed)
+    malicious = rng.rand(rows) < 0.45
+    data = {}
+    for name in KDD_NUMERIC:
+        if name.endswith('_rate'):
+            base = rng.beta(0.5, 4, rows)
+            data[name] = np.round(np.where(malicious, 1 - base * 0.5 if 'error' in name else base, base), 2)
+        elif name in ('count', 'srv_count', 'dst_host_count', 'dst_host_srv_count'):
+            data[name] = np.where(malicious, rng.randint(50, 512, rows), rng.randint(1, 60, rows))
+        elif name in ('src_bytes', 'dst_bytes'):
+            data[name] = np.where(malicious, rng.randint(0, 100, rows), rng.lognormal(6, 2, rows).astype(np.int64))
+        elif name == 'duration':
+            data[name] = np.where(rng.rand(rows) < 0.9, 0, rng.randint(1, 5000, rows))
+        else:
+            data[name] = (rng.rand(rows) < 0.02).astype(np.int64)
+    frame = pd.DataFrame(data)
+    frame.insert(1, 'protocol_type', np.array(PROTOCOLS)[rng.choice(3, rows, p=[0.8, 0.12, 0.08])])
+    frame.insert(2, 'service', np.array(SERVICES)[rng.randint(0, len(SERVICES), rows)])
+    frame.insert(3, 'flag', np.where(malicious, np.array(FLAGS)[rng.randint(0, 3, rows)],
+                                     np.array(FLAGS)[rng.choice(len(FLAGS), rows, p=[0.9, 0.02, 0.02, 0.02, 0.02, 0.01, 0.01])]))
+    frame['Label'] = np.where(malicious, 'Malicious', 'Benign')
+    return frame
+
+
+def synthetic_packets(count, seed=0):
+    """DecodedPackets from a few hundred hosts, 1 ms apart."""
+    from packet_decoder import DecodedPacket
+    rng = np.random.RandomState(seed)
+    protos = np.array(['TCP', 'UDP', 'ICMP'])[rng.choice(3, count, p=[0.8, 0.15, 0.05])]
+    ports = np.array([80, 443, 53, 22, 25, 8080])
+    packets = []
+    for i in range(count):
+        proto = protos[i]
+        packets.append(DecodedPacket(
+            timestamp=1700000000.0 + i / 1000.0,
+            length=int(rng.randint(40, 1500)),
+            src=f'10.0.{rng.randint(0, 4)}.{rng.randint(1, 255)}',
+            dst=f'192.168.1.{rng.randint(1, 32)}',
+            transport_layer=proto,
+            sport=int(rng.randint(1024, 65535)) if proto != 'ICMP' else 0,
+            dport=int(ports[rng.randint(0, len(ports))]) if proto != 'ICMP' else 0,
+            tcp_flags=int(rng.choice([0x02, 0x10, 0x18, 0x11, 0x04])) if proto == 'TCP' else 0,
+            icmp_type=8 if proto == 'ICMP' else None,
+        ))
+    return packets
+
+
+def summarize(samples, rows=1):
+    """Latency stats in microseconds for a list of per-call seconds."""
+    samples = np.asarray(samples) * 1e6
+    p50 = float(np.percentile(samples, 50))
+    return {'calls': len(samples), 'rows': rows,
+            'p50_us': round(p50, 1), 'p99_us': round(float(np.percentile(samples, 99)), 1),
+            'mean_us': round(float(samples.mean()), 1),
+            'rows_per_s': round(rows / (p50 / 1e6), 1) if p50 else None}
+
+
+def time_calls(fn, repeat, rows=1, warmup=2):
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        fn(warmup + i)
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples, rows)
+
+
+class Suite:
+    def __init__(self, quick=False, train_rows=20000):
+        self.quick = quick
+        self.train_rows = train_rows
+        self.results = {}
+
+    def repeat(self, full):
+        return max(5, full // 10) if self.quick else full
+
+    def record(self, name, stats):
+        self.results[name] = stats
+        print(f"{name:<44} p50 {stats['p50_us']:>11.1f} us  p99 {stats['p99_us']:>11.1f} us  "
+              f"({stats['calls']} calls x {stats['rows']} rows)")
+
+    def setup(self):
+        # Must be set before app / live_packet_capture are imported
+        os.environ.setdefault('IDS_STATE_BACKEND', 'memory')
+        os.environ.setdefault('IDS_SCORING_WORKERS', '1')
+        self.workdir = tempfile.mkdtemp(prefix='ids-bench-')
+        os.chdir(self.workdir)
+        os.makedirs('uploads')
+        self.rows = synthetic_kdd(max(self.train_rows, max(UPLOAD_ROWS)), seed=1)
+        self.rows.iloc[:self.train_rows].to_csv(os.path.join('uploads', 'train.csv'), index=False)
+
+        import app
+        import live_packet_capture
+        self.app, self.capture = app, live_packet_capture
+        self.client = app.app.test_client()
+        t0 = time.perf_counter()
+        app.retrain_model_from_csv(os.path.join('uploads', 'train.csv'))
+        live_packet_capture.init()
+        live_packet_capture.REGISTRY.refresh()
+        print(f'Trained on {self.train_rows} synthetic rows in {time.perf_counter() - t0:.1f} s')
+
+    def bench_capture(self):
+        capture = self.capture
+        packets = synthetic_packets(self.repeat(5000) + 2, seed=2)
+        self.record('capture.extract_features', time_calls(lambda i: capture.extract_features(packets[i]),
+                                                          len(packets) - 2))
+        features = [capture.extract_features(packet) for packet in packets]
+        self.record('capture.predict_packet', time_calls(lambda i: capture.predict_packet(features[i % len(features)]),
+                                                        self.repeat(2000)))
+        for size in BATCH_SIZES:
+            batch = [features[j % len(features)] for j in range(size)]
+            self.record(f'capture.predict_batch[{size}]',
+                        time_calls(lambda i: capture.predict_batch(batch), self.repeat(200 if size < 1000 else 50), size))
+        results = [capture.make_result(f, 'Malicious') for f in features]
+        self.record('capture.log_forensic', time_calls(lambda i: capture.log_forensic(results[i % len(results)]),
+                                                      self.repeat(5000)))
+        capture.FORENSIC_WRITER.close()
+
+    def _payload(self, start, size):
+        frame = self.rows.iloc[start % (len(self.rows) - size):][:size].drop(columns=['Label'])
+        return {'data': frame.to_dict(orient='records')}
+
+    def bench_predict(self):
+        for explain, sizes, repeat in (('none', BATCH_SIZES, 100), ('full', SHAP_BATCH_SIZES, 20)):
+            for size in sizes:
+                # Fresh rows per call so explanations are never served from the cache
+                payloads = [self._payload(i * size, size) for i in range(self.repeat(repeat) + 2)]
+
+                def call(i, payloads=payloads, explain=explain):
+                    response = self.client.post(f'/predict?explain={explain}', json=payloads[i])
+                    assert response.status_code == 200, response.get_data(as_text=True)
+
+                self.record(f'api.predict[explain={explain},rows={size}]', time_calls(call, len(payloads) - 2, size))
+
+    def bench_uploaded(self):
+        for size in UPLOAD_ROWS:
+            path = os.path.join('uploads', f'upload_{size}.csv')
+            self.rows.iloc[:size].drop(columns=['Label']).to_csv(path, index=False)
+            os.utime(path)  # Newest upload is the one scored
+
+            def call(i):
+                response = self.client.post('/predict_uploaded_simple')
+                assert response.status_code == 200, response.get_data(as_text=True)
+
+            self.record(f'api.predict_uploaded_simple[rows={size}]', time_calls(call, self.repeat(30), size))
+
+    def bench_state(self):
+        state = self.app.STATE
+        recorded = len(state.history(max(HISTORY_LENGTHS)))
+        for length in HISTORY_LENGTHS:
+            if length > recorded:
+                state.record_predictions([('Malicious' if j % 3 else 'Benign', None) for j in range(length - recorded)])
+                recorded = length
+            for endpoint in ('/history', '/system-status'):
+                def call(i, endpoint=endpoint):
+                    response = self.client.get(endpoint)
+                    assert response.status_code == 200, response.get_data(as_text=True)
+
+                self.record(f'api.{endpoint.strip("/")}[history={length}]', time_calls(call, self.repeat(300)))
+
+    def run(self, cases):
+        self.setup()
+        try:
+            for case in cases:
+                getattr(self, f'bench_{case}')()
+        finally:
+            os.chdir(ROOT)
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        return self.results
+
+
+CASES = ['capture', 'predict', 'uploaded', 'state']
+
+
+def environment():
+    import sklearn
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'sklearn': sklearn.__version__, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, tolerance):
+    """Cases whose p50 regressed by more than `tolerance` (fraction) against `baseline`."""
+    regressions = []
+    print(f"\n{'case':<44} {'baseline p50':>14} {'now p50':>12} {'change':>8}")
+    for name, stats in results.items():
+        old = baseline.get(name)
+        if old is None:
+            print(f'{name:<44} {"(new)":>14} {stats["p50_us"]:>12.1f}')
+            continue
+        change = stats['p50_us'] / old['p50_us'] - 1 if old['p50_us'] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f'{name:<44} {old["p50_us"]:>14.1f} {stats["p50_us"]:>12.1f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help='Fewer repetitions (smoke run)')
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--train-rows', type=int, default=20000)
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results', 'hot_paths.json'))
+    parser.add_argument('--baseline', default=os.path.join(ROOT, 'benchmarks', 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p50 slowdown before failing')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+
+    results = Suite(quick=args.quick, train_rows=args.train_rows).run(args.cases)
+    report = {'environment': environment(), 'quick': args.quick, 'results': results}
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.save_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline saved to {baseline_path}')
+        return 0
+    if not os.path.exists(baseline_path):
+        print(f'No baseline at {baseline_path}; run with --save-baseline to create one')
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if regressions:
+        print(f'\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}')
+        return 1
+    print('\nNo regressions against the baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Single-row and batch latency of sklearn predict vs the array forest engine.
+
+Usage: python benchmarks/bench_inference.py [--models models] [--rows 20000] [--repeat 2000]
+
+Uses the current model version under --models when there is one, otherwise
+trains the same 20-tree RandomForest as retrain_model_from_csv on random
+data. Checks that both engines agree on every row before timing.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forest_arrays
+import model_store
+
+
+def synthetic_model(n_features, rows, seed=0):
+    from sklearn.ensemble import RandomForestClassifier
+    rng = np.random.RandomState(seed)
+    X = rng.rand(rows, n_features) * 100
+    y = np.where(X[:, 0] + rng.rand(rows) * 50 > X[:, 1], 'Malicious', 'Benign')
+    return RandomForestClassifier(n_estimators=20, random_state=seed).fit(X, y)
+
+
+def percentiles(samples):
+    samples = np.sort(np.asarray(samples)) * 1e6
+    return {'p50_us': round(float(np.percentile(samples, 50)), 1),
+            'p99_us': round(float(np.percentile(samples, 99)), 1)}
+
+
+def time_single(predict, X, repeat):
+    samples = []
+    for i in range(repeat):
+        row = X[i % len(X)].reshape(1, -1)
+        t0 = time.perf_counter()
+        predict(row)
+        samples.append(time.perf_counter() - t0)
+    return percentiles(samples)
+
+
+def time_batch(predict, X):
+    t0 = time.perf_counter()
+    predict(X)
+    elapsed = time.perf_counter() - t0
+    return {'seconds': round(elapsed, 4), 'rows_per_s': int(len(X) / elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', default=model_store.MODELS_DIR)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=2000)
+    parser.add_argument('--features', type=int, default=40, help='Feature count for the synthetic model')
+    args = parser.parse_args()
+
+    bundle = model_store.load(directory=args.models) if os.path.isdir(args.models) else None
+    if bundle is not None and bundle.forest is not None:
+        model, forest = bundle.model, bundle.forest
+        print(f'Model version {bundle.version} from {args.models}')
+    else:
+        model = synthetic_model(args.features, 5000)
+        path = tempfile.mkdtemp(prefix='forest-')
+        forest_arrays.export(model, path)
+        forest = forest_arrays.ArrayForest(path)
+        print('Synthetic 20-tree model')
+    import warnings
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+
+    X = np.random.RandomState(1).rand(args.rows, model.n_features_in_) * 100
+    forest_arrays.verify_parity(model, forest, X)
+    print(f'Parity: identical predictions on {len(X)} rows')
+
+    for name, predict in (('sklearn', model.predict), ('array_forest', forest.predict)):
+        print(f'{name:>13} single row: {time_single(predict, X, args.repeat)}  '
+              f'batch of {len(X)}: {time_batch(predict, X)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""Train on a whole uploaded dataset in bounded memory.
+
+The dataset is read from its column cache (see dataset_cache) a chunk at
+a time and one-hot encoded straight into float32 matrices. The one-hot
+layout is fixed by the full vocabulary in the schema, so every chunk
+has the same columns in the same order that pd.get_dummies would give
+for the whole file. Two modes:
+
+- 'reservoir': a stratified per-class reservoir sample of at most
+  `sample_rows` rows is drawn in one streaming pass and the forest is
+  trained on it. Rare classes keep a minimum share of the sample.
+- 'warm_start': the forest grows chunk by chunk, adding trees fitted on
+  each chunk (RandomForestClassifier warm_start). A chunk that lacks
+  some class is padded with a few stored rows of it, so every fit sees
+  the same classes.
+
+Either way a stratified test set is held out first and never trained on.
+Only the label codes (4 bytes per row) are held for the whole file; the
+largest feature matrix is one sample or one chunk. Peak memory is
+measured by sampling the process RSS from a side thread (not
+tracemalloc, which would slow every thread of the API process while a
+retrain runs) and returned with the model.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import dataset_cache
+from feature_encoder import FeatureEncoder
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRAINING_MODES = ('reservoir', 'warm_start')
+TRAINING_MODE = os.environ.get('IDS_TRAINING_MODE', 'reservoir')
+SAMPLE_ROWS = int(os.environ.get('IDS_TRAIN_SAMPLE_ROWS', 200000))
+TEST_ROWS = int(os.environ.get('IDS_TRAIN_TEST_ROWS', 20000))
+MEMORY_SAMPLE_SECONDS = 0.05  # RSS sampling period of MemoryMeter
+CHUNK_ROWS = int(os.environ.get('IDS_TRAIN_CHUNK_ROWS', dataset_cache.INGEST_CHUNK_ROWS))
+TEST_FRACTION = 0.2
+N_ESTIMATORS = 20
+ANCHOR_ROWS = 20  # Rows kept per class to pad chunks that lack it (warm_start)
+
+
+def find_label_column(names):
+    """The column named 'label' (any case), else None."""
+    for name in names:
+        if name.strip().lower() == 'label':
+            return name
+    return None
+
+
+class SchemaEncoding:
+    """One-hot feature layout of a cached dataset, fixed by its schema."""
+
+    def __init__(self, schema, label_col):
+        columns = [col for col in schema['columns'] if col['name'] != label_col]
+        numeric = [col for col in columns if col['kind'] == 'numeric']
+        categorical = [col for col in columns if col['kind'] != 'numeric']
+        # Same order and names as pd.get_dummies: numeric columns, then
+        # one indicator per category of each categorical column
+        self.feature_list = [col['name'] for col in numeric]
+        self._slots = [(col, i) for i, col in enumerate(numeric)]
+        for col in categorical:
+            self._slots.append((col, len(self.feature_list)))
+            self.feature_list += [f"{col['name']}_{category}" for category in col['categories']]
+
+    def encode(self, path, start, stop, rows=None, out=None):
+        """Encode rows [start, stop) (or `rows`, relative to start) into a float32 matrix.
+
+        `out`, if given, must be zero-filled and of the right shape.
+        """
+        count = stop - start if rows is None else len(rows)
+        if out is None:
+            out = np.zeros((count, len(self.feature_list)), dtype=np.float32)
+        for col, offset in self._slots:
+            values = dataset_cache.column_values(path, col['name'])[start:stop]
+            if rows is not None:
+                values = values[rows]
+            if col['kind'] == 'numeric':
+                out[:, offset] = np.nan_to_num(values, nan=0.0)
+            else:
+                present = np.flatnonzero(values >= 0)
+                out[present, offset + values[present]] = 1
+        return out
+
+    def row_encoder(self):
+        """The FeatureEncoder that lays out request rows the same way."""
+        return FeatureEncoder(
+            self.feature_list,
+            numeric=[(col['name'], offset) for col, offset in self._slots if col['kind'] == 'numeric'],
+            categorical=[(col['name'], offset, col['categories'])
+                         for col, offset in self._slots if col['kind'] != 'numeric'])
+
+
+def label_codes(path, schema, label_col):
+    """(classes, codes): an int32 class index per row, -1 where the label is missing."""
+    col = next(col for col in schema['columns'] if col['name'] == label_col)
+    values = np.asarray(dataset_cache.column_values(path, label_col))
+    if col['kind'] == 'numeric':
+        valid = ~np.isnan(values)
+        classes, inverse = np.unique(values[valid], return_inverse=True)
+        if col['dtype'] == 'int64':
+            classes = classes.astype(np.int64)
+        codes = np.full(len(values), -1, dtype=np.int32)
+        codes[valid] = inverse
+    else:
+        classes, codes = np.asarray(col['categories'], dtype=object), values.astype(np.int32)
+    # Drop vocabulary entries that never occur
+    counts = np.bincount(codes[codes >= 0], minlength=len(classes))
+    used = np.flatnonzero(counts)
+    if len(used) < len(classes):
+        remap = np.full(len(classes) + 1, -1, dtype=np.int32)
+        remap[used] = np.arange(len(used))
+        codes = remap[codes]  # -1 indexes the trailing -1
+        classes = classes[used]
+    return classes, codes
+
+
+def class_counts(codes, n_classes, exclude=None, chunk_rows=CHUNK_ROWS):
+    counts = np.zeros(n_classes, dtype=np.int64)
+    for start in range(0, len(codes), chunk_rows):
+        chunk = codes[start:start + chunk_rows]
+        if exclude is not None:
+            chunk = chunk[~exclude[start:start + chunk_rows]]
+        counts += np.bincount(chunk[chunk >= 0], minlength=n_classes)
+    return counts
+
+
+def stratified_quotas(counts, size):
+    """Rows to sample per class: proportional, with a floor so rare classes are kept."""
+    total = int(counts.sum())
+    if total <= size:
+        return counts.copy()
+    floor = max(1, size // (10 * max(1, np.count_nonzero(counts))))
+    return np.minimum(counts, np.maximum(counts * size // total, floor))
+
+
+def reservoir_sample(codes, quotas, rng, exclude=None, chunk_rows=CHUNK_ROWS):
+    """Sorted row indices of a per-class reservoir sample of `quotas[c]` rows each.
+
+    Every eligible row gets a random key and each class keeps its rows
+    with the smallest keys (bottom-k sampling), so one pass over the
+    labels gives a uniform sample per class in O(sum(quotas)) memory.
+    """
+    keys = [np.empty(0)] * len(quotas)
+    kept = [np.empty(0, dtype=np.int64)] * len(quotas)
+    for start in range(0, len(codes), chunk_rows):
+        chunk = codes[start:start + chunk_rows]
+        eligible = chunk >= 0
+        if exclude is not None:
+            eligible &= ~exclude[start:start + chunk_rows]
+        draws = rng.random_sample(len(chunk))
+        for cls in np.unique(chunk[eligible]):
+            rows = np.flatnonzero(eligible & (chunk == cls))
+            k = np.concatenate([keys[cls], draws[rows]])
+            idx = np.concatenate([kept[cls], rows + start])
+            if len(k) > quotas[cls]:
+                best = np.argpartition(k, quotas[cls] - 1)[:quotas[cls]] if quotas[cls] else []
+                k, idx = k[best], idx[best]
+            keys[cls], kept[cls] = k, idx
+    return np.sort(np.concatenate(kept))
+
+
+def encode_rows(path, encoding, rows, total_rows, chunk_rows=CHUNK_ROWS):
+    """Encode the sorted row indices `rows`, reading the cache chunk by chunk."""
+    X = np.zeros((len(rows), len(encoding.feature_list)), dtype=np.float32)
+    bounds = np.searchsorted(rows, np.arange(0, total_rows + chunk_rows, chunk_rows))
+    for i, start in enumerate(range(0, total_rows, chunk_rows)):
+        lo, hi = bounds[i], bounds[i + 1]
+        if lo < hi:
+            encoding.encode(path, start, min(total_rows, start + chunk_rows), rows=rows[lo:hi] - start, out=X[lo:hi])
+    return X
+
+
+def _rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if os.uname().sysname == 'Darwin' else peak / 2 ** 10  # bytes vs KiB
+
+
+class MemoryMeter:
+    """Peak RSS over a block, sampled every `interval` seconds by a side thread.
+
+    The RSS is process-wide, so request threads and other jobs running
+    alongside are included; `process_max_rss_mb` is the process's
+    lifetime peak from getrusage.
+    """
+
+    def __init__(self, interval=MEMORY_SAMPLE_SECONDS):
+        self.interval = interval
+        self._done = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start_rss_mb = self.peak_rss_mb = _rss_mb()
+        if self.start_rss_mb is not None:
+            self._thread = threading.Thread(target=self._sample, name='memory-meter', daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb() or 0.0)
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.end_rss_mb = _rss_mb()
+        if self.end_rss_mb is not None:
+            self.peak_rss_mb = max(self.peak_rss_mb, self.end_rss_mb)
+        self.max_rss_mb = _max_rss_mb()
+
+    def report(self):
+        return {key: round(value, 1) if value is not None else None for key, value in (
+            ('peak_rss_mb', self.peak_rss_mb), ('start_rss_mb', self.start_rss_mb),
+            ('end_rss_mb', self.end_rss_mb), ('process_max_rss_mb', self.max_rss_mb))}
+
+
+def _train_reservoir(path, encoding, classes, codes, exclude, sample_rows, n_estimators, rng,
+                     random_state, chunk_rows, report):
+    from sklearn.ensemble import RandomForestClassifier
+    quotas = stratified_quotas(class_counts(codes, len(classes), exclude, chunk_rows), sample_rows)
+    rows = reservoir_sample(codes, quotas, rng, exclude, chunk_rows)
+    report(0.3, f'encoding {len(rows)} sampled rows')
+    X = encode_rows(path, encoding, rows, len(codes), chunk_rows)
+    y = classes[codes[rows]]
+    report(0.4, f'training on {len(rows)} rows')
+    clf = RandomForestClassifier(n_estimators=n_estimators, random_state=random_state)
+    clf.fit(X, y)
+    return clf, {'train_rows': len(rows), 'fits': 1}
+
+
+def _train_warm_start(path, encoding, classes, codes, exclude, n_estimators, rng, random_state,
+                      chunk_rows, report):
+    from sklearn.ensemble import RandomForestClassifier
+    counts = class_counts(codes, len(classes), exclude, chunk_rows)
+    anchor_rows = reservoir_sample(codes, np.minimum(counts, ANCHOR_ROWS), rng, exclude, chunk_rows)
+    X_anchor = encode_rows(path, encoding, anchor_rows, len(codes), chunk_rows)
+    y_anchor = codes[anchor_rows]
+    n_chunks = max(1, math.ceil(len(codes) / chunk_rows))
+    trees_per_chunk = max(1, round(n_estimators / n_chunks))
+    clf = RandomForestClassifier(n_estimators=0, warm_start=True, random_state=random_state)
+    train_rows = padded = fits = 0
+    for i, start in enumerate(range(0, len(codes), chunk_rows)):
+        stop = min(len(codes), start + chunk_rows)
+        chunk = codes[start:stop]
+        rows = np.flatnonzero((chunk >= 0) & ~exclude[start:stop])
+        if not len(rows):
+            continue
+        X, y = encoding.encode(path, start, stop, rows=rows), chunk[rows]
+        missing = np.isin(y_anchor, np.unique(y), invert=True)
+        if missing.any():
+            X, y = np.vstack([X, X_anchor[missing]]), np.concatenate([y, y_anchor[missing]])
+            padded += int(missing.sum())
+        clf.set_params(n_estimators=clf.n_estimators + trees_per_chunk)
+        clf.fit(X, classes[y])
+        train_rows += len(rows)
+        fits += 1
+        report(0.2 + 0.5 * (i + 1) / n_chunks, f'trained chunk {i + 1}/{n_chunks}')
+    return clf, {'train_rows': train_rows, 'fits': fits, 'trees_per_chunk': trees_per_chunk,
+                 'anchor_rows_added': padded}
+
+
+def _hold_out(path, test_rows, random_state, chunk_rows):
+    schema = dataset_cache.ensure_cached(path)
+    names = [col['name'] for col in schema['columns']]
+    label_col = find_label_column(names) or names[-1]
+    encoding = SchemaEncoding(schema, label_col)
+    classes, codes = label_codes(path, schema, label_col)
+    if len(classes) < 2:
+        raise ValueError(f'Label column {label_col!r} needs at least two classes')
+    rng = np.random.RandomState(random_state)
+    counts = class_counts(codes, len(classes), chunk_rows=chunk_rows)
+    test_size = min(test_rows, int(counts.sum() * TEST_FRACTION))
+    # Never hold out more than TEST_FRACTION of a class, or rare ones vanish from training
+    test_quotas = np.minimum(stratified_quotas(counts, test_size), (counts * TEST_FRACTION).astype(np.int64))
+    test_idx = reservoir_sample(codes, test_quotas, rng, chunk_rows=chunk_rows)
+    exclude = np.zeros(len(codes), dtype=bool)
+    exclude[test_idx] = True
+    return label_col, encoding, classes, codes, counts, test_idx, exclude, rng
+
+
+def load_sample(path, sample_rows=None, test_rows=None, random_state=42, chunk_rows=CHUNK_ROWS):
+    """(X_train, y_train, X_test, y_test, feature_list): the split 'reservoir' training uses."""
+    sample_rows = SAMPLE_ROWS if sample_rows is None else int(sample_rows)
+    label_col, encoding, classes, codes, counts, test_idx, exclude, rng = _hold_out(
+        path, TEST_ROWS if test_rows is None else int(test_rows), random_state, chunk_rows)
+    quotas = stratified_quotas(class_counts(codes, len(classes), exclude, chunk_rows), sample_rows)
+    train_idx = reservoir_sample(codes, quotas, rng, exclude, chunk_rows)
+    return (encode_rows(path, encoding, train_idx, len(codes), chunk_rows), classes[codes[train_idx]],
+            encode_rows(path, encoding, test_idx, len(codes), chunk_rows), classes[codes[test_idx]],
+            encoding.feature_list)
+
+
+def train(path, mode=None, sample_rows=None, test_rows=None, n_estimators=N_ESTIMATORS,
+          chunk_rows=CHUNK_ROWS, random_state=42, report=None):
+    """Train a RandomForest on every labelled row of the cached dataset at `path`.
+
+    Returns (model, encoder, X_test, y_test, info): `encoder` is the
+    FeatureEncoder for request rows (its feature_list names the model's
+    columns) and `info` has the row counts, timings and the memory report.
+    """
+    mode = mode or TRAINING_MODE
+    if mode not in TRAINING_MODES:
+        raise ValueError(f'Unknown training mode {mode!r}; expected one of {TRAINING_MODES}')
+    sample_rows = SAMPLE_ROWS if sample_rows is None else int(sample_rows)
+    test_rows = TEST_ROWS if test_rows is None else int(test_rows)
+    report = report or (lambda progress, stage: None)
+    started = time.time()
+    with MemoryMeter() as meter:
+        report(0.05, 'reading schema')
+        label_col, encoding, classes, codes, counts, test_idx, exclude, rng = _hold_out(
+            path, test_rows, random_state, chunk_rows)
+        if mode == 'reservoir':
+            clf, info = _train_reservoir(path, encoding, classes, codes, exclude, sample_rows, n_estimators,
+                                         rng, random_state, chunk_rows, report)
+        else:
+            clf, info = _train_warm_start(path, encoding, classes, codes, exclude, n_estimators, rng,
+                                          random_state, chunk_rows, report)
+        X_test = encode_rows(path, encoding, test_idx, len(codes), chunk_rows)
+        y_test = classes[codes[test_idx]]
+    info = {'mode': mode, 'label': label_col, 'rows': len(codes), 'labelled_rows': int(counts.sum()),
+            **info, 'test_rows': len(test_idx), 'n_estimators': len(clf.estimators_),
+            'sample_rows': sample_rows if mode == 'reservoir' else None,
+            'chunk_rows': chunk_rows, 'seconds': round(time.time() - started, 2),
+            'memory': meter.report()}
+    return clf, encoding.row_encoder(), X_test, y_test, info
@@ -0,0 +1,276 @@
+"""Single-pass CSV ingestion into a cached, memory-mappable columnar copy.
+
+An upload is parsed exactly once: the encoding is detected up front, the
+file is streamed in chunks, and every column is appended to its own raw
+binary file next to the CSV (`uploads/<name>.csv.cache/`):
+
+- numeric columns as float64 (`c<i>.f8`),
+- everything else as int32 category codes (`c<i>.i4`, -1 for missing)
+  with the vocabulary stored in the schema.
+
+A column's kind is taken from the first chunk. One that was numeric
+there but holds text further down is re-read as categorical afterwards
+(what read_csv on the whole file would have made of it) and listed
+under `retyped`, rather than having the text silently become NaN.
+
+`schema.json` records the row count, per-column kind and statistics, and
+the source file's size and mtime so a replaced upload invalidates the
+cache. Later retrain and scoring calls read columns through np.memmap
+instead of parsing the CSV again.
+"""
+import codecs
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+CACHE_SUFFIX = '.cache'
+SCHEMA_FILE = 'schema.json'
+INGEST_CHUNK_ROWS = 50000
+TOP_VALUES = 10
+
+_ingest_locks = {}
+_ingest_locks_guard = threading.Lock()
+
+
+def cache_dir(path):
+    return path + CACHE_SUFFIX
+
+
+def detect_encoding(path, sample_size=65536):
+    """Guess a CSV's text encoding from its byte order mark and first bytes."""
+    with open(path, 'rb') as f:
+        head = f.read(sample_size)
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if b'\x00' in head:
+        # BOM-less UTF-16: ASCII text has a zero byte in every other position
+        return 'utf-16-le' if head[1:2] == b'\x00' else 'utf-16-be'
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime}
+
+
+def load_schema(path):
+    """The cached schema for `path`, or None if there is no valid cache."""
+    try:
+        with open(os.path.join(cache_dir(path), SCHEMA_FILE)) as f:
+            schema = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return schema if schema.get('source') == _source_stamp(path) else None
+
+
+class _NumericColumn:
+    kind = 'numeric'
+    suffix = '.f8'
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.coerced = 0
+        self.integer = True
+        self.min = None
+        self.max = None
+        self.sum = 0.0
+        self.sumsq = 0.0
+
+    def values(self, series):
+        if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+            self.integer = self.integer and pd.api.types.is_integer_dtype(series)
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        else:
+            self.integer = False
+            converted = pd.to_numeric(series, errors='coerce')
+            self.coerced += int(converted.isna().sum() - series.isna().sum())
+            values = converted.to_numpy(dtype=np.float64, na_value=np.nan)
+        present = values[~np.isnan(values)]
+        self.nulls += len(values) - len(present)
+        if len(present):
+            self.count += len(present)
+            lo, hi = float(present.min()), float(present.max())
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+            self.sum += float(present.sum())
+            self.sumsq += float(np.square(present).sum())
+        return values
+
+    @property
+    def dtype(self):
+        # Integer columns without gaps are handed back as int64, like read_csv would
+        return 'int64' if self.integer and not self.nulls else 'float64'
+
+    def stats(self):
+        mean = self.sum / self.count if self.count else None
+        std = (max(self.sumsq / self.count - mean * mean, 0.0) ** 0.5) if self.count else None
+        return {'count': self.count, 'nulls': self.nulls, 'coerced': self.coerced,
+                'min': self.min, 'max': self.max, 'mean': mean, 'std': std}
+
+
+class _CategoricalColumn:
+    kind = 'categorical'
+    suffix = '.i4'
+    dtype = 'category'
+
+    def __init__(self):
+        self.codes = {}
+        self.categories = []
+        self.counts = []
+        self.nulls = 0
+
+    def values(self, series):
+        out = np.empty(len(series), dtype=np.int32)
+        codes = self.codes
+        for i, value in enumerate(series.tolist()):
+            if value is None or (isinstance(value, float) and value != value):
+                out[i] = -1
+                self.nulls += 1
+                continue
+            value = str(value)
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self.categories)
+                self.categories.append(value)
+                self.counts.append(0)
+            self.counts[code] += 1
+            out[i] = code
+        return out
+
+    def stats(self):
+        order = sorted(range(len(self.counts)), key=lambda c: -self.counts[c])[:TOP_VALUES]
+        return {'count': sum(self.counts), 'nulls': self.nulls, 'unique': len(self.categories),
+                'top': [[self.categories[c], self.counts[c]] for c in order]}
+
+
+def _retype_categorical(path, encoding, chunksize, directory, columns, indexes):
+    """Rebuild the numeric columns at `indexes` as categorical, reading only those columns."""
+    rebuilt = {i: _CategoricalColumn() for i in indexes}
+    files = {i: open(os.path.join(directory, f'c{i}{_CategoricalColumn.suffix}'), 'wb') for i in indexes}
+    try:
+        # usecols keeps file order, so chunk column n is indexes[n]
+        for chunk in pd.read_csv(path, chunksize=chunksize, encoding=encoding, usecols=indexes, dtype=str):
+            for n, i in enumerate(indexes):
+                rebuilt[i].values(chunk.iloc[:, n]).tofile(files[i])
+    finally:
+        for f in files.values():
+            f.close()
+    for i in indexes:
+        os.remove(os.path.join(directory, f'c{i}{_NumericColumn.suffix}'))
+        columns[i] = (columns[i][0], rebuilt[i])
+
+
+def ingest(path, chunksize=INGEST_CHUNK_ROWS):
+    """Parse `path` once and (re)build its columnar cache. Returns the schema."""
+    with _ingest_locks_guard:
+        lock = _ingest_locks.setdefault(os.path.abspath(path), threading.Lock())
+    with lock:
+        schema = load_schema(path)
+        if schema is not None:
+            return schema
+        source = _source_stamp(path)
+        encoding = detect_encoding(path)
+        target = cache_dir(path)
+        tmp = f'{target}.tmp-{os.getpid()}-{threading.get_ident()}'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        try:
+            columns, files, rows = None, [], 0
+            for chunk in pd.read_csv(path, chunksize=chunksize, encoding=encoding):
+                if columns is None:
+                    columns = [(name, _NumericColumn() if pd.api.types.is_numeric_dtype(chunk[name])
+                                else _CategoricalColumn()) for name in chunk.columns]
+                    files = [open(os.path.join(tmp, f'c{i}{col.suffix}'), 'wb')
+                             for i, (_, col) in enumerate(columns)]
+                for (name, col), f in zip(columns, files):
+                    col.values(chunk[name]).tofile(f)
+                rows += len(chunk)
+            for f in files:
+                f.close()
+            retyped = [i for i, (_, col) in enumerate(columns or []) if col.kind == 'numeric' and col.coerced]
+            if retyped:
+                _retype_categorical(path, encoding, chunksize, tmp, columns, retyped)
+            schema = {
+                'source': source,
+                'encoding': encoding,
+                'rows': rows,
+                'retyped': [columns[i][0] for i in retyped],
+                'columns': [
+                    {'name': name, 'kind': col.kind, 'file': f'c{i}{col.suffix}',
+                     'dtype': col.dtype, 'stats': col.stats(),
+                     **({'categories': col.categories} if col.kind == 'categorical' else {})}
+                    for i, (name, col) in enumerate(columns or [])
+                ],
+            }
+            with open(os.path.join(tmp, SCHEMA_FILE), 'w') as f:
+                json.dump(schema, f)
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(tmp, target)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return schema
+
+
+def ensure_cached(path):
+    """The schema for `path`, ingesting it first if the cache is missing or stale."""
+    return load_schema(path) or ingest(path)
+
+
+def column_names(path):
+    return [col['name'] for col in ensure_cached(path)['columns']]
+
+
+def _column_array(path, schema, col):
+    dtype = np.float64 if col['kind'] == 'numeric' else np.int32
+    if not schema['rows']:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(os.path.join(cache_dir(path), col['file']), dtype=dtype, mode='r', shape=(schema['rows'],))
+
+
+def column_values(path, name):
+    """One cached column as a read-only memmap: float64 values, or int32 codes (-1 = missing)."""
+    schema = ensure_cached(path)
+    for col in schema['columns']:
+        if col['name'] == name:
+            return _column_array(path, schema, col)
+    raise KeyError(name)
+
+
+def _to_series(col, values):
+    if col['kind'] == 'numeric':
+        return np.asarray(values, dtype=col['dtype'])
+    return pd.Categorical.from_codes(np.asarray(values), categories=col['categories'])
+
+
+def read_frame(path, columns=None, nrows=None, start=0):
+    """Rows [start, start + nrows) of the cached dataset as a DataFrame.
+
+    Numeric columns come back as float64, or int64 for integer columns
+    without missing values, as read_csv would give; the rest as pandas
+    Categoricals over the whole file's vocabulary.
+    """
+    schema = ensure_cached(path)
+    wanted = schema['columns'] if columns is None else \
+        [col for col in schema['columns'] if col['name'] in set(columns)]
+    stop = schema['rows'] if nrows is None else min(schema['rows'], start + nrows)
+    return pd.DataFrame({col['name']: _to_series(col, _column_array(path, schema, col)[start:stop])
+                         for col in wanted})
+
+
+def iter_frames(path, chunksize=INGEST_CHUNK_ROWS, columns=None):
+    """Yield the cached dataset as DataFrames of at most `chunksize` rows."""
+    rows = ensure_cached(path)['rows']
+    for start in range(0, rows, chunksize):
+        yield read_frame(path, columns=columns, nrows=chunksize, start=start)
@@ -0,0 +1,50 @@
+const STREAM_URL = 'http://localhost:5000/stream';
+const RECONNECT_MS = 5000;
+
+// Subscribe to the backend's server-sent events. `handlers` maps a topic
+// ('history', 'live', 'metrics', 'status', 'threats', 'alerts', 'forensic')
+// to a callback for its parsed payload. Returns a function that closes
+// the stream. The browser reconnects on its own and resumes from the last
+// event id; if the server refuses the connection (e.g. too many streams)
+// we retry later with that id.
+export function subscribeToStream(handlers) {
+  const topics = Object.keys(handlers).join(',');
+  let source = null;
+  let lastEventId = null;
+  let retryTimer = null;
+  let closed = false;
+
+  const connect = () => {
+    const resume = lastEventId ? `&last_event_id=${encodeURIComponent(lastEventId)}` : '';
+    source = new EventSource(`${STREAM_URL}?topics=${topics}${resume}`);
+    Object.entries(handlers).forEach(([topic, handler]) => {
+      source.addEventListener(topic, (event) => {
+        if (event.lastEventId) lastEventId = event.lastEventId;
+        try {
+          handler(JSON.parse(event.data));
+        } catch (error) {
+          console.error(`Error handling ${topic} event:`, error);
+        }
+      });
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && !closed) {
+        retryTimer = setTimeout(connect, RECONNECT_MS);
+      }
+    };
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retryTimer);
+    if (source) source.close();
+  };
+}
+
+// Merge a log-topic event ({items, dropped, gap}) into a list of at most
+// `limit` entries. After a gap the older entries are stale, so start over.
+export function appendStreamItems(previous, data, limit) {
+  const items = data.items || [];
+  return (data.gap ? items : previous.concat(items)).slice(-limit);
+}
@@ -0,0 +1,275 @@
+"""Server-sent events for the dashboards, fed by one poller per process.
+
+Instead of every open dashboard polling half a dozen endpoints, a
+single feeder thread per process reads the shared state (see
+shared_state) a few times a second and wakes the connected /stream
+clients. The feeder only runs while at least one client is connected.
+
+Two kinds of topic:
+
+- log topics ('history', 'live') are sequences with a cursor (prediction
+  id, live-feed seq). The feeder keeps the most recent items in one
+  bounded ring per topic; each client only holds its cursors, so a slow
+  client costs no memory. A client that has fallen further behind than
+  `max_batch` items gets the newest ones and a `dropped` count. One
+  that fell off the ring (or resumes on another worker) is caught up
+  from the shared state, with `gap: true` if the items are gone there
+  too, in which case it should refetch over REST.
+- snapshot topics ('metrics', 'status', ...) are recomputed on their own
+  interval, serialized once, and sent only when they change.
+
+A client receives at most `max_rate` flushes per second; updates that
+arrive in between are coalesced into the next flush. Every event's id
+encodes the client's log cursors (e.g. `history=120;live=5031`).
+Cursors come from the shared state, so EventSource's automatic
+reconnect with Last-Event-ID resumes on any worker.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+STREAM_POLL_SECONDS = float(os.environ.get('IDS_STREAM_POLL_SECONDS', 0.25))
+STREAM_MAX_RATE = float(os.environ.get('IDS_STREAM_MAX_RATE', 2.0))  # Flushes per client per second
+STREAM_MAX_CLIENTS = int(os.environ.get('IDS_STREAM_MAX_CLIENTS', 64))  # Each holds a server thread
+HEARTBEAT_SECONDS = 15.0
+RETRY_MS = 3000
+LOG_CAPACITY = 2000  # Items kept per log topic for catching up
+MAX_BATCH = 500  # Items per log event; older pending items are dropped
+
+
+class TooManyClients(Exception):
+    """Raised when a process already serves STREAM_MAX_CLIENTS streams."""
+
+
+def _dumps(value):
+    return json.dumps(value, default=str, separators=(',', ':'))
+
+
+class LogTopic:
+    """An append-only sequence read through `read(since, limit) -> (items, next_cursor)`.
+
+    `position(item)` gives an item's cursor; `read(None, n)` must return
+    the latest n items.
+    """
+
+    def __init__(self, name, read, position, backlog=50, capacity=LOG_CAPACITY):
+        self.name = name
+        self.read = read
+        self.position = position
+        self.backlog = backlog
+        self.capacity = capacity
+        self._positions = []
+        self._items = []  # JSON-encoded, parallel to _positions
+        self.head = None  # Next cursor to read from the source
+        self._lock = threading.Lock()
+
+    def poll(self):
+        """Pull new items from the source; True if there were any."""
+        with self._lock:
+            since, limit = (self.head, self.capacity) if self.head is not None else (None, self.backlog)
+            items, head = self.read(since, limit)
+            self.head = head
+            if not items:
+                return False
+            self._positions += [self.position(item) for item in items]
+            self._items += [_dumps(item) for item in items]
+            if len(self._items) > 2 * self.capacity:
+                del self._positions[:-self.capacity], self._items[:-self.capacity]
+            return True
+
+    def start_cursor(self, resume=None):
+        """Where a new client starts: `resume` if given, else `backlog` items back."""
+        with self._lock:
+            if resume is not None:
+                return resume
+            if not self._positions:
+                return self.head or 0
+            return self._positions[max(0, len(self._positions) - self.backlog)]
+
+    def take(self, cursor, max_batch=MAX_BATCH):
+        """(data, new_cursor) for items at or after `cursor`, or (None, cursor) if none."""
+        with self._lock:
+            start = bisect.bisect_left(self._positions, cursor)
+            if start == len(self._positions):
+                return None, cursor
+            behind = start == 0 and self._positions[0] > cursor
+            if not behind:
+                stop = len(self._positions)
+                first = max(start, stop - max_batch)
+                return self._event(self._items[first:stop], first - start, False), self._positions[-1] + 1
+        # Older than this process's ring (e.g. resuming on another worker): ask the source
+        items, next_cursor = self.read(cursor, max_batch)
+        gap = not items or self.position(items[0]) > cursor
+        return self._event([_dumps(item) for item in items], 0, gap), max(next_cursor, cursor)
+
+    @staticmethod
+    def _event(items, dropped, gap):
+        return f'{{"items":[{",".join(items)}],"dropped":{dropped},"gap":{"true" if gap else "false"}}}'
+
+
+class SnapshotTopic:
+    """A payload recomputed every `interval` seconds and published when it changes."""
+
+    def __init__(self, name, compute, interval=1.0):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.data = None
+        self.version = 0
+        self._polled = 0.0
+        self._lock = threading.Lock()
+
+    def poll(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._polled < self.interval:
+                return False
+            self._polled = now
+            data = _dumps(self.compute())
+            if data == self.data:
+                return False
+            self.data = data
+            self.version += 1
+            return True
+
+    def current(self):
+        """(version, serialized payload)."""
+        with self._lock:
+            return self.version, self.data
+
+
+def parse_event_id(event_id):
+    """{'history': 120, 'live': 5031} from 'history=120;live=5031' (bad parts ignored)."""
+    cursors = {}
+    for part in (event_id or '').split(';'):
+        name, _, value = part.partition('=')
+        try:
+            cursors[name.strip()] = int(value)
+        except ValueError:
+            pass
+    return cursors
+
+
+class EventHub:
+    """The topics of one process and the feeder thread that polls them."""
+
+    def __init__(self, poll_seconds=STREAM_POLL_SECONDS, max_clients=STREAM_MAX_CLIENTS):
+        self.poll_seconds = poll_seconds
+        self.max_clients = max_clients
+        self.topics = {}
+        self.clients = 0
+        self._subscribers = {}  # topic -> connected clients; only these are polled
+        self.tick = 0  # Bumped whenever any topic changed
+        self.events_sent = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, topic):
+        self.topics[topic.name] = topic
+        return topic
+
+    def _poll(self, names=None, force=False):
+        changed = False
+        if names is None:
+            with self._cond:
+                names = [name for name, count in self._subscribers.items() if count]
+        for topic in (self.topics[name] for name in names):
+            try:
+                if isinstance(topic, SnapshotTopic):
+                    changed |= topic.poll(force)
+                else:
+                    changed |= topic.poll()
+            except Exception as e:
+                print(f"Error polling stream topic {topic.name}: {e}")
+        return changed
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self.clients:
+                    self._cond.wait()
+            if self._poll():
+                with self._cond:
+                    self.tick += 1
+                    self._cond.notify_all()
+            time.sleep(self.poll_seconds)
+
+    def _connect(self, names):
+        with self._cond:
+            self.clients += 1
+            for name in names:
+                self._subscribers[name] = self._subscribers.get(name, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-stream-feeder', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        # Snapshots may be stale if nobody was connected; bring these up to date now
+        self._poll(names, force=True)
+
+    def _disconnect(self, names):
+        with self._cond:
+            self.clients -= 1
+            for name in names:
+                self._subscribers[name] -= 1
+
+    def stream(self, names, last_event_id=None, max_rate=STREAM_MAX_RATE):
+        """A generator of SSE text chunks for `names`; the client connects when it is first iterated.
+
+        Raises KeyError for an unknown topic and TooManyClients when full.
+        """
+        names = list(dict.fromkeys(names))
+        for name in names:
+            if name not in self.topics:
+                raise KeyError(name)
+        with self._cond:
+            if self.clients >= self.max_clients:
+                raise TooManyClients(f'{self.clients} streams already open')
+        return self._events(names, parse_event_id(last_event_id), max(0.1, float(max_rate)))
+
+    def _events(self, names, resume, max_rate):
+        versions = {}
+        interval = 1.0 / max_rate
+        last_flush = 0.0
+        self._connect(names)
+        try:
+            cursors = {name: self.topics[name].start_cursor(resume.get(name))
+                       for name in names if isinstance(self.topics[name], LogTopic)}
+            yield f'retry: {RETRY_MS}\n\n'
+            while True:
+                with self._cond:
+                    seen = self.tick
+                # Coalesce: changes arriving before the next flush slot go out together
+                delay = last_flush + interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                frames = []
+                for name in names:
+                    topic = self.topics[name]
+                    if isinstance(topic, LogTopic):
+                        data, cursors[name] = topic.take(cursors[name])
+                    else:
+                        version, data = topic.current()
+                        if data is None or versions.get(name) == version:
+                            data = None
+                        else:
+                            versions[name] = version
+                    if data is not None:
+                        frames.append((name, data))
+                if frames:
+                    event_id = ';'.join(f'{name}={cursor}' for name, cursor in cursors.items())
+                    self.events_sent += len(frames)
+                    last_flush = time.monotonic()
+                    yield ''.join(f'id: {event_id}\nevent: {name}\ndata: {data}\n\n' for name, data in frames)
+                    continue
+                with self._cond:
+                    changed = self._cond.wait_for(lambda: self.tick != seen, timeout=HEARTBEAT_SECONDS)
+                if not changed:
+                    yield ': keepalive\n\n'  # Also how a vanished client is noticed
+        finally:
+            self._disconnect(names)
+
+    def stats(self):
+        return {'clients': self.clients, 'max_clients': self.max_clients, 'events_sent': self.events_sent,
+                'topics': sorted(self.topics)}
@@ -0,0 +1,103 @@
+"""On-demand, cached SHAP explanations.
+
+SHAP is by far the slowest part of /predict, so explanations are computed
+only when asked for. Each row is explained for the class it was predicted
+as, which makes the result a pure function of (model version, feature
+vector): results are cached under that key with LRU eviction, and a batch
+only runs the explainer over its cache misses.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EXPLAIN_MODES = ('none', 'topk', 'full')
+
+
+def _class_values(shap_values, class_index, n_rows):
+    """Per-row SHAP values for one class, whatever shape shap returned."""
+    if isinstance(shap_values, list):  # Older shap: one (rows, features) array per class
+        return np.asarray(shap_values[class_index])
+    values = np.asarray(shap_values)
+    if values.ndim == 3:  # Newer shap: (rows, features, classes)
+        return values[:, :, class_index]
+    return values  # Single-output models
+
+
+class ExplanationCache:
+    """LRU cache of full explanation vectors keyed by model version and row hash."""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_version, row, class_index):
+        digest = hashlib.blake2b(np.ascontiguousarray(row, dtype=np.float64).tobytes(), digest_size=16).digest()
+        return (model_version, class_index, digest)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+def explain_rows(explainer, X, class_indices, model_version, cache):
+    """Full explanation vectors for each row of X, explaining its own class.
+
+    `X` is the encoded (rows, features) matrix the model scored and
+    `class_indices` the index of each row's predicted class in
+    model.classes_. Only cache misses are sent to the explainer, grouped
+    into one call.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    results = [None] * len(X)
+    keys = [cache.key(model_version, X[i], class_indices[i]) for i in range(len(X))]
+    missing = []
+    for i, key in enumerate(keys):
+        results[i] = cache.get(key)
+        if results[i] is None:
+            missing.append(i)
+    if missing:
+        shap_values = explainer.shap_values(X[missing])
+        by_class = {}
+        for n, i in enumerate(missing):
+            cls = class_indices[i]
+            if cls not in by_class:
+                by_class[cls] = _class_values(shap_values, cls, len(missing))
+            vector = by_class[cls][n].astype(np.float32)
+            cache.put(keys[i], vector)
+            results[i] = vector
+    return results
+
+
+def top_k(vector, feature_list, k=10):
+    """The k most influential features of one explanation, largest |value| first."""
+    vector = np.asarray(vector)
+    k = max(0, min(int(k), len(vector)))
+    if k == 0:
+        return []
+    idx = np.argpartition(-np.abs(vector), k - 1)[:k]
+    idx = idx[np.argsort(-np.abs(vector[idx]))]
+    return [{'feature': feature_list[i] if i < len(feature_list) else str(i), 'value': float(vector[i])}
+            for i in idx]
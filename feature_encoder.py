@@ -0,0 +1,139 @@
+"""Row encoding for /predict, fitted once at training time and saved with the model.
+
+Training records the layout of its feature matrix: which input columns
+are numeric and where each one goes, and for each categorical column
+its vocabulary and the offset of its one-hot block. At inference a list
+of JSON rows is written straight into a preallocated matrix in that
+layout, with no DataFrame and no dependence on which categories happen
+to appear in the request (as pd.get_dummies has). Unknown categories
+and missing or non-numeric values encode as all zeros, like the
+training data's missing values.
+
+Saved as encoder.json in the model version directory (see model_store).
+"""
+import json
+import math
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+ENCODER_FILE = 'encoder.json'
+
+
+def _number(value):
+    """A float for a numeric cell; 0 for missing, NaN or non-numeric values."""
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return 0.0
+    elif not isinstance(value, (int, float)):
+        return 0.0
+    value = float(value)
+    return 0.0 if math.isnan(value) else value
+
+
+def _category(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+class FeatureEncoder:
+    """Input columns -> positions in the model's feature matrix.
+
+    `numeric` is a list of (column, index); `categorical` a list of
+    (column, offset, categories), category i of a column going to
+    offset + i. Without either (a model saved before encoders were),
+    columns are matched by name the way pd.get_dummies names them.
+    """
+
+    def __init__(self, feature_list, numeric=None, categorical=None):
+        self.feature_list = list(feature_list)
+        self.fitted = numeric is not None or categorical is not None
+        self.numeric = [(name, int(index)) for name, index in numeric or []]
+        self.categorical = [(name, int(offset), list(categories)) for name, offset, categories in categorical or []]
+        self._vocab = [(name, offset, {category: i for i, category in enumerate(categories)})
+                       for name, offset, categories in self.categorical]
+        self._index = {name: i for i, name in enumerate(self.feature_list)}
+        self._numeric_index = np.array([index for _, index in self.numeric], dtype=np.intp)
+        names = [name for name, _ in self.numeric]
+        self._numeric_getter = itemgetter(*names) if names else None
+
+    @classmethod
+    def from_feature_list(cls, feature_list):
+        return cls(feature_list)
+
+    def encode(self, rows, dtype=np.float64, out=None):
+        """Encode a list of dicts into a (rows, features) matrix.
+
+        `out`, if given, must be zero-filled and of the right shape.
+        Raises TypeError if a row is not a dict.
+        """
+        if out is None:
+            out = np.zeros((len(rows), len(self.feature_list)), dtype=dtype)
+        if not rows:
+            return out
+        if not self.fitted:
+            self._encode_rows(rows, out)
+            return out
+        try:
+            self._encode_columns(rows, out)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # Missing keys, nulls or strings in numeric columns: go row by row
+            if not all(isinstance(row, dict) for row in rows):
+                raise TypeError('each row must be an object of column values')
+            out[:] = 0
+            self._encode_rows(rows, out)
+        return out
+
+    def _encode_columns(self, rows, out):
+        count = len(rows)
+        if self._numeric_getter is not None:
+            width = len(self.numeric)
+            values = map(self._numeric_getter, rows)
+            if width > 1:
+                values = chain.from_iterable(values)
+            block = np.fromiter(values, dtype=np.float64, count=count * width).reshape(count, width)
+            out[:, self._numeric_index] = np.nan_to_num(block, nan=0.0)
+        for name, offset, vocab in self._vocab:
+            get = vocab.get
+            codes = np.fromiter([get(value, -1) if isinstance(value, str) else get(_category(value), -1)
+                                 for value in (row.get(name) for row in rows)], dtype=np.intp, count=count)
+            present = np.flatnonzero(codes >= 0)
+            out[present, offset + codes[present]] = 1
+
+    def _encode_rows(self, rows, out):
+        index = self._index
+        for i, row in enumerate(rows):
+            if self.fitted:
+                for name, column in self.numeric:
+                    out[i, column] = _number(row.get(name))
+                for name, offset, vocab in self._vocab:
+                    code = vocab.get(_category(row.get(name)))
+                    if code is not None:
+                        out[i, offset + code] = 1
+                continue
+            for name, value in row.items():
+                if isinstance(value, str):
+                    column = index.get(f'{name}_{value}')
+                    if column is not None:
+                        out[i, column] = 1
+                elif name in index:
+                    out[i, index[name]] = _number(value)
+
+    def to_dict(self):
+        return {'features': self.feature_list,
+                'numeric': [[name, index] for name, index in self.numeric],
+                'categorical': [[name, offset, categories] for name, offset, categories in self.categorical]}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data['features'], data['numeric'], data['categorical'])
@@ -0,0 +1,374 @@
+"""Bounded flow table computing the KDD connection features incrementally.
+
+The model is trained on NSL-KDD connection records, whose traffic features
+are defined over sliding windows of *connections*:
+
+- the 2-second window: connections to the same destination host
+  (count, serror_rate, same_srv_rate, ...) and to the same service
+  (srv_count, srv_serror_rate, srv_diff_host_rate, ...);
+- the last-100-connections window: connections to the same destination
+  host (dst_host_*) and to the same service (dst_host_srv_*).
+
+Every window keeps running counters that are adjusted when a connection
+enters or leaves it, or when its TCP state changes its error class, so
+each packet costs O(1) amortised regardless of traffic volume.
+
+Memory is bounded three ways: flows are kept in LRU order and evicted on
+idle TTL or at `max_flows`; a time window holds at most
+`max_window_conns` connections (KDD's own count features saturate at
+511); and the host windows together hold at most `max_window_entries`
+connections, beyond which the least recently used host is dropped. Scans
+and SYN floods therefore hit eviction counters, not the allocator.
+
+The table is not thread-safe; it is owned by the capture thread.
+"""
+from collections import OrderedDict, deque
+
+# TCP header flag bits
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+ACK = 0x10
+URG = 0x20
+
+# Destination port -> KDD service name (anything else is private/other)
+TCP_SERVICES = {
+    20: 'ftp_data', 21: 'ftp', 22: 'ssh', 23: 'telnet', 25: 'smtp', 37: 'time',
+    43: 'whois', 53: 'domain', 70: 'gopher', 79: 'finger', 80: 'http',
+    102: 'iso_tsap', 105: 'csnet_ns', 109: 'pop_2', 110: 'pop_3', 111: 'sunrpc',
+    113: 'auth', 117: 'uucp_path', 119: 'nntp', 139: 'netbios_ssn', 143: 'imap4',
+    179: 'bgp', 194: 'IRC', 210: 'Z39_50', 389: 'ldap', 443: 'http_443',
+    512: 'exec', 513: 'login', 514: 'shell', 515: 'printer', 530: 'courier',
+    540: 'uucp', 543: 'klogin', 544: 'kshell', 6000: 'X11',
+}
+UDP_SERVICES = {
+    53: 'domain_u', 69: 'tftp_u', 123: 'ntp_u', 137: 'netbios_ns', 138: 'netbios_dgm',
+}
+ICMP_SERVICES = {8: 'eco_i', 0: 'ecr_i', 13: 'tim_i', 14: 'tim_i', 3: 'urp_i'}
+
+# KDD "SYN error" and "REJ error" connection flags
+SERROR_FLAGS = frozenset(('S0', 'S1', 'S2', 'S3'))
+RERROR_FLAGS = frozenset(('REJ',))
+
+
+def service_for(proto, dst_port, icmp_type=None):
+    """Map a protocol and destination port (or ICMP type) to a KDD service name."""
+    if proto == 'ICMP':
+        return ICMP_SERVICES.get(icmp_type, 'oth_i')
+    services = TCP_SERVICES if proto == 'TCP' else UDP_SERVICES
+    service = services.get(dst_port)
+    if service is None:
+        service = 'private' if dst_port is not None and dst_port < 1024 else 'other'
+    return service
+
+
+class Connection:
+    """One bidirectional flow, keyed by its originator's 5-tuple."""
+
+    __slots__ = (
+        'key', 'proto', 'src', 'dst', 'sport', 'dport', 'service', 'start', 'last',
+        'src_bytes', 'dst_bytes', 'urgent', 'syn', 'synack', 'established',
+        'orig_fin', 'resp_fin', 'orig_rst', 'resp_rst', 'flag', 'serror', 'rerror', 'windows',
+    )
+
+    def __init__(self, key, proto, src, dst, sport, dport, service, ts):
+        self.key = key
+        self.proto = proto
+        self.src = src
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.service = service
+        self.start = ts
+        self.last = ts
+        self.src_bytes = 0
+        self.dst_bytes = 0
+        self.urgent = 0
+        self.syn = self.synack = self.established = False
+        self.orig_fin = self.resp_fin = self.orig_rst = self.resp_rst = False
+        self.flag = 'SF' if proto != 'TCP' else 'OTH'
+        self.serror = False
+        self.rerror = False
+        self.windows = []
+
+    def observe_tcp(self, flags, from_orig):
+        """Advance the simplified Bro/KDD connection state machine."""
+        if from_orig:
+            if flags & SYN and not flags & ACK:
+                self.syn = True
+            if flags & FIN:
+                self.orig_fin = True
+            if flags & RST:
+                self.orig_rst = True
+            if self.synack and flags & ACK:
+                self.established = True
+        else:
+            if flags & SYN and flags & ACK:
+                self.synack = True
+            if flags & FIN:
+                self.resp_fin = True
+            if flags & RST:
+                self.resp_rst = True
+        if flags & URG:
+            self.urgent += 1
+        self.flag = self._tcp_flag()
+
+    def _tcp_flag(self):
+        if not self.syn:
+            return 'OTH'
+        if not self.synack:
+            if self.resp_rst:
+                return 'REJ'
+            if self.orig_rst:
+                return 'RSTOS0'
+            if self.orig_fin:
+                return 'SH'
+            return 'S0'
+        if self.orig_rst:
+            return 'RSTO'
+        if self.resp_rst:
+            return 'RSTR'
+        if self.orig_fin and self.resp_fin:
+            return 'SF'
+        if self.orig_fin:
+            return 'S2'
+        if self.resp_fin:
+            return 'S3'
+        return 'S1' if self.established else 'S0'
+
+
+class _Window:
+    """Running counters over a set of connections."""
+
+    __slots__ = ('conns', 'serror', 'rerror', 'services', 'hosts', 'srcs', 'sports')
+
+    def __init__(self):
+        self.conns = deque()
+        self.serror = 0
+        self.rerror = 0
+        self.services = {}
+        self.hosts = {}
+        self.srcs = {}
+        self.sports = {}
+
+    def __len__(self):
+        return len(self.conns)
+
+    @staticmethod
+    def _inc(counter, key, delta):
+        value = counter.get(key, 0) + delta
+        if value:
+            counter[key] = value
+        else:
+            del counter[key]
+
+    def add(self, conn):
+        self.conns.append(conn)
+        conn.windows.append(self)
+        self.serror += conn.serror
+        self.rerror += conn.rerror
+        self._inc(self.services, conn.service, 1)
+        self._inc(self.hosts, conn.dst, 1)
+        self._inc(self.srcs, conn.src, 1)
+        self._inc(self.sports, conn.sport, 1)
+
+    def pop_oldest(self):
+        conn = self.conns.popleft()
+        conn.windows.remove(self)
+        self.serror -= conn.serror
+        self.rerror -= conn.rerror
+        self._inc(self.services, conn.service, -1)
+        self._inc(self.hosts, conn.dst, -1)
+        self._inc(self.srcs, conn.src, -1)
+        self._inc(self.sports, conn.sport, -1)
+        return conn
+
+
+class FlowTable:
+    """Flow/connection table with KDD time- and count-window features."""
+
+    def __init__(self, max_flows=65536, flow_ttl=120.0, time_window=2.0, count_window=100,
+                 max_keys=8192, max_window_conns=511, max_window_entries=131072):
+        self.max_flows = max_flows
+        self.flow_ttl = flow_ttl
+        self.time_window = time_window
+        self.count_window = count_window
+        self.max_keys = max_keys
+        self.max_window_conns = max_window_conns
+        self.max_window_entries = max_window_entries
+        self.window_entries = 0  # Connections held by host_time + host_last
+        self.flows = OrderedDict()
+        # key -> window, LRU ordered so idle hosts/services are dropped first
+        self.host_time = OrderedDict()
+        self.srv_time = OrderedDict()
+        self.host_last = OrderedDict()
+        self.srv_last = OrderedDict()
+        self.evictions = {'flow_ttl': 0, 'flow_cap': 0, 'key_cap': 0, 'window_cap': 0, 'entry_cap': 0}
+
+    def _is_host_table(self, table):
+        return table is self.host_time or table is self.host_last
+
+    def _drop_lru(self, table, reason):
+        _, dropped = table.popitem(last=False)
+        if self._is_host_table(table):
+            self.window_entries -= len(dropped)
+        while dropped.conns:
+            dropped.pop_oldest()
+        self.evictions[reason] += 1
+
+    def _window(self, table, key):
+        window = table.get(key)
+        if window is None:
+            if len(table) >= self.max_keys:
+                self._drop_lru(table, 'key_cap')
+            window = table[key] = _Window()
+        else:
+            table.move_to_end(key)
+        return window
+
+    def _expire(self, window, now, table):
+        cutoff = now - self.time_window
+        conns = window.conns
+        expired = 0
+        while conns and conns[0].start < cutoff:
+            window.pop_oldest()
+            expired += 1
+        if expired and self._is_host_table(table):
+            self.window_entries -= expired
+
+    def _admit(self, table, key, conn, limit, capped):
+        window = self._window(table, key)
+        window.add(conn)
+        popped = 0
+        while len(window.conns) > limit:
+            window.pop_oldest()
+            popped += 1
+        if capped:
+            self.evictions['window_cap'] += popped
+        if self._is_host_table(table):
+            self.window_entries += 1 - popped
+        return window
+
+    def _evict_flows(self, now):
+        flows = self.flows
+        cutoff = now - self.flow_ttl
+        while flows:
+            conn = next(iter(flows.values()))
+            if conn.last >= cutoff:
+                break
+            flows.popitem(last=False)
+            self.evictions['flow_ttl'] += 1
+        while len(flows) > self.max_flows:
+            flows.popitem(last=False)
+            self.evictions['flow_cap'] += 1
+
+    def _reclassify(self, conn):
+        serror = conn.flag in SERROR_FLAGS
+        rerror = conn.flag in RERROR_FLAGS
+        if serror == conn.serror and rerror == conn.rerror:
+            return
+        ds = serror - conn.serror
+        dr = rerror - conn.rerror
+        for window in conn.windows:
+            window.serror += ds
+            window.rerror += dr
+        conn.serror = serror
+        conn.rerror = rerror
+
+    def _new_connection(self, key, proto, src, dst, sport, dport, ts, icmp_type):
+        service = service_for(proto, dport, icmp_type)
+        conn = Connection(key, proto, src, dst, sport, dport, service, ts)
+        self.flows[key] = conn
+        for table, wkey in ((self.host_time, dst), (self.srv_time, service)):
+            self._expire(self._window(table, wkey), ts, table)
+            self._admit(table, wkey, conn, self.max_window_conns, True)
+        for table, wkey in ((self.host_last, dst), (self.srv_last, service)):
+            self._admit(table, wkey, conn, self.count_window, False)
+        # Global budget: drop whole least-recently-used hosts, never the
+        # one this connection was just added to (it is most recent)
+        while self.window_entries > self.max_window_entries and len(self.host_last) > 1:
+            self._drop_lru(self.host_last, 'entry_cap')
+        while self.window_entries > self.max_window_entries and len(self.host_time) > 1:
+            self._drop_lru(self.host_time, 'entry_cap')
+        return conn
+
+    def update(self, ts, proto, src, dst, length, sport=0, dport=0, tcp_flags=0, icmp_type=None):
+        """Account one packet and return the KDD features of its connection."""
+        key = (proto, src, sport, dst, dport)
+        flows = self.flows
+        conn = flows.get(key)
+        from_orig = True
+        if conn is None:
+            reverse = flows.get((proto, dst, dport, src, sport))
+            if reverse is not None:
+                conn = reverse
+                from_orig = False
+            else:
+                conn = self._new_connection(key, proto, src, dst, sport, dport, ts, icmp_type)
+        flows.move_to_end(conn.key)
+        conn.last = ts
+        if from_orig:
+            conn.src_bytes += length
+        else:
+            conn.dst_bytes += length
+        if proto == 'TCP':
+            conn.observe_tcp(tcp_flags, from_orig)
+            self._reclassify(conn)
+        self._evict_flows(ts)
+        return self.features(conn, ts)
+
+    def features(self, conn, now):
+        """KDD traffic features for `conn` as of time `now`."""
+        host_time = self._window(self.host_time, conn.dst)
+        srv_time = self._window(self.srv_time, conn.service)
+        self._expire(host_time, now, self.host_time)
+        self._expire(srv_time, now, self.srv_time)
+        host_last = self._window(self.host_last, conn.dst)
+        srv_last = self._window(self.srv_last, conn.service)
+
+        count = len(host_time) or 1
+        srv_count = len(srv_time) or 1
+        dst_host_count = len(host_last) or 1
+        dst_host_srv_count = len(srv_last) or 1
+        same_srv_rate = host_time.services.get(conn.service, 0) / count
+        dst_host_same_srv_rate = host_last.services.get(conn.service, 0) / dst_host_count
+        return {
+            'duration': conn.last - conn.start,
+            'src_bytes': conn.src_bytes,
+            'dst_bytes': conn.dst_bytes,
+            'land': int(conn.src == conn.dst and conn.sport == conn.dport),
+            'urgent': conn.urgent,
+            'count': count,
+            'srv_count': srv_count,
+            'serror_rate': host_time.serror / count,
+            'srv_serror_rate': srv_time.serror / srv_count,
+            'rerror_rate': host_time.rerror / count,
+            'srv_rerror_rate': srv_time.rerror / srv_count,
+            'same_srv_rate': same_srv_rate,
+            'diff_srv_rate': 1.0 - same_srv_rate,
+            'srv_diff_host_rate': 1.0 - srv_time.hosts.get(conn.dst, 0) / srv_count,
+            'dst_host_count': dst_host_count,
+            'dst_host_srv_count': dst_host_srv_count,
+            'dst_host_same_srv_rate': dst_host_same_srv_rate,
+            'dst_host_diff_srv_rate': 1.0 - dst_host_same_srv_rate,
+            'dst_host_same_src_port_rate': host_last.sports.get(conn.sport, 0) / dst_host_count,
+            'dst_host_srv_diff_host_rate': 1.0 - srv_last.srcs.get(conn.src, 0) / dst_host_srv_count,
+            'dst_host_serror_rate': host_last.serror / dst_host_count,
+            'dst_host_srv_serror_rate': srv_last.serror / dst_host_srv_count,
+            'dst_host_rerror_rate': host_last.rerror / dst_host_count,
+            'dst_host_srv_rerror_rate': srv_last.rerror / dst_host_srv_count,
+            'service_' + conn.service: 1,
+            'flag_' + conn.flag: 1,
+        }
+
+    def stats(self):
+        """Table sizes and eviction counters."""
+        return {
+            'flows': len(self.flows),
+            'max_flows': self.max_flows,
+            'hosts': len(self.host_last),
+            'services': len(self.srv_last),
+            'window_entries': self.window_entries,
+            'max_window_entries': self.max_window_entries,
+            'evictions': dict(self.evictions),
+        }
@@ -0,0 +1,272 @@
+"""Buffered, rotating forensic log with a side index for tail and range reads.
+
+Malicious packets are queued by the capture thread and written by a
+background thread in batches (every `flush_rows` rows or `flush_interval`
+seconds, whichever comes first), so the capture path never opens files.
+
+The log is a directory of CSV segments, rotated by size and age. Next to
+every segment `forensic-<time>-<n>.csv` sits an append-only index
+`forensic-<time>-<n>.idx` with one line per block of `block_rows` rows:
+
+    start_offset,end_offset,min_timestamp,max_timestamp,rows,src1|src2|...
+
+Readers use it to seek straight to the blocks that can match a time range
+or source IP. Only the rows after the last indexed block (fewer than
+`block_rows`) are ever scanned without an index.
+"""
+import atexit
+import csv
+import io
+import os
+import queue
+import threading
+import time
+
+FIELDS = ['timestamp', 'src', 'dst', 'protocol', 'length', 'prediction']
+
+
+def _format_row(result):
+    buf = io.StringIO()
+    csv.writer(buf).writerow([result.get(field, '') for field in FIELDS])
+    return buf.getvalue().encode('utf-8')
+
+
+class ForensicLogWriter:
+    """Background writer for the segmented forensic log."""
+
+    def __init__(self, directory='forensic_logs', flush_rows=512, flush_interval=1.0,
+                 max_segment_bytes=16 * 1024 * 1024, max_segment_age=3600, block_rows=256,
+                 max_pending=100000):
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self.block_rows = block_rows
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._running = False
+        self._segment = None
+        self.dropped = 0
+        self.written = 0
+
+    def write(self, result):
+        """Queue a row; never blocks the caller (rows are dropped if the queue is full)."""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(result)
+        except queue.Full:
+            self.dropped += 1
+
+    def pending(self):
+        """Rows queued but not yet written."""
+        return self._queue.qsize()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name='forensic-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """Flush everything queued and close the current segment."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        pending = []
+        first_at = None
+        while self._running or not self._queue.empty():
+            timeout = self.flush_interval if first_at is None else max(0.0, first_at + self.flush_interval - time.monotonic())
+            try:
+                pending.append(self._queue.get(timeout=timeout))
+                if first_at is None:
+                    first_at = time.monotonic()
+            except queue.Empty:
+                pass
+            if pending and (len(pending) >= self.flush_rows or time.monotonic() - first_at >= self.flush_interval):
+                self._flush(pending)
+                pending = []
+                first_at = None
+        if pending:
+            self._flush(pending)
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _flush(self, rows):
+        try:
+            for result in rows:
+                segment = self._segment
+                if segment is None or segment.should_rotate(self.max_segment_bytes, self.max_segment_age):
+                    if segment is not None:
+                        segment.close()
+                    segment = self._segment = _Segment(self.directory, self.block_rows)
+                segment.append(result)
+            self._segment.flush()
+            self.written += len(rows)
+        except Exception as e:
+            print(f"Error writing forensic log: {e}")
+
+
+class _Segment:
+    """One open CSV segment plus the in-progress index block."""
+
+    _counter = 0
+
+    def __init__(self, directory, block_rows):
+        _Segment._counter += 1
+        base = os.path.join(directory, f"forensic-{time.strftime('%Y%m%d-%H%M%S')}-{_Segment._counter:04d}")
+        self.opened = time.time()
+        self.block_rows = block_rows
+        self.data = open(base + '.csv', 'ab')
+        self.index = open(base + '.idx', 'a')
+        if self.data.tell() == 0:
+            self.data.write(','.join(FIELDS).encode('utf-8') + b'\r\n')
+        self.offset = self.data.tell()
+        self._new_block()
+
+    def _new_block(self):
+        self.block_start = self.offset
+        self.block_count = 0
+        self.block_min = None
+        self.block_max = None
+        self.block_srcs = set()
+
+    def append(self, result):
+        line = _format_row(result)
+        self.data.write(line)
+        self.offset += len(line)
+        ts = str(result.get('timestamp', ''))
+        if self.block_min is None or ts < self.block_min:
+            self.block_min = ts
+        if self.block_max is None or ts > self.block_max:
+            self.block_max = ts
+        self.block_srcs.add(str(result.get('src', '')))
+        self.block_count += 1
+        if self.block_count >= self.block_rows:
+            self._close_block()
+
+    def _close_block(self):
+        if not self.block_count:
+            return
+        # Index lines are written only after the rows they point at
+        self.data.flush()
+        self.index.write(f"{self.block_start},{self.offset},{self.block_min},{self.block_max},"
+                         f"{self.block_count},{'|'.join(sorted(self.block_srcs))}\n")
+        self._new_block()
+
+    def flush(self):
+        self.data.flush()
+        self.index.flush()
+
+    def should_rotate(self, max_bytes, max_age):
+        return self.offset >= max_bytes or time.time() - self.opened >= max_age
+
+    def close(self):
+        self._close_block()
+        self.data.close()
+        self.index.close()
+
+
+# Reading -------------------------------------------------------------------
+
+def list_segments(directory):
+    """Segment base paths (without extension), oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name[:-4] for name in os.listdir(directory)
+                   if name.startswith('forensic-') and name.endswith('.csv'))
+    return [os.path.join(directory, name) for name in names]
+
+
+def _load_index(base):
+    blocks = []
+    try:
+        with open(base + '.idx') as f:
+            for line in f:
+                parts = line.rstrip('\n').split(',', 5)
+                if not line.endswith('\n') or len(parts) < 6:
+                    continue  # Partially written last line
+                start, end, min_ts, max_ts, rows, srcs = parts
+                blocks.append((int(start), int(end), min_ts, max_ts, set(srcs.split('|'))))
+    except FileNotFoundError:
+        pass
+    return blocks
+
+
+def _read_rows(f, start, end=None):
+    f.seek(start)
+    data = f.read() if end is None else f.read(end - start)
+    text = data.decode('utf-8', errors='replace')
+    if end is None and not text.endswith('\n'):
+        # Drop a row the writer has not finished flushing
+        text = text[:text.rfind('\n') + 1]
+    return [dict(zip(FIELDS, row)) for row in csv.reader(io.StringIO(text)) if len(row) == len(FIELDS)]
+
+
+def tail(directory, n=100):
+    """The last `n` rows across segments, oldest first, reading only from the end."""
+    rows = []
+    for base in reversed(list_segments(directory)):
+        path = base + '.csv'
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            f.readline()
+            header_end = f.tell()
+            # Grow the window from the end until it holds enough lines
+            window = 8192
+            while True:
+                start = max(header_end, size - window)
+                f.seek(start)
+                chunk = f.read(size - start)
+                if start > header_end:
+                    chunk = chunk[chunk.find(b'\n') + 1:]
+                if chunk.count(b'\n') >= n - len(rows) or start == header_end:
+                    break
+                window *= 4
+            segment_rows = _read_rows(io.BytesIO(chunk), 0)
+        rows = segment_rows[-(n - len(rows)):] + rows if n > len(rows) else rows
+        if len(rows) >= n:
+            break
+    return rows[-n:] if n else []
+
+
+def query(directory, start=None, end=None, src=None, limit=1000):
+    """Rows with start <= timestamp <= end (inclusive strings) and matching src.
+
+    Only index blocks whose time span and source set can match are read.
+    Returns at most `limit` rows, oldest first.
+    """
+    results = []
+    for base in list_segments(directory):
+        path = base + '.csv'
+        blocks = _load_index(base)
+        ranges = [(b_start, b_end) for b_start, b_end, min_ts, max_ts, srcs in blocks
+                  if (start is None or max_ts >= start) and (end is None or min_ts <= end)
+                  and (src is None or src in srcs)]
+        indexed_end = blocks[-1][1] if blocks else None
+        if indexed_end is not None and indexed_end >= os.path.getsize(path) and not ranges:
+            continue  # Fully indexed and nothing can match: never opened
+        with open(path, 'rb') as f:
+            if indexed_end is None:
+                f.readline()
+                indexed_end = f.tell()
+            ranges.append((indexed_end, None))
+            for b_start, b_end in ranges:
+                for row in _read_rows(f, b_start, b_end):
+                    ts = row['timestamp']
+                    if (start is None or ts >= start) and (end is None or ts <= end) \
+                            and (src is None or row['src'] == src):
+                        results.append(row)
+                        if len(results) >= limit:
+                            return results
+    return results
@@ -0,0 +1,183 @@
+"""A trained random forest flattened into plain NumPy arrays.
+
+All trees' nodes are concatenated into a handful of arrays (split
+feature, threshold, left/right child, per-class leaf probabilities) and
+saved as .npy files, one per array. Loading them with mmap_mode='r'
+maps the files read-only, so every process serving the same model
+version shares one copy through the page cache instead of unpickling
+its own forest.
+
+Leaves point at themselves, so batch traversal is a fixed number of
+vectorized steps (the deepest tree's depth) over a (rows, trees) matrix
+of node indices, with no per-node branching. A single row instead walks
+each tree in plain Python over memoryviews of the same arrays, which
+avoids NumPy call overhead per step and sklearn's input validation and
+per-estimator dispatch entirely. Missing values (NaN) follow each
+split's learned missing-value direction, as in sklearn. Predictions match the scikit-learn
+model they were exported from (verify_parity checks this at export).
+"""
+import json
+import os
+
+import numpy as np
+
+FOREST_DIR = 'forest'
+ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+# Absent from forests exported before NaN routing; NaN then always goes right
+OPTIONAL_ARRAYS = ('missing_left',)
+
+
+def supported(model):
+    """True for fitted single-output tree classifiers and forests of them."""
+    estimators = getattr(model, 'estimators_', [model])
+    return (hasattr(model, 'classes_') and getattr(model, 'n_outputs_', 1) == 1
+            and all(hasattr(e, 'tree_') for e in np.ravel(estimators)))
+
+
+def export(model, directory):
+    """Write a fitted RandomForestClassifier (or single tree) as arrays under `directory`."""
+    estimators = getattr(model, 'estimators_', [model])
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError('Only single-output classifiers can be exported')
+    features, thresholds, lefts, rights, values, roots, missing = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in estimators:
+        tree = estimator.tree_
+        n = tree.node_count
+        leaf = tree.children_left == -1
+        nodes = np.arange(n)
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold).astype(np.float64))
+        lefts.append((np.where(leaf, nodes, tree.children_left) + offset).astype(np.int32))
+        rights.append((np.where(leaf, nodes, tree.children_right) + offset).astype(np.int32))
+        go_left = getattr(tree, 'missing_go_to_left', np.zeros(n, dtype=bool))
+        missing.append((np.asarray(go_left, dtype=bool) & ~leaf).astype(np.uint8))
+        value = tree.value[:, 0, :].astype(np.float64)
+        totals = value.sum(axis=1, keepdims=True)
+        values.append(np.divide(value, totals, out=np.zeros_like(value), where=totals > 0))
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, int(tree.max_depth))
+    os.makedirs(directory, exist_ok=True)
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts),
+        'right': np.concatenate(rights),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int64),
+        'missing_left': np.concatenate(missing),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, name + '.npy'), array)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'classes': [c.item() if hasattr(c, 'item') else c for c in model.classes_],
+                   'n_features': int(model.n_features_in_), 'max_depth': max_depth,
+                   'n_trees': len(estimators)}, f)
+
+
+def exists(directory):
+    return os.path.exists(os.path.join(directory, 'meta.json'))
+
+
+class ArrayForest:
+    """Read-only forest backed by (memory-mapped) arrays; predict/predict_proba like sklearn."""
+
+    def __init__(self, directory, mmap=True):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode))
+        for name in OPTIONAL_ARRAYS:
+            path = os.path.join(directory, name + '.npy')
+            setattr(self, name, np.load(path, mmap_mode=mode) if os.path.exists(path) else None)
+        self.classes_ = np.asarray(meta['classes'])
+        self.n_features_in_ = meta['n_features']
+        self.max_depth = meta['max_depth']
+        self.n_trees = meta['n_trees']
+
+        self._views = None
+        self._roots = [int(root) for root in self.roots]
+
+    def _proba_one(self, x):
+        """Class probabilities for one row (a list of Python floats), as a list."""
+        if self._views is None:
+            # Views share the (mapped) arrays; indexing them yields plain ints/floats
+            self._views = tuple(memoryview(a) for a in
+                                (self.feature, self.threshold, self.left, self.right, self.value))
+        feature, threshold, left, right, value = self._views
+        if self.missing_left is not None and any(v != v for v in x):
+            missing_left = memoryview(self.missing_left)
+        else:
+            missing_left = None
+        n_classes = len(self.classes_)
+        proba = None
+        for node in self._roots:
+            while True:
+                v = x[feature[node]]
+                if v <= threshold[node] or (missing_left is not None and v != v and missing_left[node]):
+                    child = left[node]
+                else:
+                    child = right[node]
+                if child == node:
+                    break
+                node = child
+            # Summed tree by tree, in the same order as sklearn, for bit-identical ties
+            if proba is None:
+                proba = [value[node, c] for c in range(n_classes)]
+            else:
+                for c in range(n_classes):
+                    proba[c] += value[node, c]
+        return [p / self.n_trees for p in proba]
+
+    def _leaves(self, X):
+        """(rows, trees) matrix of leaf indices, all trees stepped together."""
+        n_rows, n_features = X.shape
+        flat = X.ravel()
+        row_base = (np.arange(n_rows, dtype=np.int32) * n_features)[:, None]
+        node = np.broadcast_to(self.roots.astype(np.int32), (n_rows, self.n_trees)).copy()
+        feature, threshold, left, right = self.feature, self.threshold, self.left, self.right
+        missing_left = self.missing_left if self.missing_left is not None and np.isnan(flat).any() else None
+        for _ in range(self.max_depth):
+            x = flat.take(row_base + feature.take(node))
+            go_left = x <= threshold.take(node)
+            if missing_left is not None:
+                go_left |= np.isnan(x) & missing_left.take(node).astype(bool)
+            node = np.where(go_left, left.take(node), right.take(node))
+        return node
+
+    def predict_proba(self, X):
+        # sklearn trees split on float32 copies of the input
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if len(X) == 1:
+            return np.asarray([self._proba_one(X[0].astype(np.float64).tolist())])
+        leaves = self._leaves(X)
+        value = self.value
+        proba = value.take(leaves[:, 0], axis=0)
+        for t in range(1, self.n_trees):
+            proba += value.take(leaves[:, t], axis=0)
+        return proba / self.n_trees
+
+    def predict(self, X):
+        X = np.asarray(X)
+        if X.ndim == 2 and len(X) == 1:
+            # Single-row fast path: no NumPy work beyond the float conversion
+            proba = self._proba_one(X[0].astype(np.float32).astype(np.float64).tolist())
+            return self.classes_[[proba.index(max(proba))]]
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def verify_parity(model, forest, X):
+    """Raise AssertionError unless `forest` predicts exactly like `model` on X (row by row too)."""
+    X = np.asarray(X, dtype=np.float64)
+    expected = model.predict(X)
+    if not np.array_equal(forest.predict(X), expected):
+        raise AssertionError('Array forest batch predictions differ from the sklearn model')
+    for i in range(min(len(X), 200)):
+        if forest.predict(X[i:i + 1])[0] != expected[i]:
+            raise AssertionError(f'Array forest single-row prediction differs on row {i}')
+    return len(X)
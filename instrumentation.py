@@ -0,0 +1,480 @@
+"""Pipeline telemetry: stage latency histograms, event rates, lock waits, queue depths.
+
+Stages (capture decode/extract/predict, forensic logging, alerting, the
+/predict steps, every HTTP endpoint) record durations into fixed-bucket
+histograms: one bisect and a few integer adds per call. A sampler thread
+reads process CPU and RSS (psutil when installed, /proc otherwise) every
+SAMPLE_SECONDS and turns counters into per-second rates and stage time
+into `busy` seconds per second, which shows the stage that saturates
+first.
+
+Every process has its own registry. When IDS_TELEMETRY_DIR is set (as
+serve.py does), each sampler also writes its snapshot there, so any API
+worker can export the capture process and the other workers as well.
+IDS_TELEMETRY=0 turns the stage timers into no-ops.
+"""
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:  # /proc is read instead
+    psutil = None
+
+TELEMETRY_ENABLED = os.environ.get('IDS_TELEMETRY', '1') != '0'
+SAMPLE_SECONDS = float(os.environ.get('IDS_TELEMETRY_SAMPLE_SECONDS', 5.0))
+TELEMETRY_DIR = os.environ.get('IDS_TELEMETRY_DIR')  # Shared snapshots of every process, if set
+# Histogram upper bounds in seconds, 1 us to 10 s in 1-2.5-5 steps (plus an overflow bucket)
+BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 1) for m in (1, 2.5, 5)) + (10.0,)
+
+
+class Histogram:
+    """Counts of observations per BUCKETS bucket, with their sum."""
+
+    __slots__ = ('counts', 'count', 'total', '_lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {'buckets': list(self.counts), 'count': self.count, 'sum': self.total}
+
+
+def quantile(buckets, q):
+    """Upper bound of the bucket holding the q-th observation (None if empty)."""
+    count = sum(buckets)
+    if not count:
+        return None
+    rank = q * count
+    seen = 0
+    for bound, n in zip(BUCKETS + (float('inf'),), buckets):
+        seen += n
+        if seen >= rank:
+            return bound
+    return BUCKETS[-1]
+
+
+class InstrumentedLock:
+    """A threading.Lock that records how long contended acquisitions waited.
+
+    Uncontended acquisitions are only counted, not timed.
+    """
+
+    def __init__(self, name, lock=None):
+        self.name = name
+        self._lock = lock if lock is not None else threading.Lock()
+        self.acquisitions = 0  # Updated while holding the lock
+        self.contended = 0
+        self.wait = Histogram()
+        TELEMETRY.locks[name] = self
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self._lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        if not self._lock.acquire(True, timeout):
+            return False
+        self.acquisitions += 1
+        self.contended += 1
+        self.wait.observe(time.perf_counter() - started)
+        return True
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self):
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def snapshot(self):
+        return {'acquisitions': self.acquisitions, 'contended': self.contended, 'wait': self.wait.snapshot()}
+
+
+def _read_proc(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    statm = _read_proc('/proc/self/statm')
+    return int(statm.split()[1]) * os.sysconf('SC_PAGE_SIZE') if statm else None
+
+
+def _total_memory():
+    if psutil is not None:
+        return psutil.virtual_memory().total
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _network_bytes():
+    """Bytes sent and received on all non-loopback interfaces since boot."""
+    if psutil is not None:
+        counters = psutil.net_io_counters(pernic=True)
+        return sum(c.bytes_sent + c.bytes_recv for nic, c in counters.items() if nic != 'lo')
+    dev = _read_proc('/proc/net/dev')
+    if dev is None:
+        return None
+    total = 0
+    for line in dev.splitlines()[2:]:
+        nic, _, fields = line.partition(':')
+        fields = fields.split()
+        if nic.strip() != 'lo' and len(fields) > 8:
+            total += int(fields[0]) + int(fields[8])
+    return total
+
+
+class Telemetry:
+    """This process's stages, counters, locks and gauges."""
+
+    def __init__(self):
+        self.role = 'main'
+        self.stages = {}  # name -> Histogram
+        self.counters = {}  # name -> int
+        self.locks = {}  # name -> InstrumentedLock
+        self.gauges = {}  # name -> callable returning a number
+        self.process = {}  # Last CPU/RSS/network sample
+        self._rates = {}  # counter -> events per second over the last interval
+        self._busy = {}  # stage -> seconds spent per second over the last interval
+        self._previous = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def stage(self, name):
+        histogram = self.stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.stages.setdefault(name, Histogram())
+        return histogram
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def sample(self):
+        """Take a CPU/RSS/network sample and update rates since the previous one."""
+        now = time.monotonic()
+        times = os.times()
+        cpu = times.user + times.system
+        network = _network_bytes()
+        with self._lock:
+            counters = dict(self.counters)
+        sums = {name: histogram.total for name, histogram in list(self.stages.items())}
+        rss = _rss_bytes()
+        total_memory = _total_memory()
+        process = {'rss_bytes': rss, 'threads': threading.active_count(),
+                   'memory_percent': round(rss / total_memory * 100, 2) if rss and total_memory else None,
+                   'cpu_percent': None, 'network_bytes_per_s': None}
+        previous = self._previous
+        if previous is not None:
+            elapsed = max(now - previous['at'], 1e-9)
+            process['cpu_percent'] = round((cpu - previous['cpu']) / elapsed * 100, 1)
+            if network is not None and previous['network'] is not None:
+                process['network_bytes_per_s'] = int((network - previous['network']) / elapsed)
+            self._rates = {name: round((value - previous['counters'].get(name, 0)) / elapsed, 2)
+                           for name, value in counters.items()}
+            self._busy = {name: round((value - previous['sums'].get(name, 0.0)) / elapsed, 4)
+                          for name, value in sums.items()}
+        self._previous = {'at': now, 'cpu': cpu, 'network': network, 'counters': counters, 'sums': sums}
+        process['sampled_at'] = time.time()
+        self.process = process
+
+    def snapshot(self):
+        """Everything recorded so far, as JSON-compatible data."""
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                gauges[name] = read()
+            except Exception:
+                gauges[name] = None
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'role': self.role,
+            'pid': os.getpid(),
+            'cpu_count': os.cpu_count() or 1,
+            'process': dict(self.process),
+            'stages': {name: dict(histogram.snapshot(), busy=self._busy.get(name, 0.0))
+                       for name, histogram in list(self.stages.items())},
+            'counters': {name: {'total': total, 'rate': self._rates.get(name, 0.0)} for name, total in counters.items()},
+            'locks': {name: lock.snapshot() for name, lock in list(self.locks.items())},
+            'gauges': gauges,
+        }
+
+    def _path(self, directory, pid=None):
+        return os.path.join(directory, f'{self.role}-{pid or os.getpid()}.json')
+
+    def _publish(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = self._path(directory)
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(self.snapshot(), f, default=str)
+        os.replace(f'{path}.tmp', path)
+
+    def _unpublish(self, directory):
+        try:
+            os.remove(self._path(directory))
+        except OSError:
+            pass
+
+    def start(self, role, directory=TELEMETRY_DIR, interval=SAMPLE_SECONDS):
+        """Name this process and start the sampler (once)."""
+        with self._lock:
+            self.role = role
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(directory, interval),
+                                            name='telemetry-sampler', daemon=True)
+        self.sample()
+        self._thread.start()
+        if directory:
+            atexit.register(self._unpublish, directory)
+
+    def _run(self, directory, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.sample()
+                if directory:
+                    self._publish(directory)
+            except Exception as e:
+                print(f"Error sampling telemetry: {e}")
+
+
+TELEMETRY = Telemetry()
+
+
+def observe(name, seconds):
+    """Record one `seconds`-long run of stage `name`."""
+    if TELEMETRY_ENABLED:
+        TELEMETRY.stage(name).observe(seconds)
+
+
+def count(name, n=1):
+    """Add `n` events to counter `name`."""
+    if TELEMETRY_ENABLED:
+        TELEMETRY.count(name, n)
+
+
+def gauge(name, read):
+    """Report `read()` (e.g. a queue depth) as `name` in every snapshot."""
+    TELEMETRY.gauges[name] = read
+
+
+def stage(name):
+    """Decorator timing every call as stage `name`; returns the function unchanged when disabled."""
+    def decorate(fn):
+        if not TELEMETRY_ENABLED:
+            return fn
+        histogram = TELEMETRY.stage(name)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return timed
+    return decorate
+
+
+class Stopwatch:
+    """Times consecutive steps of one request: lap(name) records the time since the last lap."""
+
+    __slots__ = ('_last',)
+
+    def __init__(self):
+        self._last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        observe(name, now - self._last)
+        self._last = now
+
+
+def start(role):
+    TELEMETRY.start(role)
+
+
+def collect(directory=TELEMETRY_DIR, max_age=None):
+    """This process's snapshot plus the recent ones other processes wrote to `directory`."""
+    snapshots = [TELEMETRY.snapshot()]
+    if not directory or not os.path.isdir(directory):
+        return snapshots
+    max_age = max_age or 3 * SAMPLE_SECONDS
+    now = time.time()
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not name.endswith('.json') or name == os.path.basename(TELEMETRY._path(directory)):
+            continue
+        try:
+            if now - os.path.getmtime(path) > max_age:
+                continue  # Process has exited or stalled
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge_histograms(histograms):
+    buckets = [0] * (len(BUCKETS) + 1)
+    for histogram in histograms:
+        buckets = [a + b for a, b in zip(buckets, histogram['buckets'])]
+    return buckets
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def summary(snapshots=None):
+    """A compact view across processes for /system-status: busiest stages first."""
+    snapshots = snapshots if snapshots is not None else collect()
+    stages, counters, gauges, locks = {}, {}, {}, {}
+    for snap in snapshots:
+        for name, data in snap['stages'].items():
+            stages.setdefault(name, []).append(data)
+        for name, data in snap['counters'].items():
+            counters[name] = round(counters.get(name, 0) + data['rate'], 2)
+        for name, value in snap['gauges'].items():
+            if value is not None:
+                gauges[name] = gauges.get(name, 0) + value
+        for name, data in snap['locks'].items():
+            locks.setdefault(name, []).append(data)
+    stage_summary = {}
+    for name, parts in stages.items():
+        buckets = _merge_histograms(parts)
+        calls = sum(part['count'] for part in parts)
+        stage_summary[name] = {
+            'calls': calls,
+            'mean_ms': _ms(sum(part['sum'] for part in parts) / calls) if calls else None,
+            'p50_ms': _ms(quantile(buckets, 0.5)),
+            'p99_ms': _ms(quantile(buckets, 0.99)),
+            'busy': round(sum(part.get('busy', 0.0) for part in parts), 4),  # Seconds per second
+        }
+    lock_summary = {}
+    for name, parts in locks.items():
+        acquisitions = sum(part['acquisitions'] for part in parts)
+        contended = sum(part['contended'] for part in parts)
+        lock_summary[name] = {
+            'acquisitions': acquisitions,
+            'contended_percent': round(contended / acquisitions * 100, 2) if acquisitions else 0.0,
+            'wait_p99_ms': _ms(quantile(_merge_histograms([part['wait'] for part in parts]), 0.99)),
+        }
+    return {
+        'stages': dict(sorted(stage_summary.items(), key=lambda item: -item[1]['busy'])),
+        'rates_per_s': counters,
+        'queues': gauges,
+        'locks': lock_summary,
+        'processes': [{'role': snap['role'], 'pid': snap['pid'], **snap['process']} for snap in snapshots],
+    }
+
+
+def health(snapshots=None):
+    """cpu_usage and memory_usage (percent of the machine) and network_load (bytes/s) of all processes."""
+    snapshots = snapshots if snapshots is not None else collect()
+    processes = [snap['process'] for snap in snapshots]
+    cpu = [p['cpu_percent'] for p in processes if p.get('cpu_percent') is not None]
+    memory = [p['memory_percent'] for p in processes if p.get('memory_percent') is not None]
+    network = [p['network_bytes_per_s'] for p in processes if p.get('network_bytes_per_s') is not None]
+    return {
+        'cpu_usage': round(sum(cpu) / snapshots[0]['cpu_count'], 1) if cpu else 0,
+        'memory_usage': round(sum(memory), 2) if memory else 0,
+        'network_load': max(network) if network else 0,  # Host-wide, the same in every process
+        'rss_bytes': sum(p.get('rss_bytes') or 0 for p in processes),
+        'processes': len(snapshots),
+    }
+
+
+def _labels(**labels):
+    return ','.join(f'{key}="{str(value)}"' for key, value in labels.items())
+
+
+def _histogram_lines(metric, histogram, labels):
+    lines = []
+    cumulative = 0
+    for bound, n in zip(BUCKETS + (float('inf'),), histogram['buckets']):
+        cumulative += n
+        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+        lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+    lines.append(f'{metric}_sum{{{labels}}} {histogram["sum"]:.9g}')
+    lines.append(f'{metric}_count{{{labels}}} {histogram["count"]}')
+    return lines
+
+
+def prometheus(snapshots=None):
+    """Prometheus text exposition format, one `process` label per process."""
+    snapshots = snapshots if snapshots is not None else collect()
+    sections = {
+        'ids_stage_seconds': ('histogram', 'Time spent per call of a pipeline stage.', []),
+        'ids_stage_busy_ratio': ('gauge', 'Seconds spent in a stage per second, over the last sample.', []),
+        'ids_events_total': ('counter', 'Events counted by the pipeline.', []),
+        'ids_lock_wait_seconds': ('histogram', 'Time spent waiting for a contended lock.', []),
+        'ids_lock_acquisitions_total': ('counter', 'Lock acquisitions.', []),
+        'ids_lock_contended_total': ('counter', 'Lock acquisitions that had to wait.', []),
+        'ids_queue_depth': ('gauge', 'Items waiting in a buffer or queue.', []),
+        'ids_process_cpu_percent': ('gauge', 'Process CPU use over the last sample (100 = one core).', []),
+        'ids_process_resident_bytes': ('gauge', 'Process resident memory.', []),
+        'ids_network_bytes_per_second': ('gauge', 'Host network traffic over the last sample.', []),
+    }
+    for snap in snapshots:
+        process = f'{snap["role"]}-{snap["pid"]}'
+        for name, data in snap['stages'].items():
+            labels = _labels(process=process, stage=name)
+            sections['ids_stage_seconds'][2].extend(_histogram_lines('ids_stage_seconds', data, labels))
+            sections['ids_stage_busy_ratio'][2].append(f'ids_stage_busy_ratio{{{labels}}} {data.get("busy", 0.0)}')
+        for name, data in snap['counters'].items():
+            sections['ids_events_total'][2].append(
+                f'ids_events_total{{{_labels(process=process, event=name)}}} {data["total"]}')
+        for name, data in snap['locks'].items():
+            labels = _labels(process=process, lock=name)
+            sections['ids_lock_wait_seconds'][2].extend(_histogram_lines('ids_lock_wait_seconds', data['wait'], labels))
+            sections['ids_lock_acquisitions_total'][2].append(f'ids_lock_acquisitions_total{{{labels}}} {data["acquisitions"]}')
+            sections['ids_lock_contended_total'][2].append(f'ids_lock_contended_total{{{labels}}} {data["contended"]}')
+        for name, value in snap['gauges'].items():
+            if value is not None:
+                sections['ids_queue_depth'][2].append(f'ids_queue_depth{{{_labels(process=process, queue=name)}}} {value}')
+        labels = _labels(process=process)
+        for metric, key in (('ids_process_cpu_percent', 'cpu_percent'), ('ids_process_resident_bytes', 'rss_bytes'),
+                            ('ids_network_bytes_per_second', 'network_bytes_per_s')):
+            if snap['process'].get(key) is not None:
+                sections[metric][2].append(f'{metric}{{{labels}}} {snap["process"][key]}')
+    lines = []
+    for metric, (kind, help_text, samples) in sections.items():
+        if samples:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}'] + samples
+    return '\n'.join(lines) + '\n'
@@ -1,261 +1,528 @@
-import pyshark
 import joblib
-import pandas as pd
+import numpy as np
+import socket
 import threading
 import time
-import csv
 import os
-from threat_alert_system import process_threat
+from packet_features import PacketFeatureEncoder
+from micro_batcher import MicroBatcher
+from flow_table import FlowTable
+import shared_state
+from forensic_store import ForensicLogWriter
+from packet_decoder import LINKTYPE_ETHERNET, decode_frame, decode_pyshark, iter_pcap_packets
+import model_store
+import forest_arrays
+from model_registry import ModelRegistry
+import instrumentation
+import profiling
+from threat_alert_system import process_threat, get_alerts, get_alert_stats
+
+try:
+    import pyshark
+except ImportError:  # Only needed for the pyshark fallback backend
+    pyshark = None
 
 MODEL_PATH = 'rf_model.joblib'
 FEATURES_PATH = 'features.txt'
+MODELS_DIR = model_store.MODELS_DIR  # Versioned models written by the API's retrains
+MODEL_POLL_SECONDS = 2.0  # A retrain is picked up within this many seconds
 INTERFACE = None  # Will auto-detect or use default
-FORENSIC_LOG = 'forensic_log.csv'
+# Packet source: 'raw' (AF_PACKET socket + built-in decoder) or 'pyshark'
+CAPTURE_BACKEND = os.environ.get('IDS_CAPTURE_BACKEND', 'raw')
+FORENSIC_LOG_DIR = 'forensic_logs'  # Rotating CSV segments + side indexes
 
-# Load model and features
-try:
-    MODEL = joblib.load(MODEL_PATH)
-    with open(FEATURES_PATH) as f:
-        FEATURE_LIST = [line.strip() for line in f.readlines()]
-    print(f"Model loaded successfully with {len(FEATURE_LIST)} features")
+# Micro-batching between capture and inference: a batch is scored once it
+# holds BATCH_SIZE packets or its oldest packet has waited BATCH_DEADLINE_MS
+BATCH_SIZE = int(os.environ.get('IDS_BATCH_SIZE', 256))
+BATCH_DEADLINE_MS = float(os.environ.get('IDS_BATCH_DEADLINE_MS', 20))
+BATCH_STATS_INTERVAL = 10  # Seconds between batch fill/latency reports
+
+class ActiveModel:
+    """A model bundle and the packet encoder for its feature list."""
+
+    __slots__ = ('bundle', 'encoder', 'version')
+
+    def __init__(self, bundle):
+        self.bundle = bundle
+        self.encoder = PacketFeatureEncoder(bundle.feature_list)
+        self.version = bundle.version
+
+def _load_legacy_model():
+    # Flat rf_model.joblib/features.txt, used until a versioned model exists
+    try:
+        model = joblib.load(MODEL_PATH)
+        with open(FEATURES_PATH) as f:
+            feature_list = [line.strip() for line in f.readlines()]
+        forest_path = model_store.legacy_forest_dir(MODEL_PATH)
+        forest = forest_arrays.ArrayForest(forest_path) if forest_arrays.exists(forest_path) else None
+        return model_store.ModelBundle(model, None, feature_list, forest=forest)
+    except Exception as e:
+        print(f"Error loading model or features: {e}")
+        return None
+
+def _on_model_change(bundle):
+    global ACTIVE, FEATURE_LIST
+    ACTIVE = ActiveModel(bundle)
+    FEATURE_LIST = bundle.feature_list
+    print(f"Model version {bundle.version} loaded with {len(FEATURE_LIST)} features")
     print(f"First few features: {FEATURE_LIST[:5]}")
     print(f"Last few features: {FEATURE_LIST[-5:]}")
-except Exception as e:
-    print(f"Error loading model or features: {e}")
-    MODEL = None
-    FEATURE_LIST = []
 
-live_predictions = []  # Shared list for API
-lock = threading.Lock()
+# Set up by init() in the process that captures (capture_loop, replay_pcap,
+# __main__). The API imports this module for live_predictions only, so its
+# workers start no model watcher, forensic writer or flow table.
+ACTIVE = None
+FEATURE_LIST = []
+REGISTRY = None
+FLOW_TABLE = None
+FORENSIC_WRITER = None
+_init_lock = threading.Lock()
 
-# Ensure forensic log file exists with headers
-if not os.path.exists(FORENSIC_LOG):
-    with open(FORENSIC_LOG, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(['timestamp', 'src', 'dst', 'protocol', 'length', 'prediction'])
+# Shared with the API: the last LIVE_BUFFER_SIZE predictions, read by cursor.
+# An in-process ring, or with IDS_STATE_BACKEND=sqlite a table the API
+# workers read while capture runs as its own process (see serve.py)
+LIVE_BUFFER_SIZE = 1000
+lock = instrumentation.InstrumentedLock('live_predictions')
+live_predictions = shared_state.open_live_buffer(LIVE_BUFFER_SIZE, lock)
+# Alerts raised here and by the API's /test-alert, read by /alerts and /alert-stats
+alert_log = shared_state.open_alert_log(get_alerts, get_alert_stats)
 
-print(f"Starting live capture on interface: {INTERFACE}")
-try:
-    if INTERFACE:
-        capture = pyshark.LiveCapture(interface=INTERFACE)
-    else:
-        capture = pyshark.LiveCapture()  # Use default interface
-    print("Live capture initialized successfully")
-except Exception as e:
-    print(f"Error initializing live capture: {e}")
-    print("Trying to list available interfaces...")
+def init():
+    """Load the model and start the capture-side state and threads; safe to call twice."""
+    global REGISTRY, FLOW_TABLE, FORENSIC_WRITER
+    with _init_lock:
+        if REGISTRY is not None:
+            return
+        # The scoring model is hot-swapped: the registry maps the current version's
+        # trees read-only (shared with every other process) and a watcher thread
+        # switches ACTIVE when models/CURRENT changes, without restarting capture.
+        registry = ModelRegistry(MODELS_DIR, poll_interval=MODEL_POLL_SECONDS,
+                                 fallback=None if model_store.current_version(MODELS_DIR) is not None
+                                 else _load_legacy_model())
+        registry.add_listener(_on_model_change)
+        if registry.refresh() is not None and ACTIVE is None:
+            _on_model_change(registry.current())
+        registry.watch()
+        # Connection state for the KDD time/count-window features. Only the
+        # capture (or replay) thread touches it.
+        FLOW_TABLE = FlowTable()
+        # Malicious packets are written by a background thread in batches
+        FORENSIC_WRITER = ForensicLogWriter(FORENSIC_LOG_DIR)
+        instrumentation.gauge('forensic_write_queue', FORENSIC_WRITER.pending)
+        REGISTRY = registry
+
+class CaptureBackend:
+    """A packet source that yields DecodedPacket objects (None for non-IP frames)."""
+    name = None
+
+    def packets(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class RawSocketBackend(CaptureBackend):
+    """Linux AF_PACKET socket decoded by the built-in header parser."""
+    name = 'raw'
+    ETH_P_ALL = 0x0003
+
+    def __init__(self, interface=None):
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(self.ETH_P_ALL))
+        if interface:
+            self.sock.bind((interface, 0))
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+
+    def packets(self):
+        recv = self.sock.recv
+        while True:
+            frame = recv(65535)
+            started = time.perf_counter()
+            packet = decode_frame(frame, LINKTYPE_ETHERNET, time.time(), len(frame))
+            instrumentation.observe('capture.decode', time.perf_counter() - started)
+            yield packet
+
+    def close(self):
+        self.sock.close()
+
+class PcapFileBackend(CaptureBackend):
+    """pcap/pcapng file decoded by the built-in header parser."""
+    name = 'pcap'
+
+    def __init__(self, path):
+        self.path = path
+
+    def packets(self):
+        packets = iter_pcap_packets(self.path)
+        while True:
+            # Reading and decoding happen together in the pcap reader
+            started = time.perf_counter()
+            packet = next(packets, StopIteration)
+            if packet is StopIteration:
+                return
+            instrumentation.observe('capture.decode', time.perf_counter() - started)
+            yield packet
+
+class PysharkBackend(CaptureBackend):
+    """tshark dissection via pyshark; slow, but understands every link type."""
+    name = 'pyshark'
+
+    def __init__(self, interface=None, path=None):
+        if pyshark is None:
+            raise RuntimeError("pyshark is not installed")
+        if path:
+            self.capture = pyshark.FileCapture(path, keep_packets=False)
+        elif interface:
+            self.capture = pyshark.LiveCapture(interface=interface)
+        else:
+            self.capture = pyshark.LiveCapture()  # Use default interface
+        self.live = not path
+
+    def packets(self):
+        source = self.capture.sniff_continuously() if self.live else self.capture
+        for packet in source:
+            started = time.perf_counter()
+            decoded = decode_pyshark(packet)
+            instrumentation.observe('capture.decode', time.perf_counter() - started)
+            yield decoded
+
+    def close(self):
+        self.capture.close()
+
+def open_live_capture(interface=INTERFACE, backend=None):
+    """Open a live capture backend, or return None if that is not possible.
+
+    The built-in raw-socket backend is tried first (unless `backend` says
+    otherwise); pyshark is the fallback.
+    """
+    backend = backend or CAPTURE_BACKEND
+    print(f"Starting live capture on interface: {interface} (backend: {backend})")
+    if backend == 'raw':
+        try:
+            live = RawSocketBackend(interface)
+            print("Live capture initialized successfully")
+            return live
+        except Exception as e:
+            print(f"Raw socket capture unavailable ({e}), falling back to pyshark")
     try:
-        import pyshark
-        interfaces = pyshark.LiveCapture.list_interfaces()
-        print("Available interfaces:")
-        for i, interface in enumerate(interfaces):
-            print(f"  {i}: {interface}")
-    except:
-        print("Could not list interfaces")
-    capture = None
+        live = PysharkBackend(interface)
+        print("Live capture initialized successfully")
+        return live
+    except Exception as e:
+        print(f"Error initializing live capture: {e}")
+        print("Trying to list available interfaces...")
+        try:
+            interfaces = pyshark.LiveCapture.list_interfaces()
+            print("Available interfaces:")
+            for i, name in enumerate(interfaces):
+                print(f"  {i}: {name}")
+        except:
+            print("Could not list interfaces")
+        return None
+
+def open_pcap(path, backend='pcap'):
+    """Open a pcap/pcapng file with the built-in reader or pyshark."""
+    if backend == 'pyshark':
+        return PysharkBackend(path=path)
+    return PcapFileBackend(path)
 
+@instrumentation.stage('capture.extract_features')
 def extract_features(packet):
-    # Example: extract src, dst, protocol, length (expand as needed)
+    """Extract logging fields and the model feature vector from a DecodedPacket."""
+    if packet is None:
+        return None
     try:
-        ip_layer = packet.ip
-        src = ip_layer.src
-        dst = ip_layer.dst
-        proto = packet.transport_layer if hasattr(packet, 'transport_layer') else 'N/A'
-        length = int(packet.length)
-        
-        # Initialize all features with default values
-        features = {}
+        proto = packet.transport_layer or 'N/A'
+        length = packet.length
         
-        # Basic features that we can extract from the packet
-        features['duration'] = 0  # We don't have duration for live packets
-        features['src_bytes'] = length
-        features['dst_bytes'] = length
-        features['land'] = 0  # Not a land attack
-        features['wrong_fragment'] = 0
-        features['urgent'] = 0
-        features['hot'] = 0
-        features['num_failed_logins'] = 0
-        features['logged_in'] = 0
-        features['num_compromised'] = 0
-        features['root_shell'] = 0
-        features['su_attempted'] = 0
-        features['num_root'] = 0
-        features['num_file_creations'] = 0
-        features['num_shells'] = 0
-        features['num_access_files'] = 0
-        features['num_outbound_cmds'] = 0
-        features['is_host_login'] = 0
-        features['is_guest_login'] = 0
-        features['count'] = 1  # Single packet
-        features['srv_count'] = 1
-        features['serror_rate'] = 0.0
-        features['srv_serror_rate'] = 0.0
-        features['rerror_rate'] = 0.0
-        features['srv_rerror_rate'] = 0.0
-        features['same_srv_rate'] = 0.0
-        features['diff_srv_rate'] = 0.0
-        features['srv_diff_host_rate'] = 0.0
-        features['dst_host_count'] = 1
-        features['dst_host_srv_count'] = 1
-        features['dst_host_same_srv_rate'] = 0.0
-        features['dst_host_diff_srv_rate'] = 0.0
-        features['dst_host_same_src_port_rate'] = 0.0
-        features['dst_host_srv_diff_host_rate'] = 0.0
-        features['dst_host_serror_rate'] = 0.0
-        features['dst_host_srv_serror_rate'] = 0.0
-        features['dst_host_rerror_rate'] = 0.0
-        features['dst_host_srv_rerror_rate'] = 0.0  # This was the missing feature
+        # Connection-level KDD features for the flow this packet belongs to
+        flow_features = FLOW_TABLE.update(packet.timestamp, proto, packet.src, packet.dst, length,
+                                          packet.sport, packet.dport, packet.tcp_flags, packet.icmp_type)
         
-        # Protocol type features (one-hot encoded)
-        features['protocol_type_icmp'] = 1 if proto == 'ICMP' else 0
-        features['protocol_type_tcp'] = 1 if proto == 'TCP' else 0
-        features['protocol_type_udp'] = 1 if proto == 'UDP' else 0
+        # Only the fields this packet sets are written; everything else
+        # comes from the precompiled template
+        active = ACTIVE
+        vector = active.encoder.encode(length, proto, flow_features) if active is not None else None
         
-        # Service features (all set to 0 for live packets)
-        service_features = [
-            'service_IRC', 'service_X11', 'service_Z39_50', 'service_auth', 'service_bgp',
-            'service_courier', 'service_csnet_ns', 'service_ctf', 'service_daytime',
-            'service_discard', 'service_domain', 'service_domain_u', 'service_echo',
-            'service_eco_i', 'service_ecr_i', 'service_efs', 'service_exec',
-            'service_finger', 'service_ftp', 'service_ftp_data', 'service_gopher',
-            'service_hostnames', 'service_http', 'service_http_443', 'service_imap4',
-            'service_iso_tsap', 'service_klogin', 'service_kshell', 'service_ldap',
-            'service_link', 'service_login', 'service_mtp', 'service_name',
-            'service_netbios_dgm', 'service_netbios_ns', 'service_netbios_ssn',
-            'service_netstat', 'service_nnsp', 'service_nntp', 'service_ntp_u',
-            'service_other', 'service_pm_dump', 'service_pop_2', 'service_pop_3',
-            'service_printer', 'service_private', 'service_remote_job', 'service_rje',
-            'service_shell', 'service_smtp', 'service_sql_net', 'service_ssh',
-            'service_sunrpc', 'service_supdup', 'service_systat', 'service_telnet',
-            'service_tim_i', 'service_time', 'service_urp_i', 'service_uucp',
-            'service_uucp_path', 'service_vmnet', 'service_whois'
-        ]
-        for service in service_features:
-            features[service] = 0
-        
-        # Flag features (all set to 0 for live packets)
-        flag_features = [
-            'flag_OTH', 'flag_REJ', 'flag_RSTO', 'flag_RSTOS0', 'flag_RSTR',
-            'flag_S0', 'flag_S1', 'flag_S2', 'flag_S3', 'flag_SF', 'flag_SH'
-        ]
-        for flag in flag_features:
-            features[flag] = 0
-        
-        # Add the basic packet info for logging
-        features['src'] = src
-        features['dst'] = dst
-        features['protocol'] = proto
-        features['length'] = length
-        
-        return features
+        return {
+            'src': packet.src,
+            'dst': packet.dst,
+            'protocol': proto,
+            'length': length,
+            'vector': vector,
+            'fields': flow_features,
+            'model_version': active.version if active is not None else None
+        }
     except Exception as e:
         print(f"Error extracting features: {e}")
         return None
 
+def _vector_for(features, active):
+    """The packet's feature vector for `active`, re-encoded if the model changed since extraction."""
+    if features.get('model_version') != active.version or features['vector'] is None:
+        return active.encoder.encode(features['length'], features['protocol'], features.get('fields'))
+    return features['vector']
+
+@instrumentation.stage('capture.predict_packet')
 def predict_packet(features):
     # Check if model is loaded
-    if MODEL is None or not FEATURE_LIST:
+    active = ACTIVE
+    if active is None:
         print("Model or features not loaded, skipping prediction")
         return "Unknown"
     
-    # Convert to DataFrame and align with model features
-    X = pd.DataFrame([features])
-    
-    # Remove non-feature columns that are used for logging
-    feature_cols = [col for col in X.columns if col not in ['src', 'dst', 'protocol', 'length']]
-    X = X[feature_cols]
-    
-    # Ensure all required features are present
-    missing_cols = set(FEATURE_LIST) - set(X.columns)
-    for col in missing_cols:
-        X[col] = 0
-    
-    # Ensure correct column order
-    X = X.reindex(columns=FEATURE_LIST, fill_value=0)
-    
     try:
-        pred = MODEL.predict(X)[0]
+        pred = active.bundle.predict(_vector_for(features, active).reshape(1, -1))[0]
         return str(pred)
     except Exception as e:
         print(f"Error making prediction: {e}")
         return "Error"
 
+@instrumentation.stage('capture.log_forensic')
 def log_forensic(result):
-    with open(FORENSIC_LOG, 'a', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            result['timestamp'],
-            result['src'],
-            result['dst'],
-            result['protocol'],
-            result['length'],
-            result['prediction']
-        ])
-
-def capture_loop():
+    """Queue a malicious result for the forensic log; never blocks on disk I/O."""
+    FORENSIC_WRITER.write(result)
+
+@instrumentation.stage('capture.predict_batch')
+def predict_batch(features_list):
+    """Score a batch of extracted packets with a single predict call."""
+    # Pin one model for the whole batch
+    active = ACTIVE
+    if active is None:
+        print("Model or features not loaded, skipping prediction")
+        return ["Unknown"] * len(features_list)
+    
+    try:
+        X = np.vstack([_vector_for(features, active) for features in features_list])
+        return [str(pred) for pred in active.bundle.predict(X)]
+    except Exception as e:
+        print(f"Error making batch prediction: {e}")
+        return ["Error"] * len(features_list)
+
+def make_result(features, prediction):
+    return {
+        'src': features['src'],
+        'dst': features['dst'],
+        'protocol': features['protocol'],
+        'length': features['length'],
+        'prediction': prediction,
+        'timestamp': features.get('timestamp') or time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+
+def handle_prediction(features, prediction, timings=None, result=None):
+    """Fan a scored packet out to the forensic log and alerts.
+
+    If `timings` is given, time spent in log_forensic and process_threat is
+    added to it (seconds).
+    """
+    if result is None:
+        result = make_result(features, prediction)
+    if prediction == 'Malicious':
+        t0 = time.perf_counter()
+        log_forensic(result)
+        if timings is not None:
+            timings['log_forensic'] += time.perf_counter() - t0
+        print(f"🚨 MALICIOUS PACKET DETECTED: {features['src']} -> {features['dst']} | Proto: {features['protocol']} | Len: {features['length']}")
+        
+        # Trigger threat alert
+        threat_data = {
+            'src': features['src'],
+            'dst': features['dst'],
+            'protocol': features['protocol'],
+            'prediction': prediction,
+            'length': features['length']
+        }
+        t0 = time.perf_counter()
+        alert = process_threat(threat_data)
+        elapsed = time.perf_counter() - t0
+        instrumentation.observe('capture.process_threat', elapsed)
+        if timings is not None:
+            timings['process_threat'] += elapsed
+        instrumentation.count('packets_malicious')
+        if alert:
+            alert_log.record(alert)
+            instrumentation.count('alerts_raised')
+            print(f"🚨 ALERT TRIGGERED: {alert['level']} level threat from {features['src']}")
+            print(f"   Actions taken: {len(alert['actions_taken'])}")
+    return result
+
+def process_batch(features_list, timings=None):
+    """Score a batch and hand each result on in capture order."""
+    t0 = time.perf_counter()
+    predictions = predict_batch(features_list)
+    if timings is not None:
+        timings['predict'] += time.perf_counter() - t0
+    results = [make_result(features, prediction) for features, prediction in zip(features_list, predictions)]
+    instrumentation.count('packets_scored', len(results))
+    # One lock acquisition per batch for the API's live view
+    live_predictions.extend(results)
+    for features, prediction, result in zip(features_list, predictions, results):
+        handle_prediction(features, prediction, timings, result)
+
+def _make_batcher(handler, batch_size=None, batch_deadline_ms=None):
+    return MicroBatcher(
+        handler,
+        max_size=batch_size or BATCH_SIZE,
+        max_delay=(batch_deadline_ms if batch_deadline_ms is not None else BATCH_DEADLINE_MS) / 1000.0
+    )
+
+def capture_loop(batch_size=None, batch_deadline_ms=None, interface=INTERFACE, backend=None):
+    init()
+    capture = open_live_capture(interface, backend)
     if capture is None:
         print("Live capture not initialized, skipping packet capture")
         return
     
-    print("Starting packet capture loop...")
+    batcher = _make_batcher(process_batch, batch_size, batch_deadline_ms)
+    instrumentation.gauge('capture_batch_queue', batcher.pending)
+    print(f"Starting packet capture loop (batch size {batcher.max_size}, deadline {batcher.max_delay * 1000:.0f} ms)...")
+    batcher.start()
     packet_count = 0
+    last_report = time.time()
     
     try:
-        for packet in capture.sniff_continuously():
+        for packet in capture.packets():
             packet_count += 1
-            print(f"Captured packet #{packet_count}")
+            instrumentation.count('packets_captured')
             
             features = extract_features(packet)
             if features is None:
-                print(f"Could not extract features from packet #{packet_count}")
                 continue
-                
-            prediction = predict_packet(features)
-            result = {
-                'src': features['src'],
-                'dst': features['dst'],
-                'protocol': features['protocol'],
-                'length': features['length'],
-                'prediction': prediction,
-                'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
-            }
+            # Stamp at capture time; the batch is scored a few ms later
+            features['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            batcher.submit(features)
             
-            with lock:
-                live_predictions.append(result)
-                # Keep only last 1000 predictions to prevent memory issues
-                if len(live_predictions) > 1000:
-                    live_predictions.pop(0)
-                    
-            if prediction == 'Malicious':
-                log_forensic(result)
-                print(f"🚨 MALICIOUS PACKET DETECTED: {features['src']} -> {features['dst']} | Proto: {features['protocol']} | Len: {features['length']}")
-                
-                # Trigger threat alert
-                threat_data = {
-                    'src': features['src'],
-                    'dst': features['dst'],
-                    'protocol': features['protocol'],
-                    'prediction': prediction,
-                    'length': features['length']
-                }
-                alert = process_threat(threat_data)
-                if alert:
-                    print(f"🚨 ALERT TRIGGERED: {alert['level']} level threat from {features['src']}")
-                    print(f"   Actions taken: {len(alert['actions_taken'])}")
-            else:
-                print(f"✅ Benign packet: {features['src']} -> {features['dst']} | Proto: {features['protocol']} | Len: {features['length']}")
-                
-            # Print every 10th packet to avoid spam
-            if packet_count % 10 == 0:
-                print(f"Processed {packet_count} packets so far...")
+            now = time.time()
+            if now - last_report >= BATCH_STATS_INTERVAL:
+                stats = batcher.stats(reset=True)
+                flows = FLOW_TABLE.stats()
+                print(f"Processed {packet_count} packets so far | batches: {stats['batches']}, "
+                      f"avg size: {stats['avg_batch_size']} ({stats['avg_fill']:.0%} full), "
+                      f"added latency avg/max: {stats['avg_added_latency_ms']}/{stats['max_added_latency_ms']} ms, "
+                      f"dropped: {stats['dropped']} | flows: {flows['flows']}, evictions: {flows['evictions']}")
+                last_report = now
                 
     except Exception as e:
         print(f"Error in capture loop: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        batcher.stop()
+        capture.close()
+
+def replay_pcap(paths, speed=None, batch_size=None, batch_deadline_ms=None, backend='pcap'):
+    """Replay pcap/pcapng files through the live detection chain.
+
+    Packets go through the same extract_features -> predict -> log_forensic
+    -> process_threat path as live capture. With `speed` unset (or 0) they
+    are pushed as fast as possible; otherwise the original inter-packet
+    gaps are kept, divided by `speed`. `backend` is 'pcap' (built-in
+    decoder) or 'pyshark'. Returns the throughput summary.
+    """
+    init()
+    timings = {'decode': 0.0, 'extract': 0.0, 'predict': 0.0, 'log_forensic': 0.0, 'process_threat': 0.0}
+    batcher = _make_batcher(lambda batch: process_batch(batch, timings), batch_size, batch_deadline_ms)
+    batcher.start()
+    packet_count = 0
+    skipped = 0
+    first_ts = None
+    started = time.perf_counter()
+    
+    try:
+        for path in paths:
+            print(f"Replaying {path}...")
+            replay = open_pcap(path, backend)
+            packets = iter(replay.packets())
+            try:
+                while True:
+                    t0 = time.perf_counter()
+                    try:
+                        packet = next(packets)
+                    except StopIteration:
+                        break
+                    t1 = time.perf_counter()
+                    timings['decode'] += t1 - t0
+                    
+                    packet_count += 1
+                    instrumentation.count('packets_captured')
+                    if packet is None:
+                        skipped += 1
+                        continue
+                    ts = packet.timestamp
+                    if first_ts is None:
+                        first_ts = ts
+                    if speed:
+                        # Hold the packet back until its scaled capture offset
+                        delay = (ts - first_ts) / speed - (t1 - started)
+                        if delay > 0:
+                            time.sleep(delay)
+                    
+                    t0 = time.perf_counter()
+                    features = extract_features(packet)
+                    timings['extract'] += time.perf_counter() - t0
+                    if features is None:
+                        skipped += 1
+                        continue
+                    features['timestamp'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+                    batcher.submit(features, block=True)
+            finally:
+                replay.close()
+    finally:
+        batcher.stop()
+    
+    elapsed = time.perf_counter() - started
+    batch_stats = batcher.stats()
+    summary = {
+        'packets': packet_count,
+        'skipped': skipped,
+        'elapsed_s': round(elapsed, 3),
+        'packets_per_s': round(packet_count / elapsed, 1) if elapsed > 0 else 0,
+        'stage_ms': {stage: round(total * 1000, 2) for stage, total in timings.items()},
+        'stage_us_per_packet': {stage: round(total * 1e6 / max(packet_count, 1), 1) for stage, total in timings.items()},
+        'batches': batch_stats,
+    }
+    print(f"Replayed {packet_count} packets ({skipped} skipped) in {summary['elapsed_s']} s: "
+          f"{summary['packets_per_s']} packets/s")
+    for stage, total in summary['stage_ms'].items():
+        print(f"  {stage:<15} {total:>10.2f} ms total  {summary['stage_us_per_packet'][stage]:>8.1f} us/packet")
+    print(f"  batches: {batch_stats['batches']}, avg size: {batch_stats['avg_batch_size']}, "
+          f"added latency avg/max: {batch_stats['avg_added_latency_ms']}/{batch_stats['max_added_latency_ms']} ms")
+    return summary
 
 if __name__ == '__main__':
+    import argparse
+    import signal
+    parser = argparse.ArgumentParser(description='Live packet capture and detection')
+    parser.add_argument('--interface', default=INTERFACE, help='Capture interface (default: auto)')
+    parser.add_argument('--replay', nargs='+', metavar='PCAP', help='Replay pcap/pcapng files instead of capturing')
+    parser.add_argument('--backend', choices=['raw', 'pcap', 'pyshark'], default=None,
+                        help='Packet source: built-in decoder (raw socket / pcap reader) or pyshark')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='Replay speed factor against original timestamps (0 = as fast as possible)')
+    parser.add_argument('--batch-size', type=int, default=None, help=f'Max packets per batch (default {BATCH_SIZE})')
+    parser.add_argument('--batch-deadline-ms', type=float, default=None,
+                        help=f'Max wait for a batch to fill (default {BATCH_DEADLINE_MS:g} ms)')
+    parser.add_argument('--profile-seconds', type=float, default=30,
+                        help='Length of the stack-sampling session started by SIGUSR1 (default 30)')
+    args = parser.parse_args()
+    instrumentation.start('capture')
+    init()
+    if hasattr(signal, 'SIGUSR1'):
+        # Run as its own process (serve.py), capture is profiled with `kill -USR1 <pid>`;
+        # reports land in the same directory /admin/profile lists
+        profiler = profiling.Profiler()
+        def _profile(signum, frame):
+            try:
+                session = profiler.start('sampler', args.profile_seconds)
+                print(f"Profiling capture for {args.profile_seconds:g} s (session {session.id})")
+            except profiling.ProfileBusy as e:
+                print(f"Profiling already running: {e}")
+        signal.signal(signal.SIGUSR1, _profile)
     try:
-        capture_loop()
+        if args.replay:
+            replay_pcap(args.replay, speed=args.speed, batch_size=args.batch_size,
+                        batch_deadline_ms=args.batch_deadline_ms,
+                        backend='pyshark' if args.backend == 'pyshark' else 'pcap')
+        else:
+            capture_loop(args.batch_size, args.batch_deadline_ms, args.interface, args.backend)
     except KeyboardInterrupt:
-        print("Live capture stopped.") 
\ No newline at end of file
+        print("Live capture stopped.")
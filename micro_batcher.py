@@ -0,0 +1,117 @@
+"""Size/deadline micro-batching between packet capture and inference.
+
+The capture thread submits items; a worker thread collects them until
+either `max_size` items are pending or `max_delay` seconds have passed
+since the oldest one arrived, then hands the whole batch to `handler` in
+arrival order.
+"""
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+    """Collects submitted items into batches for a single handler call."""
+
+    def __init__(self, handler, max_size=256, max_delay=0.020, max_pending=100000):
+        self.handler = handler
+        self.max_size = max(1, int(max_size))
+        self.max_delay = max(0.0, float(max_delay))
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._running = False
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._batches = 0
+        self._items = 0
+        self._dropped = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the worker after it has drained everything already submitted."""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, item, block=False):
+        """Queue an item; returns False (and counts a drop) if the queue is full.
+
+        With `block=True` the caller waits for room instead, which is what
+        offline replay wants.
+        """
+        try:
+            self._queue.put((time.perf_counter(), item), block=block)
+            return True
+        except queue.Full:
+            with self._stats_lock:
+                self._dropped += 1
+            return False
+
+    def pending(self):
+        """Items submitted but not yet handed to the handler."""
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first[0] + self.max_delay
+        while len(batch) < self.max_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            dispatched = time.perf_counter()
+            # Added latency is how long the oldest item waited for its batch
+            waited = dispatched - batch[0][0]
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._latency_total += waited
+                self._latency_max = max(self._latency_max, waited)
+            try:
+                self.handler([item for _, item in batch])
+            except Exception as e:
+                print(f"Error in batch handler: {e}")
+
+    def stats(self, reset=False):
+        """Batch fill and added-latency summary since start (or the last reset)."""
+        with self._stats_lock:
+            batches = self._batches
+            summary = {
+                'batches': batches,
+                'items': self._items,
+                'dropped': self._dropped,
+                'pending': self._queue.qsize(),
+                'avg_batch_size': round(self._items / batches, 1) if batches else 0,
+                'avg_fill': round(self._items / (batches * self.max_size), 3) if batches else 0,
+                'avg_added_latency_ms': round(self._latency_total / batches * 1000, 2) if batches else 0,
+                'max_added_latency_ms': round(self._latency_max * 1000, 2),
+            }
+            if reset:
+                self._reset_stats()
+        return summary
@@ -0,0 +1,205 @@
+"""Benchmark candidate classifiers on an uploaded dataset.
+
+Each candidate is trained on the same stratified sample and test split
+that retraining uses (chunked_training.load_sample) and measured on what
+matters when serving: accuracy and macro F1, single-row latency p50/p99,
+batch throughput, size on disk, and the load time and resident memory of
+loading it in a fresh process. Tree models are also timed on the array
+engine (forest_arrays) that serves them. Results are written to
+models/comparison.json so every API worker reports the same run.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+import chunked_training
+import forest_arrays
+import model_store
+
+RESULTS_FILE = 'comparison.json'
+SAMPLE_ROWS = 50000  # Training rows per candidate; keeps a full run to minutes
+LATENCY_REPEAT = 300
+BATCH_ROWS = 10000
+
+
+CANDIDATES = (
+    'decision_tree', 'decision_tree_depth12',
+    'random_forest_20', 'random_forest_100',
+    'extra_trees_20', 'extra_trees_100',
+    'hist_gradient_boosting_50', 'hist_gradient_boosting_200',
+)
+
+
+def build(name):
+    """An unfitted estimator for a name in CANDIDATES."""
+    from sklearn.ensemble import ExtraTreesClassifier, HistGradientBoostingClassifier, RandomForestClassifier
+    from sklearn.tree import DecisionTreeClassifier
+    return {
+        'decision_tree': lambda: DecisionTreeClassifier(random_state=42),
+        'decision_tree_depth12': lambda: DecisionTreeClassifier(max_depth=12, random_state=42),
+        'random_forest_20': lambda: RandomForestClassifier(n_estimators=20, random_state=42),
+        'random_forest_100': lambda: RandomForestClassifier(n_estimators=100, random_state=42),
+        'extra_trees_20': lambda: ExtraTreesClassifier(n_estimators=20, random_state=42),
+        'extra_trees_100': lambda: ExtraTreesClassifier(n_estimators=100, random_state=42),
+        'hist_gradient_boosting_50': lambda: HistGradientBoostingClassifier(max_iter=50, random_state=42),
+        'hist_gradient_boosting_200': lambda: HistGradientBoostingClassifier(max_iter=200, random_state=42),
+    }[name]()
+
+
+# Run in a fresh interpreter; sklearn is imported first so only the model counts
+_LOAD_SCRIPT = '''
+import json, os, sys, time
+import joblib, sklearn.ensemble, sklearn.tree
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+before = rss()
+started = time.perf_counter()
+model = joblib.load(sys.argv[1])
+seconds = time.perf_counter() - started
+after = rss()
+print(json.dumps([seconds, after - before if before is not None else None]))
+'''
+
+
+def measure_load(path):
+    """(seconds, resident bytes) to load the joblib file at `path` in a new process."""
+    out = subprocess.run([sys.executable, '-c', _LOAD_SCRIPT, path], capture_output=True, text=True, check=True)
+    return tuple(json.loads(out.stdout.strip().splitlines()[-1]))
+
+
+def _latency(predict, X, repeat):
+    samples = []
+    for i in range(repeat):
+        row = X[i % len(X)].reshape(1, -1)
+        started = time.perf_counter()
+        predict(row)
+        samples.append(time.perf_counter() - started)
+    samples = np.asarray(samples) * 1e6
+    return round(float(np.percentile(samples, 50)), 1), round(float(np.percentile(samples, 99)), 1)
+
+
+def _throughput(predict, X):
+    started = time.perf_counter()
+    predict(X)
+    return int(len(X) / max(time.perf_counter() - started, 1e-9))
+
+
+def measure(name, model, X_train, y_train, X_test, y_test, workdir):
+    """Train `model` and return its result row."""
+    from sklearn.metrics import accuracy_score, f1_score
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+    y_pred = model.predict(X_test)
+    X_test = X_test.astype(np.float64)
+    p50, p99 = _latency(model.predict, X_test, LATENCY_REPEAT)
+    path = os.path.join(workdir, f'{name}.joblib')
+    joblib.dump(model, path)
+    load_seconds, rss = measure_load(path)
+    result = {
+        'name': name,
+        'type': type(model).__name__,
+        'params': {key: value for key, value in model.get_params().items()
+                   if key in ('n_estimators', 'max_depth', 'max_iter')},
+        'accuracy': float(accuracy_score(y_test, y_pred)),
+        'f1_score': float(f1_score(y_test, y_pred, average='macro', zero_division=0)),
+        'fit_seconds': round(fit_seconds, 3),
+        'latency_p50_us': p50,
+        'latency_p99_us': p99,
+        'batch_rows_per_s': _throughput(model.predict, X_test[:BATCH_ROWS]),
+        'size_bytes': os.path.getsize(path),
+        'load_seconds': round(load_seconds, 4),
+        'load_rss_bytes': rss,
+    }
+    if forest_arrays.supported(model):
+        forest_path = os.path.join(workdir, f'{name}.forest')
+        forest_arrays.export(model, forest_path)
+        forest = forest_arrays.ArrayForest(forest_path)
+        p50, p99 = _latency(forest.predict, X_test, LATENCY_REPEAT)
+        result['array_forest'] = {'latency_p50_us': p50, 'latency_p99_us': p99,
+                                  'batch_rows_per_s': _throughput(forest.predict, X_test[:BATCH_ROWS])}
+    return result
+
+
+def recommend(results, tolerance=0.005):
+    """Plain statements drawn from `results`, for choosing on accuracy vs cost."""
+    if not results:
+        return []
+    best = max(results, key=lambda r: r['f1_score'])
+    close = [r for r in results if r['f1_score'] >= best['f1_score'] - tolerance]
+
+    def p99(r):
+        return min(r['latency_p99_us'], r.get('array_forest', {}).get('latency_p99_us', float('inf')))
+
+    fastest = min(close, key=p99)
+    smallest = min(close, key=lambda r: r['size_bytes'])
+    return [
+        f"Highest F1: {best['name']} ({best['f1_score']:.4f})",
+        f"Fastest within {tolerance:.1%} F1 of the best: {fastest['name']} (p99 {p99(fastest):.0f} us)",
+        f"Smallest within {tolerance:.1%} F1 of the best: {smallest['name']} "
+        f"({smallest['size_bytes'] / 2 ** 20:.1f} MB)",
+    ]
+
+
+def run(data_path, job=None, directory=model_store.MODELS_DIR, candidates=None, sample_rows=SAMPLE_ROWS):
+    """Benchmark every candidate on `data_path`, save and return the report."""
+    def report(progress, stage):
+        if job is not None:
+            job.report(progress, stage)
+
+    chosen = [name for name in CANDIDATES if candidates is None or name in candidates]
+    report(0.05, 'loading sample')
+    X_train, y_train, X_test, y_test, feature_list = chunked_training.load_sample(data_path, sample_rows=sample_rows)
+    workdir = tempfile.mkdtemp(prefix='ids-compare-')
+    try:
+        results = []
+        for i, name in enumerate(chosen):
+            report(0.1 + 0.85 * i / len(chosen), f'benchmarking {name}')
+            results.append(measure(name, build(name), X_train, y_train, X_test, y_test, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    comparison = {
+        'source': os.path.basename(data_path),
+        'finished': time.time(),
+        'train_rows': len(X_train),
+        'test_rows': len(X_test),
+        'features': len(feature_list),
+        'results': results,
+        'recommendations': recommend(results),
+    }
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, RESULTS_FILE)
+    with open(f'{path}.tmp-{os.getpid()}', 'w') as f:
+        json.dump(comparison, f)
+    os.replace(f'{path}.tmp-{os.getpid()}', path)
+    return comparison
+
+
+def stamp(directory=model_store.MODELS_DIR):
+    """Modification time of the saved comparison (None if there is none), to tell runs apart."""
+    try:
+        return os.stat(os.path.join(directory, RESULTS_FILE)).st_mtime_ns
+    except OSError:
+        return None
+
+
+def latest(directory=model_store.MODELS_DIR):
+    """The last saved comparison, or None."""
+    try:
+        with open(os.path.join(directory, RESULTS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,74 @@
+"""Process-local view of the current model version, hot-swapped on change.
+
+Both the API and the packet capture hold a ModelRegistry. It loads the
+version named by models/CURRENT (trees memory-mapped, see forest_arrays)
+and a watcher thread polls that file every `poll_interval` seconds, so a
+retrain or rollback done by any process is picked up by all of them
+without a restart. Listeners are called with each newly loaded bundle.
+"""
+import os
+import threading
+import time
+
+import model_store
+
+
+class ModelRegistry:
+    """The current ModelBundle for `directory`, reloaded when CURRENT changes."""
+
+    def __init__(self, directory=model_store.MODELS_DIR, poll_interval=2.0, fallback=None):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.fallback = fallback  # Served while no versioned model exists
+        self._bundle = None
+        self._stamp = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reloads = 0
+
+    def current(self):
+        """The bundle to serve; read it once per request and use only that."""
+        return self._bundle if self._bundle is not None else self.fallback
+
+    def add_listener(self, callback):
+        self._listeners.append(callback)
+
+    def _read_stamp(self):
+        path = os.path.join(self.directory, model_store.CURRENT_FILE)
+        try:
+            return os.stat(path).st_mtime_ns, model_store.current_version(self.directory)
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Load the version CURRENT names if it differs from the one held. Returns the bundle."""
+        with self._lock:
+            stamp = self._read_stamp()
+            if stamp is None or stamp == self._stamp:
+                return self.current()
+            version = stamp[1]
+            if self._bundle is None or self._bundle.version != version:
+                try:
+                    bundle = model_store.load(version, directory=self.directory)
+                except Exception as e:
+                    print(f"Error loading model version {version}: {e}")
+                    return self.current()
+                self._bundle = bundle
+                self.reloads += 1
+                for callback in self._listeners:
+                    callback(bundle)
+            self._stamp = stamp
+            return self.current()
+
+    def watch(self):
+        """Start polling CURRENT in a daemon thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='model-registry-watch', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.refresh()
@@ -0,0 +1,253 @@
+"""Versioned model artifacts with an atomically switched CURRENT pointer.
+
+Every training run writes a complete, immutable version directory:
+
+    models/
+        v0001/  model.joblib  explainer.joblib  features.txt  encoder.json  metrics.json
+                forest/     # the trees as memory-mappable arrays (forest_arrays)
+        v0002/  ...
+        CURRENT             # "v0002"
+
+A version is staged in a temporary directory and renamed into place
+only once every file is written, and CURRENT is replaced with os.replace,
+so readers never see a half-written model and rolling back is just
+pointing CURRENT at an older version.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import forest_arrays
+from feature_encoder import ENCODER_FILE, FeatureEncoder
+
+MODELS_DIR = 'models'
+CURRENT_FILE = 'CURRENT'
+# The array forest wins on single rows and small batches; past a few hundred
+# rows sklearn's compiled traversal is faster (about 7x at 20,000 rows)
+ARRAY_FOREST_MAX_ROWS = int(os.environ.get('IDS_ARRAY_FOREST_MAX_ROWS', 256))
+
+_save_lock = threading.Lock()
+
+
+class ModelBundle:
+    """Everything a request needs from one model version, swapped as a unit.
+
+    Batches of up to ARRAY_FOREST_MAX_ROWS rows go through `forest`
+    (memory-mapped arrays) when the version has one, larger ones through
+    the sklearn model. The pickled model and explainer are only unpickled
+    the first time something asks for them, e.g. a large batch or a SHAP
+    explanation. Versions saved
+    without an encoder.json encode request rows by column name.
+    """
+
+    __slots__ = ('_model', '_explainer', 'feature_list', 'encoder', 'metrics', 'version', 'forest', 'path',
+                 '_lock')
+
+    def __init__(self, model, explainer, feature_list, metrics=None, version=0, forest=None, path=None,
+                 encoder=None):
+        self._model = model
+        self._explainer = explainer
+        self.feature_list = list(feature_list)
+        self.encoder = encoder or FeatureEncoder.from_feature_list(self.feature_list)
+        self.metrics = dict(metrics or {})
+        self.version = version
+        self.forest = forest
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _lazy(self, attr, filename):
+        with self._lock:
+            if getattr(self, attr) is None and self.path is not None:
+                setattr(self, attr, joblib.load(os.path.join(self.path, filename)))
+            return getattr(self, attr)
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else self._lazy('_model', 'model.joblib')
+
+    @property
+    def explainer(self):
+        return self._explainer if self._explainer is not None else self._lazy('_explainer', 'explainer.joblib')
+
+    @property
+    def classes(self):
+        return self.forest.classes_ if self.forest is not None else self.model.classes_
+
+    def predict(self, X):
+        """Class labels for an encoded (rows, features) array or DataFrame."""
+        if self.forest is not None and len(X) <= ARRAY_FOREST_MAX_ROWS:
+            return self.forest.predict(np.asarray(X, dtype=np.float64))
+        model = self.model
+        if model is None:  # No pickled model to fall back to
+            return self.forest.predict(np.asarray(X, dtype=np.float64))
+        names = getattr(model, 'feature_names_in_', None)
+        if names is not None and not isinstance(X, pd.DataFrame):
+            # Fitted on a DataFrame (older models): name the columns instead of having sklearn warn
+            X = pd.DataFrame(X, columns=names)
+        return model.predict(X)
+
+
+def version_dir(version, directory=MODELS_DIR):
+    return os.path.join(directory, f'v{version:04d}')
+
+
+def list_versions(directory=MODELS_DIR):
+    """Saved version numbers, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name[1:]) for name in os.listdir(directory)
+                  if name.startswith('v') and name[1:].isdigit())
+
+
+def current_version(directory=MODELS_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return int(f.read().strip().lstrip('v'))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, text):
+    tmp = f'{path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    with open(tmp, 'w') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def save(model, explainer, feature_list, metrics, directory=MODELS_DIR, source=None, check_X=None,
+         training=None, encoder=None):
+    """Write a new version directory and return its number (not activated).
+
+    `training` (rows used, memory report, ...) is stored in metrics.json,
+    and `encoder` (a fitted FeatureEncoder) in encoder.json.
+
+    With `check_X`, the exported tree arrays must predict exactly like
+    `model` on those rows; if they do not, the version is saved without
+    them and is served by the sklearn model instead.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f'.staging-{os.getpid()}-{threading.get_ident()}')
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        joblib.dump(model, os.path.join(tmp, 'model.joblib'))
+        joblib.dump(explainer, os.path.join(tmp, 'explainer.joblib'))
+        info = {'metrics': metrics, 'created': time.time(), 'source': source, 'training': training}
+        if forest_arrays.supported(model):
+            forest_path = os.path.join(tmp, forest_arrays.FOREST_DIR)
+            forest_arrays.export(model, forest_path)
+            if check_X is not None:
+                try:
+                    info['parity_rows'] = forest_arrays.verify_parity(
+                        model, forest_arrays.ArrayForest(forest_path, mmap=False), check_X)
+                except AssertionError as e:
+                    shutil.rmtree(forest_path)
+                    info['forest_error'] = str(e)
+        with open(os.path.join(tmp, 'features.txt'), 'w') as f:
+            f.write('\n'.join(feature_list))
+        if encoder is not None:
+            encoder.save(os.path.join(tmp, ENCODER_FILE))
+        with open(os.path.join(tmp, 'metrics.json'), 'w') as f:
+            json.dump(info, f)
+        with _save_lock:
+            while True:
+                versions = list_versions(directory)
+                version = (versions[-1] if versions else 0) + 1
+                try:
+                    os.rename(tmp, version_dir(version, directory))
+                    return version
+                except OSError:
+                    # Another process took this number first
+                    if not os.path.isdir(version_dir(version, directory)):
+                        raise
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def activate(version, directory=MODELS_DIR):
+    """Point CURRENT at an existing version."""
+    if not os.path.isdir(version_dir(version, directory)):
+        raise KeyError(f'No saved model version {version}')
+    _write_atomic(os.path.join(directory, CURRENT_FILE), f'v{version:04d}\n')
+
+
+def _read_info(version, directory):
+    try:
+        with open(os.path.join(version_dir(version, directory), 'metrics.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load(version=None, directory=MODELS_DIR):
+    """Load a version (default: CURRENT) as a ModelBundle, or None if there is none."""
+    if version is None:
+        version = current_version(directory)
+        if version is None:
+            return None
+    path = version_dir(version, directory)
+    if not os.path.isdir(path):
+        raise KeyError(f'No saved model version {version}')
+    with open(os.path.join(path, 'features.txt')) as f:
+        feature_list = [line.strip() for line in f.readlines()]
+    forest_path = os.path.join(path, forest_arrays.FOREST_DIR)
+    encoder_path = os.path.join(path, ENCODER_FILE)
+    return ModelBundle(
+        model=None,
+        explainer=None,
+        feature_list=feature_list,
+        metrics=_read_info(version, directory).get('metrics'),
+        version=version,
+        forest=forest_arrays.ArrayForest(forest_path) if forest_arrays.exists(forest_path) else None,
+        path=path,
+        encoder=FeatureEncoder.load(encoder_path) if os.path.exists(encoder_path) else None,
+    )
+
+
+def describe(directory=MODELS_DIR):
+    """Summary of every saved version, newest first."""
+    current = current_version(directory)
+    out = []
+    for version in reversed(list_versions(directory)):
+        info = _read_info(version, directory)
+        out.append({'version': version, 'current': version == current, 'metrics': info.get('metrics'),
+                    'created': info.get('created'), 'source': info.get('source'),
+                    'training': info.get('training')})
+    return out
+
+
+def legacy_forest_dir(model_path):
+    """Where the tree arrays sit next to a flat model file: rf_model.joblib -> rf_model.forest/."""
+    return os.path.splitext(model_path)[0] + '.forest'
+
+
+def publish_legacy(version, model_path, explainer_path, features_path, directory=MODELS_DIR):
+    """Copy a version to the flat rf_model.joblib/features.txt paths other tools load.
+
+    Each file is replaced atomically, and the tree arrays are copied to
+    rf_model.forest/ next to the model file.
+    """
+    path = version_dir(version, directory)
+    for name, target in (('model.joblib', model_path), ('explainer.joblib', explainer_path),
+                         ('features.txt', features_path)):
+        tmp = f'{target}.tmp-{os.getpid()}'
+        shutil.copyfile(os.path.join(path, name), tmp)
+        os.replace(tmp, target)
+    forest_path = os.path.join(path, forest_arrays.FOREST_DIR)
+    target = legacy_forest_dir(model_path)
+    old = f'{target}.old-{os.getpid()}'
+    if os.path.isdir(target):
+        os.rename(target, old)
+    if forest_arrays.exists(forest_path):
+        shutil.copytree(forest_path, f'{target}.tmp-{os.getpid()}')
+        os.rename(f'{target}.tmp-{os.getpid()}', target)
+    shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,243 @@
+"""Lightweight packet header decoder and pcap/pcapng reader.
+
+extract_features only needs addresses, ports, TCP flags, the ICMP type and
+the frame length. Parsing those straight out of the raw bytes with
+`struct` is far cheaper than having tshark dissect every packet into
+PDML/XML for pyshark. Supports Ethernet (with 802.1Q tags), Linux cooked
+capture and raw IP link types, IPv4/IPv6, and TCP/UDP/ICMP/ICMPv6.
+"""
+import socket
+import struct
+
+# pcap link-layer header types
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+ETH_P_8021Q = 0x8100
+ETH_P_8021AD = 0x88A8
+
+IPPROTO_ICMP = 1
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+IPPROTO_ICMPV6 = 58
+# IPv6 extension headers that are skipped to reach the transport header
+IPV6_EXTENSION_HEADERS = frozenset((0, 43, 60))
+
+_u16 = struct.Struct('!H').unpack_from
+_ports = struct.Struct('!HH').unpack_from
+
+
+class DecodedPacket:
+    """The handful of header fields the detection pipeline uses."""
+
+    __slots__ = ('timestamp', 'length', 'src', 'dst', 'transport_layer',
+                 'sport', 'dport', 'tcp_flags', 'icmp_type')
+
+    def __init__(self, timestamp, length, src, dst, transport_layer,
+                 sport=0, dport=0, tcp_flags=0, icmp_type=None):
+        self.timestamp = timestamp
+        self.length = length
+        self.src = src
+        self.dst = dst
+        self.transport_layer = transport_layer
+        self.sport = sport
+        self.dport = dport
+        self.tcp_flags = tcp_flags
+        self.icmp_type = icmp_type
+
+    def __repr__(self):
+        return (f'DecodedPacket({self.src}:{self.sport} -> {self.dst}:{self.dport} '
+                f'{self.transport_layer} len={self.length})')
+
+
+def _decode_transport(data, offset, proto_num):
+    """Return (transport_layer, sport, dport, tcp_flags, icmp_type)."""
+    if proto_num == IPPROTO_TCP and len(data) >= offset + 14:
+        sport, dport = _ports(data, offset)
+        return 'TCP', sport, dport, data[offset + 13], None
+    if proto_num == IPPROTO_UDP and len(data) >= offset + 4:
+        sport, dport = _ports(data, offset)
+        return 'UDP', sport, dport, 0, None
+    if proto_num in (IPPROTO_ICMP, IPPROTO_ICMPV6):
+        icmp_type = data[offset] if len(data) > offset else None
+        return 'ICMP', 0, 0, 0, icmp_type
+    return None, 0, 0, 0, None
+
+
+def decode_ip(data, offset, timestamp, length):
+    """Decode an IPv4 or IPv6 packet starting at `offset`; None if it is neither."""
+    if len(data) <= offset:
+        return None
+    version = data[offset] >> 4
+    if version == 4:
+        if len(data) < offset + 20:
+            return None
+        ihl = (data[offset] & 0x0F) * 4
+        proto_num = data[offset + 9]
+        src = socket.inet_ntoa(data[offset + 12:offset + 16])
+        dst = socket.inet_ntoa(data[offset + 16:offset + 20])
+        # Only the first fragment carries the transport header
+        if _u16(data, offset + 6)[0] & 0x1FFF:
+            return DecodedPacket(timestamp, length, src, dst, None)
+        transport = _decode_transport(data, offset + ihl, proto_num)
+    elif version == 6:
+        if len(data) < offset + 40:
+            return None
+        proto_num = data[offset + 6]
+        src = socket.inet_ntop(socket.AF_INET6, data[offset + 8:offset + 24])
+        dst = socket.inet_ntop(socket.AF_INET6, data[offset + 24:offset + 40])
+        offset += 40
+        while proto_num in IPV6_EXTENSION_HEADERS and len(data) >= offset + 2:
+            proto_num, ext_len = data[offset], (data[offset + 1] + 1) * 8
+            offset += ext_len
+        transport = _decode_transport(data, offset, proto_num)
+    else:
+        return None
+    return DecodedPacket(timestamp, length, src, dst, *transport)
+
+
+def decode_frame(data, linktype=LINKTYPE_ETHERNET, timestamp=0.0, length=None):
+    """Decode one captured frame. Returns None for non-IP or truncated frames."""
+    if length is None:
+        length = len(data)
+    try:
+        if linktype == LINKTYPE_ETHERNET:
+            if len(data) < 14:
+                return None
+            ethertype = _u16(data, 12)[0]
+            offset = 14
+            while ethertype in (ETH_P_8021Q, ETH_P_8021AD) and len(data) >= offset + 4:
+                ethertype = _u16(data, offset + 2)[0]
+                offset += 4
+            if ethertype not in (ETH_P_IP, ETH_P_IPV6):
+                return None
+        elif linktype == LINKTYPE_LINUX_SLL:
+            if len(data) < 16 or _u16(data, 14)[0] not in (ETH_P_IP, ETH_P_IPV6):
+                return None
+            offset = 16
+        elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+            offset = 0
+        else:
+            return None
+        return decode_ip(data, offset, timestamp, length)
+    except (struct.error, ValueError, OSError):
+        return None
+
+
+def decode_pyshark(packet):
+    """Adapt a pyshark packet to a DecodedPacket (None if it has no IP layer)."""
+    if hasattr(packet, 'ip'):
+        ip_layer = packet.ip
+    elif hasattr(packet, 'ipv6'):
+        ip_layer = packet.ipv6
+    else:
+        return None
+    proto = packet.transport_layer if hasattr(packet, 'transport_layer') else None
+    if proto is None and (hasattr(packet, 'icmp') or hasattr(packet, 'icmpv6')):
+        proto = 'ICMP'
+    sport = dport = tcp_flags = 0
+    icmp_type = None
+    if proto in ('TCP', 'UDP'):
+        layer = packet[proto]
+        sport = int(layer.srcport)
+        dport = int(layer.dstport)
+        if proto == 'TCP':
+            tcp_flags = int(layer.flags, 16)
+    elif proto == 'ICMP':
+        icmp_layer = packet.icmp if hasattr(packet, 'icmp') else packet.icmpv6
+        icmp_type = int(icmp_layer.type)
+    return DecodedPacket(float(packet.sniff_timestamp), int(packet.length), ip_layer.src, ip_layer.dst,
+                         proto, sport, dport, tcp_flags, icmp_type)
+
+
+# pcap/pcapng file reading -------------------------------------------------
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_SHB = 0x0A0D0D0A
+
+
+def _read_pcap(f, header):
+    endian, resolution = PCAP_MAGIC[header[:4]]
+    linktype = struct.unpack(endian + 'I', header[20:24])[0] & 0x0FFFFFFF
+    record = struct.Struct(endian + 'IIII')
+    while True:
+        rec = f.read(16)
+        if len(rec) < 16:
+            return
+        ts_sec, ts_frac, caplen, wirelen = record.unpack(rec)
+        data = f.read(caplen)
+        if len(data) < caplen:
+            return
+        yield ts_sec + ts_frac * resolution, data, wirelen, linktype
+
+
+def _read_pcapng(f, first):
+    # Section header: the byte-order magic sits right after the block length
+    bom = first[8:12]
+    endian = '<' if bom == b'\x4d\x3c\x2b\x1a' else '>'
+    u32 = struct.Struct(endian + 'I')
+    block_len = u32.unpack(first[4:8])[0]
+    f.read(block_len - len(first))
+    interfaces = []  # (linktype, ts resolution)
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+        block_type, block_len = struct.unpack(endian + 'II', head)
+        body = f.read(block_len - 8)
+        if len(body) < block_len - 8:
+            return
+        if block_type == PCAPNG_SHB:
+            endian = '<' if body[0:4] == b'\x4d\x3c\x2b\x1a' else '>'
+            interfaces = []
+        elif block_type == 1:  # Interface description
+            linktype = struct.unpack(endian + 'H', body[0:2])[0]
+            resolution = 1e-6
+            opt = 8
+            while opt + 4 <= len(body) - 4:
+                code, olen = struct.unpack(endian + 'HH', body[opt:opt + 4])
+                if code == 0:
+                    break
+                if code == 9 and olen >= 1:  # if_tsresol
+                    v = body[opt + 4]
+                    resolution = 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+                opt += 4 + ((olen + 3) & ~3)
+            interfaces.append((linktype, resolution))
+        elif block_type == 6:  # Enhanced packet
+            iface, ts_hi, ts_lo, caplen, wirelen = struct.unpack(endian + 'IIIII', body[0:20])
+            linktype, resolution = interfaces[iface] if iface < len(interfaces) else (LINKTYPE_ETHERNET, 1e-6)
+            yield ((ts_hi << 32) | ts_lo) * resolution, body[20:20 + caplen], wirelen, linktype
+        elif block_type == 3:  # Simple packet
+            wirelen = struct.unpack(endian + 'I', body[0:4])[0]
+            linktype = interfaces[0][0] if interfaces else LINKTYPE_ETHERNET
+            yield 0.0, body[4:4 + wirelen], wirelen, linktype
+
+
+def read_pcap(path):
+    """Yield (timestamp, data, wire_length, linktype) for each record of a pcap or pcapng file."""
+    with open(path, 'rb') as f:
+        header = f.read(24)
+        if len(header) < 12:
+            return
+        if header[:4] in PCAP_MAGIC:
+            yield from _read_pcap(f, header)
+        elif struct.unpack('<I', header[:4])[0] == PCAPNG_SHB:
+            yield from _read_pcapng(f, header)
+        else:
+            raise ValueError(f'{path} is not a pcap or pcapng file')
+
+
+def iter_pcap_packets(path):
+    """Yield a DecodedPacket (or None for non-IP frames) per pcap record."""
+    for ts, data, wirelen, linktype in read_pcap(path):
+        yield decode_frame(data, linktype, ts, wirelen)
@@ -0,0 +1,71 @@
+"""Precompiled feature-vector template for live packet scoring.
+
+The model's column order comes from features.txt. Instead of building a
+~120-key dict and a one-row DataFrame for every captured packet, the
+encoder is built once: a float template in model column order plus a
+name -> column index map. Encoding a packet copies the template and writes
+only the handful of fields the packet actually sets.
+"""
+import numpy as np
+
+# Connection-level fields a lone packet gets when nothing better is known
+PACKET_DEFAULTS = {
+    'count': 1,
+    'srv_count': 1,
+    'dst_host_count': 1,
+    'dst_host_srv_count': 1,
+}
+
+# Protocol one-hot columns, keyed by pyshark's transport_layer value
+PROTOCOL_COLUMNS = {
+    'ICMP': 'protocol_type_icmp',
+    'TCP': 'protocol_type_tcp',
+    'UDP': 'protocol_type_udp',
+}
+
+
+class PacketFeatureEncoder:
+    """Encodes packet fields straight into a model-ordered float vector."""
+
+    def __init__(self, feature_list, defaults=None):
+        self.feature_list = list(feature_list)
+        self.index = {name: i for i, name in enumerate(self.feature_list)}
+        self.template = np.zeros(len(self.feature_list), dtype=np.float64)
+        for name, value in (PACKET_DEFAULTS if defaults is None else defaults).items():
+            col = self.index.get(name)
+            if col is not None:
+                self.template[col] = value
+        # Resolve the columns every packet writes once, up front
+        self._src_bytes = self.index.get('src_bytes')
+        self._dst_bytes = self.index.get('dst_bytes')
+        self._protocol = {proto: self.index.get(col) for proto, col in PROTOCOL_COLUMNS.items()}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as f:
+            return cls([line.strip() for line in f.readlines()])
+
+    def __len__(self):
+        return len(self.feature_list)
+
+    def encode(self, length, proto, fields=None):
+        """Return a fresh feature vector for one packet.
+
+        `fields` optionally maps extra feature names to values; names the
+        model does not know are ignored.
+        """
+        row = self.template.copy()
+        if self._src_bytes is not None:
+            row[self._src_bytes] = length
+        if self._dst_bytes is not None:
+            row[self._dst_bytes] = length
+        col = self._protocol.get(proto)
+        if col is not None:
+            row[col] = 1
+        if fields:
+            index = self.index
+            for name, value in fields.items():
+                col = index.get(name)
+                if col is not None:
+                    row[col] = value
+        return row
@@ -0,0 +1,137 @@
+"""Score large encoded batches on a pool of worker processes.
+
+The pool is persistent: each worker maps the current model version's
+trees once (see forest_arrays, so the forest is shared, not copied) and
+keeps it until a newer version is requested. A batch bigger than
+`min_rows` is written once to a scratch .npy file (in /dev/shm where
+available), split into contiguous row shards, and each worker memory-maps
+its shard instead of receiving a pickled copy. Shard results are joined
+in order, so the output lines up with the input rows.
+
+app.py starts the pool when the first model loads and warms it again
+with every new version, in the background. Small batches, legacy
+(unversioned) models and a broken pool all fall back to scoring in the
+calling process.
+"""
+import atexit
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import model_store
+
+SCORING_WORKERS = int(os.environ.get('IDS_SCORING_WORKERS', 0)) or (os.cpu_count() or 1)
+PARALLEL_MIN_ROWS = int(os.environ.get('IDS_PARALLEL_MIN_ROWS', 20000))
+MAX_SHARD_ROWS = 250000  # Smaller shards balance better when workers run at different speeds
+SCRATCH_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Worker-process state
+_worker_directory = None
+_worker_bundle = None
+
+
+def _init_worker(directory):
+    global _worker_directory
+    _worker_directory = directory
+
+
+def _bundle_for(version):
+    global _worker_bundle
+    if _worker_bundle is None or _worker_bundle.version != version:
+        _worker_bundle = model_store.load(version, directory=_worker_directory)
+    return _worker_bundle
+
+
+def _warm(version, n_features):
+    # Map the arrays and fault their pages in before real work arrives
+    _bundle_for(version).predict(np.zeros((1, n_features)))
+    return os.getpid()
+
+
+def _score_shard(version, path, start, stop):
+    X = np.load(path, mmap_mode='r')[start:stop]
+    return _bundle_for(version).predict(X)
+
+
+class ParallelScorer:
+    """A pool of `workers` scoring processes for one models directory."""
+
+    def __init__(self, workers=SCORING_WORKERS, min_rows=PARALLEL_MIN_ROWS, directory=model_store.MODELS_DIR):
+        self.workers = max(1, workers)
+        self.min_rows = min_rows
+        self.directory = os.path.abspath(directory)
+        self._pool = None
+        self._warm_version = None
+        self._lock = threading.Lock()
+        self.parallel_batches = 0
+        self.local_batches = 0
+
+    def _context(self):
+        # Workers must not be forked from a process running Flask and
+        # watcher threads; forkserver/spawn start them clean
+        methods = multiprocessing.get_all_start_methods()
+        if 'forkserver' in methods:
+            ctx = multiprocessing.get_context('forkserver')
+            ctx.set_forkserver_preload(['numpy', 'parallel_scoring'])
+            return ctx
+        return multiprocessing.get_context('spawn')
+
+    def start(self, bundle=None):
+        """Create the pool (if needed) and pre-warm every worker with `bundle`'s version."""
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=self._context(),
+                                                 initializer=_init_worker, initargs=(self.directory,))
+                atexit.register(self.shutdown)
+            pool = self._pool
+            if bundle is None or not bundle.version or bundle.version == self._warm_version:
+                return pool
+            self._warm_version = bundle.version
+        futures = [pool.submit(_warm, bundle.version, len(bundle.feature_list)) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        return pool
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool, self._warm_version = self._pool, None, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _shards(self, rows):
+        size = min(MAX_SHARD_ROWS, -(-rows // self.workers))
+        return [(start, min(rows, start + size)) for start in range(0, rows, size)]
+
+    def predict(self, bundle, X):
+        """bundle.predict(X), split across the pool when X is large enough."""
+        X = np.asarray(X, dtype=np.float64)
+        # Version 0 is a flat legacy model the workers cannot load by version
+        if self.workers < 2 or len(X) < self.min_rows or not bundle.version:
+            self.local_batches += 1
+            return bundle.predict(X)
+        fd, path = tempfile.mkstemp(suffix='.npy', prefix='ids-score-', dir=SCRATCH_DIR)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, X)
+            pool = self.start(bundle)
+            futures = [pool.submit(_score_shard, bundle.version, path, start, stop)
+                       for start, stop in self._shards(len(X))]
+            results = [future.result() for future in futures]
+            self.parallel_batches += 1
+            return np.concatenate(results)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); rebuild on next use
+            self.shutdown()
+            self.local_batches += 1
+            return bundle.predict(X)
+        finally:
+            os.unlink(path)
+
+    def stats(self):
+        return {'workers': self.workers, 'min_rows': self.min_rows, 'running': self._pool is not None,
+                'parallel_batches': self.parallel_batches, 'local_batches': self.local_batches}
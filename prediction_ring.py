@@ -0,0 +1,126 @@
+"""Fixed-capacity ring buffer of live predictions with sequence cursors.
+
+Every appended prediction gets a monotonically increasing sequence number.
+Readers ask for entries after a cursor (`since`) and get back only the new
+ones plus the next cursor, so a dashboard polling every second copies and
+transfers deltas instead of the whole buffer. Fields are stored column-wise
+in preallocated slots (numbers and small enumerations in compact arrays),
+appends never shift anything, and the lock is held only to copy slices;
+dicts for the JSON response are built after it is released.
+"""
+import threading
+from array import array
+
+
+class _Codes:
+    """Maps a small set of repeated strings (protocols, labels) to byte codes."""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            if len(self.values) >= 255:
+                value = 'Other'
+                code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+        return code
+
+
+class PredictionRing:
+    """Live prediction buffer keeping the most recent `capacity` entries."""
+
+    def __init__(self, capacity=1000, lock=None):
+        self.capacity = capacity
+        self.lock = lock if lock is not None else threading.Lock()
+        self.next_seq = 0  # Sequence number the next append will get
+        self._timestamp = [None] * capacity
+        self._src = [None] * capacity
+        self._dst = [None] * capacity
+        self._length = array('q', bytes(8 * capacity))
+        self._protocol = array('B', bytes(capacity))
+        self._prediction = array('B', bytes(capacity))
+        self._protocols = _Codes()
+        self._predictions = _Codes()
+
+    def __len__(self):
+        return min(self.next_seq, self.capacity)
+
+    def _store(self, result):
+        i = self.next_seq % self.capacity
+        self._timestamp[i] = result['timestamp']
+        self._src[i] = result['src']
+        self._dst[i] = result['dst']
+        self._length[i] = int(result['length'])
+        self._protocol[i] = self._protocols.code(result['protocol'])
+        self._prediction[i] = self._predictions.code(result['prediction'])
+        self.next_seq += 1
+
+    def append(self, result):
+        with self.lock:
+            self._store(result)
+
+    def extend(self, results):
+        """Append a batch of results under a single lock acquisition."""
+        with self.lock:
+            for result in results:
+                self._store(result)
+
+    def _copy(self, start, stop):
+        # Copy the [start, stop) sequence range, which may wrap around
+        cap = self.capacity
+        a, b = start % cap, stop % cap
+        if stop - start == 0:
+            ranges = []
+        elif a < b:
+            ranges = [(a, b)]
+        else:
+            ranges = [(a, cap), (0, b)]
+        columns = (self._timestamp, self._src, self._dst, self._protocol, self._length, self._prediction)
+        return [[x for lo, hi in ranges for x in col[lo:hi]] for col in columns]
+
+    def snapshot(self, since=None, limit=100):
+        """Return (entries, next_cursor, dropped).
+
+        With `since`, entries with sequence >= since are returned oldest
+        first, at most `limit` of them; pass the returned cursor back to
+        continue. Without it, the latest `limit` entries are returned.
+        `dropped` counts entries after `since` that were already
+        overwritten before this read.
+        """
+        limit = max(0, int(limit))
+        with self.lock:
+            head = self.next_seq
+            oldest = max(0, head - self.capacity)
+            if since is None:
+                start = max(oldest, head - limit)
+                dropped = 0
+            else:
+                since = max(0, int(since))
+                start = min(max(since, oldest), head)
+                dropped = max(0, oldest - since)
+            stop = min(head, start + limit)
+            columns = self._copy(start, stop)
+            protocols = list(self._protocols.values)
+            predictions = list(self._predictions.values)
+        entries = [
+            {
+                'seq': start + n,
+                'timestamp': ts,
+                'src': src,
+                'dst': dst,
+                'protocol': protocols[proto],
+                'length': length,
+                'prediction': predictions[pred],
+            }
+            for n, (ts, src, dst, proto, length, pred) in enumerate(zip(*columns))
+        ]
+        return entries, stop, dropped
+
+    def latest(self, n):
+        """The latest `n` entries, oldest first."""
+        return self.snapshot(limit=n)[0]
@@ -0,0 +1,263 @@
+"""On-demand profiling sessions for a bounded window, written to downloadable reports.
+
+Two modes:
+
+- 'sampler': a background thread reads every thread's stack with
+  sys._current_frames() every `interval` seconds (request threads,
+  batcher, writers, and the capture loop when it runs in the same
+  process). Cheap enough to run in production; gives top functions by
+  samples and collapsed stacks for flame graphs (flamegraph.pl,
+  speedscope).
+- 'cprofile': deterministic cProfile of a `fraction` of API requests,
+  merged into one pstats file and a top-functions report.
+
+Nothing is installed while no session runs: the sampler thread only
+exists during a session, and the request hooks return after one
+attribute check. A session ends at its deadline (or when stopped) and
+writes its reports to PROFILE_DIR/<session id>/.
+
+A session covers only the process that started it. Under serve.py,
+/admin/profile profiles the one API worker that received the request,
+never the whole system, and the capture process runs its own sessions
+on SIGUSR1 (see live_packet_capture). Ids carry the start time to the
+millisecond and the pid, so sessions of different processes sharing
+PROFILE_DIR never write to the same directory.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_DIR = os.environ.get('IDS_PROFILE_DIR', 'profiles')
+PROFILE_MODES = ('sampler', 'cprofile')
+MAX_PROFILE_SECONDS = 600
+DEFAULT_INTERVAL = 0.01  # Sampler period; ~100 stack reads per second
+TOP_FUNCTIONS = 50
+REPORT_FILES = ('top.txt', 'collapsed.txt', 'profile.pstats', 'session.json')
+
+
+class ProfileBusy(Exception):
+    """Raised when a session is already running."""
+
+
+def _frame_name(code):
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Session:
+    """One profiling window and what it has collected so far."""
+
+    def __init__(self, mode, seconds, fraction=1.0, interval=DEFAULT_INTERVAL, directory=PROFILE_DIR):
+        now = time.time()
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}-{mode}-{os.getpid()}"
+        self.mode = mode
+        self.seconds = seconds
+        self.fraction = fraction
+        self.interval = interval
+        self.directory = os.path.join(directory, self.id)
+        self.started = now
+        self.deadline = time.monotonic() + seconds
+        self.finished = None
+        self.samples = 0
+        self.requests = 0
+        self.skipped = 0  # Requests not profiled because another profiler was active
+        self.stacks = Counter()  # (thread name, outer frame, ..., inner frame) -> samples
+        self.stats = None  # pstats.Stats merged over profiled requests
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def active(self):
+        return self.finished is None and time.monotonic() < self.deadline
+
+    def sample(self):
+        """Record the current stack of every thread but the sampler's own."""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f'thread-{ident}'))
+            self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= self.deadline:
+                break
+            self.sample()
+
+    def add_profile(self, profile):
+        with self._lock:
+            self.requests += 1
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'mode': self.mode,
+            'seconds': self.seconds,
+            'fraction': self.fraction if self.mode == 'cprofile' else None,
+            'interval_ms': round(self.interval * 1000, 3) if self.mode == 'sampler' else None,
+            'started': self.started,
+            'finished': self.finished,
+            'active': self.active(),
+            'samples': self.samples,
+            'profiled_requests': self.requests,
+            'skipped_requests': self.skipped,
+        }
+
+    def top_sampled(self, n=TOP_FUNCTIONS):
+        """(function, self samples, total samples) for the `n` functions seen in most stacks."""
+        own, total = Counter(), Counter()
+        for stack, samples in self.stacks.items():
+            own[stack[-1]] += samples
+            for name in set(stack[1:]):
+                total[name] += samples
+        return [(name, own[name], samples) for name, samples in total.most_common(n)]
+
+    def write(self):
+        """Write this session's reports; returns the file names written."""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        out = io.StringIO()
+        if self.mode == 'sampler':
+            out.write(f'{self.samples} samples every {self.interval * 1000:g} ms, all threads. Percentages are of '
+                      f'samples, per thread, so a function on several threads can exceed 100%. Threads waiting '
+                      f'(sleep, Condition.wait, recv) show up too.\n\n')
+            out.write(f"{'total %':>8} {'self %':>8}  function\n")
+            for name, own, total in self.top_sampled():
+                out.write(f'{total / max(self.samples, 1):>8.1%} {own / max(self.samples, 1):>8.1%}  {name}\n')
+            with open(os.path.join(self.directory, 'collapsed.txt'), 'w') as f:
+                for stack, samples in sorted(self.stacks.items()):
+                    f.write(f"{';'.join(frame.replace(';', ':') for frame in stack)} {samples}\n")
+            files.append('collapsed.txt')
+        elif self.stats is not None:
+            out.write(f'{self.requests} profiled requests ({self.fraction:.0%} sampled)\n\n')
+            with self._lock:
+                self.stats.stream = out
+                self.stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+                self.stats.dump_stats(os.path.join(self.directory, 'profile.pstats'))
+            files.append('profile.pstats')
+        else:
+            out.write('No requests were profiled\n')
+        with open(os.path.join(self.directory, 'top.txt'), 'w') as f:
+            f.write(out.getvalue())
+        with open(os.path.join(self.directory, 'session.json'), 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return ['top.txt'] + files + ['session.json']
+
+
+class Profiler:
+    """At most one Session at a time, with the request hooks for cProfile mode."""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.session = None  # The running session, None when off
+        self.last = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self, mode='sampler', seconds=30, fraction=0.1, interval=DEFAULT_INTERVAL):
+        """Start a session; raises ProfileBusy if one is running, ValueError for bad arguments."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f'mode must be one of {", ".join(PROFILE_MODES)}')
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError(f'seconds must be in (0, {MAX_PROFILE_SECONDS}]')
+        if not 0 < fraction <= 1 or interval <= 0:
+            raise ValueError('fraction must be in (0, 1] and interval positive')
+        with self._lock:
+            if self.session is not None:
+                raise ProfileBusy(f'session {self.session.id} is running')
+            session = self.session = Session(mode, seconds, fraction, interval, self.directory)
+        if mode == 'sampler':
+            session._thread = threading.Thread(target=self._run_sampler, args=(session,), name='profile-sampler',
+                                               daemon=True)
+            session._thread.start()
+        else:
+            timer = threading.Timer(seconds, self.stop, args=(session,))
+            timer.daemon = True
+            timer.start()
+        return session
+
+    def _run_sampler(self, session):
+        session._sample_loop()
+        self.stop(session)
+
+    def stop(self, session=None):
+        """End the running session (or `session`, if still running) and write its reports."""
+        with self._lock:
+            current = self.session
+            if current is None or (session is not None and session is not current):
+                return None
+            self.session = None
+            current.finished = time.time()
+        current._stop.set()
+        if current._thread is not None and current._thread is not threading.current_thread():
+            current._thread.join()  # Let the last sample finish before writing
+        try:
+            current.write()
+        except Exception as e:
+            print(f"Error writing profile {current.id}: {e}")
+        self.last = current
+        return current
+
+    # Request hooks: a single attribute check when no cProfile session runs
+    def before_request(self):
+        session = self.session
+        if session is None or session.mode != 'cprofile' or not session.active():
+            return
+        if random.random() >= session.fraction:
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # Another profiler is active (one at a time from Python 3.12)
+            session.skipped += 1
+            return
+        self._local.profile = (session, profile)
+
+    def after_request(self):
+        entry = getattr(self._local, 'profile', None)
+        if entry is None:
+            return
+        self._local.profile = None
+        session, profile = entry
+        profile.disable()
+        session.add_profile(profile)
+
+    def reports(self):
+        """Saved sessions, newest first."""
+        try:
+            names = sorted(os.listdir(self.directory), reverse=True)
+        except OSError:
+            return []
+        reports = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if not os.path.isdir(path):
+                continue
+            reports.append({'id': name, 'files': [f for f in REPORT_FILES if os.path.exists(os.path.join(path, f))]})
+        return reports
+
+    def status(self):
+        session = self.session
+        return {
+            'session': session.to_dict() if session is not None else None,
+            'last': self.last.to_dict() if self.last is not None else None,
+            'modes': list(PROFILE_MODES),
+            'reports': self.reports(),
+        }
@@ -0,0 +1,105 @@
+"""Versioned JSON responses with ETags for the polled read-only endpoints.
+
+An endpoint passes a version (any tuple of counters that changes
+whenever its payload would) and a function that builds the payload. The
+ETag is derived from the version alone, so a matching If-None-Match is
+answered with 304 before anything is read. Otherwise the serialized body
+is reused for as long as the version stays the same, and compressed
+once per version for clients that accept gzip.
+
+ETags are hashed from shared versions (state ids, model version), so
+they agree across workers, and from the state's epoch: the counters
+restart with a new process or database, and an ETag from before that
+must not match a different payload now. Payloads that also change with the clock
+(uptimes, time windows) add time_bucket() to their version.
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+
+from flask import Response, current_app, request
+
+CACHE_BUCKET_SECONDS = float(os.environ.get('IDS_CACHE_BUCKET_SECONDS', 5.0))
+GZIP_MIN_BYTES = int(os.environ.get('IDS_GZIP_MIN_BYTES', 1024))  # Smaller bodies are not worth compressing
+GZIP_LEVEL = 6
+
+
+def time_bucket(seconds=CACHE_BUCKET_SECONDS):
+    """A version part that changes every `seconds`, for time-dependent payloads."""
+    return int(time.time() // seconds)
+
+
+def make_etag(name, version, epoch=None):
+    return hashlib.blake2b(repr((epoch, name, version)).encode(), digest_size=8).hexdigest()
+
+
+class _Entry:
+    def __init__(self, version, etag, body):
+        self.version = version
+        self.etag = etag
+        self.body = body
+        self.gzipped = None
+
+
+class ResponseCache:
+    """The latest serialized payload of each endpoint, keyed by version.
+
+    `epoch` goes into every ETag; pass the state's epoch (see shared_state).
+    """
+
+    def __init__(self, epoch=None, gzip_min_bytes=GZIP_MIN_BYTES, gzip_level=GZIP_LEVEL):
+        self.epoch = epoch
+        self.gzip_min_bytes = gzip_min_bytes
+        self.gzip_level = gzip_level
+        self._entries = {}  # name -> _Entry
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def respond(self, name, version, build):
+        """A response for `name` at `version`; `build()` is only called for a version not seen yet.
+
+        Read the version before the data: a payload built after the state
+        moved on is then newer than its ETag says, never older.
+        """
+        etag = make_etag(name, version, self.epoch)
+        if request.if_none_match.contains_weak(etag):
+            with self._lock:
+                self.not_modified += 1
+            return self._finish(Response(status=304), etag)
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is None or entry.etag != etag:
+            entry = _Entry(version, etag, current_app.json.response(build()).get_data())
+            with self._lock:
+                self._entries[name] = entry
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        body = entry.body
+        compress = len(body) >= self.gzip_min_bytes and request.accept_encodings['gzip']
+        if compress:
+            if entry.gzipped is None:
+                entry.gzipped = gzip.compress(body, self.gzip_level)
+            body = entry.gzipped
+        response = Response(body, mimetype='application/json')
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        return self._finish(response, etag)
+
+    @staticmethod
+    def _finish(response, etag):
+        # Weak, since the same version is sent both plain and gzipped
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'  # Browsers revalidate with If-None-Match
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'not_modified': self.not_modified}
@@ -0,0 +1,347 @@
+"""Retraining job queue: one worker, a bounded backlog, duplicate jobs merged.
+
+/upload and /retrain submit jobs here instead of starting a thread each,
+so trainings never run concurrently. Schedulers given the same `lock`
+(app.py shares one between retraining and model comparison) also never
+run at the same time as each other. A job for a file that is already
+queued (or running on the same, unchanged file) is merged into the
+existing job rather than queued again. Finished jobs are kept for
+`max_history` lookups through /jobs/<id>.
+
+With IDS_STATE_BACKEND=sqlite (several API workers, see serve.py) the
+queue lives in the shared database instead, so job ids are unique and
+any worker can report any job. Every worker polls the queue, but a job
+only runs while its worker holds a lock file, so trainings still run
+one at a time across all of them.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import shared_state
+
+try:
+    import fcntl
+except ImportError:  # Windows: serve.py runs a single process there
+    fcntl = None
+
+TRAINING_LOCK_FILE = os.environ.get('IDS_TRAINING_LOCK', 'training.lock')
+JOB_POLL_SECONDS = 2.0  # How soon a worker notices a job queued by another process
+
+
+class QueueFull(Exception):
+    """Raised when the retraining backlog is at capacity."""
+
+
+class Job:
+    """One retraining request and its progress."""
+
+    def __init__(self, job_id, data_path, key, options=None):
+        self.id = job_id
+        self.data_path = data_path
+        self.key = key
+        self.options = dict(options or {})  # Passed through to the training function
+        self.state = 'queued'  # queued -> running -> succeeded | failed
+        self.progress = 0.0
+        self.stage = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = None
+        self.merged = 0  # Later requests folded into this job
+
+    def report(self, progress, stage):
+        """Progress callback for the training function (0.0 - 1.0)."""
+        self.progress = round(float(progress), 3)
+        self.stage = stage
+
+    def to_dict(self):
+        now = time.time()
+        return {
+            'id': self.id,
+            'state': self.state,
+            'file': os.path.basename(self.data_path),
+            'options': self.options,
+            'progress': self.progress,
+            'stage': self.stage,
+            'merged_requests': self.merged,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'queued_seconds': round((self.started or now) - self.created, 3),
+            'run_seconds': round((self.finished or now) - self.started, 3) if self.started else None,
+            'error': self.error,
+            'result': self.result,
+        }
+
+
+class TrainingLock:
+    """Held while a job trains: a thread lock, plus an flock on `path` across processes.
+
+    The OS drops the file lock when its holder exits, so a crashed
+    worker never leaves it taken.
+    """
+
+    def __init__(self, path=TRAINING_LOCK_FILE):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._lock.acquire(blocking):
+            return False
+        if fcntl is not None:
+            f = open(self.path, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except OSError:
+                f.close()
+                self._lock.release()
+                return False
+            self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()  # Closing the descriptor drops the flock
+            self._file = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+def _file_key(path):
+    try:
+        st = os.stat(path)
+        return (os.path.abspath(path), st.st_size, st.st_mtime)
+    except OSError:
+        return (os.path.abspath(path), None, None)
+
+
+class RetrainScheduler:
+    """Runs `train_fn(data_path, job)` for submitted jobs on a single worker thread.
+
+    Each job runs while holding `lock`; pass the same lock to several
+    schedulers to run their jobs one at a time overall.
+    """
+
+    def __init__(self, train_fn, max_queued=8, max_history=100, name='retrain', lock=None):
+        self.train_fn = train_fn
+        self.name = name
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.lock = lock or threading.Lock()
+        self._jobs = OrderedDict()  # id -> Job, oldest first
+        self._queue = deque()
+        self._running = None
+        self._ids = itertools.count(1)
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, data_path, options=None):
+        """Queue a retrain of `data_path`. Returns (job, merged).
+
+        Only a job for the same file with the same `options` is merged.
+        """
+        key = _file_key(data_path) + (tuple(sorted((options or {}).items())),)
+        with self._cond:
+            for job in itertools.chain(self._queue, [self._running] if self._running else []):
+                if job.key == key:
+                    job.merged += 1
+                    return job, True
+            if len(self._queue) >= self.max_queued:
+                raise QueueFull(f'{len(self._queue)} retraining jobs already queued')
+            job = Job(next(self._ids), data_path, key, options)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._trim()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'{self.name}-worker', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return job, False
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond max_history
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        """All known jobs, newest first."""
+        with self._cond:
+            return list(reversed(self._jobs.values()))
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._running = self._queue.popleft()
+            job.report(0.0, 'waiting for another training')
+            with self.lock:
+                job.state = 'running'
+                job.started = time.time()
+                job.report(0.0, 'starting')
+                try:
+                    job.result = self.train_fn(job.data_path, job)
+                    job.state = 'succeeded'
+                    job.report(1.0, 'done')
+                except Exception as e:
+                    job.state = 'failed'
+                    job.error = str(e)
+                    job.stage = 'failed'
+                job.finished = time.time()
+            with self._cond:
+                self._running = None
+                self._trim()
+
+
+class SqliteRetrainScheduler:
+    """RetrainScheduler's interface over the `jobs` table of a shared SqliteStore.
+
+    Each process runs a worker thread that takes the oldest queued job of
+    this queue while holding `lock`. A job still 'running' when a worker
+    gets the lock belonged to a process that died, and is failed.
+    """
+
+    def __init__(self, train_fn, store, max_queued=8, max_history=100, name='retrain', lock=None,
+                 poll_seconds=JOB_POLL_SECONDS):
+        self.train_fn = train_fn
+        self.store = store
+        self.name = name
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self.lock = lock or TrainingLock()
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        # Started right away: jobs queued by a worker that has since exited still run
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, data_path, options=None):
+        options = dict(options or {})
+        key = json.dumps(list(_file_key(data_path)) + [sorted(options.items())])
+        with self.store.transaction() as db:
+            row = db.execute("SELECT id FROM jobs WHERE queue = ? AND key = ? AND state IN ('queued', 'running') "
+                             "ORDER BY id LIMIT 1", (self.name, key)).fetchone()
+            if row is not None:
+                job_id, merged = row[0], True
+                db.execute('UPDATE jobs SET merged = merged + 1 WHERE id = ?', (job_id,))
+            else:
+                queued = db.execute("SELECT COUNT(*) FROM jobs WHERE queue = ? AND state = 'queued'",
+                                    (self.name,)).fetchone()[0]
+                if queued >= self.max_queued:
+                    raise QueueFull(f'{queued} retraining jobs already queued')
+                job_id, merged = db.execute(
+                    "INSERT INTO jobs (queue, state, data_path, key, options, progress, stage, created) "
+                    "VALUES (?, 'queued', ?, ?, ?, 0, 'queued', ?)",
+                    (self.name, data_path, key, json.dumps(options), time.time())).lastrowid, False
+        self._wake.set()
+        return self.get(job_id), merged
+
+    _COLUMNS = 'id, data_path, options, state, progress, stage, created, started, finished, error, result, merged'
+
+    @staticmethod
+    def _job(row):
+        job_id, data_path, options, state, progress, stage, created, started, finished, error, result, merged = row
+        job = Job(job_id, data_path, None, json.loads(options))
+        job.state, job.progress, job.stage, job.merged = state, progress, stage, merged
+        job.created, job.started, job.finished, job.error = created, started, finished, error
+        job.result = json.loads(result) if result is not None else None
+        return job
+
+    def get(self, job_id):
+        rows = self.store.query(f'SELECT {self._COLUMNS} FROM jobs WHERE queue = ? AND id = ?', (self.name, job_id))
+        return self._job(rows[0]) if rows else None
+
+    def jobs(self):
+        """The last `max_history` finished jobs and every pending one, newest first."""
+        rows = self.store.query(f'SELECT {self._COLUMNS} FROM jobs WHERE queue = ? ORDER BY id DESC',
+                                (self.name,))
+        return [self._job(row) for row in rows]
+
+    def queue_depth(self):
+        return self.store.query("SELECT COUNT(*) FROM jobs WHERE queue = ? AND state = 'queued'", (self.name,))[0][0]
+
+    def _update(self, job_id, **fields):
+        with self.store.transaction() as db:
+            db.execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                       (*fields.values(), job_id))
+
+    def _claim(self):
+        """Fail jobs orphaned by a dead worker and mark the oldest queued one running (lock held)."""
+        now = time.time()
+        with self.store.transaction() as db:
+            db.execute("UPDATE jobs SET state = 'failed', stage = 'failed', finished = ?, "
+                       "error = 'the worker running it exited' WHERE queue = ? AND state = 'running'",
+                       (now, self.name))
+            row = db.execute("SELECT id FROM jobs WHERE queue = ? AND state = 'queued' ORDER BY id LIMIT 1",
+                             (self.name,)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE jobs SET state = 'running', stage = 'starting', progress = 0, started = ?, owner = ? "
+                       "WHERE id = ?", (now, os.getpid(), row[0]))
+        job = self.get(row[0])
+        job.report = lambda progress, stage: self._report(job, progress, stage)
+        return job
+
+    def _report(self, job, progress, stage):
+        Job.report(job, progress, stage)
+        self._update(job.id, progress=job.progress, stage=job.stage)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            try:
+                if not self.queue_depth():
+                    continue
+                with self.lock:  # Waits here while another worker trains
+                    job = self._claim()
+                    if job is not None:
+                        self._execute(job)
+                        self._wake.set()  # Look for the next job right away
+            except Exception as e:
+                print(f"Error in {self.name} job worker: {e}")
+
+    def _execute(self, job):
+        try:
+            result = self.train_fn(job.data_path, job)
+            self._update(job.id, state='succeeded', progress=1.0, stage='done', finished=time.time(),
+                         result=json.dumps(result, default=str))
+        except Exception as e:
+            self._update(job.id, state='failed', stage='failed', finished=time.time(), error=str(e))
+        with self.store.transaction() as db:
+            # Forget the oldest finished jobs beyond max_history
+            db.execute('DELETE FROM jobs WHERE queue = ? AND finished IS NOT NULL AND id NOT IN '
+                       '(SELECT id FROM jobs WHERE queue = ? AND finished IS NOT NULL ORDER BY id DESC LIMIT ?)',
+                       (self.name, self.name, self.max_history))
+
+
+def open_scheduler(train_fn, max_queued=8, max_history=100, name='retrain', backend=None, lock=None):
+    """A job scheduler for the configured state backend (see shared_state).
+
+    Schedulers sharing a `lock` (a TrainingLock) never run jobs concurrently.
+    """
+    backend = backend or shared_state.STATE_BACKEND
+    if backend == 'sqlite':
+        return SqliteRetrainScheduler(train_fn, shared_state.open_store(), max_queued, max_history, name, lock)
+    return RetrainScheduler(train_fn, max_queued, max_history, name, lock)
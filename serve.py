@@ -0,0 +1,103 @@
+"""Production serving: the API under a multi-worker WSGI server, capture in its own process.
+
+    python serve.py --workers 4 --threads 8 [--interface eth0] [--no-capture]
+
+State shared between processes (prediction history, metrics, status
+counters, live predictions) goes through the SQLite store in
+shared_state, so any worker can answer any request. Gunicorn is used
+when installed (Linux/macOS); otherwise waitress serves a single
+multi-threaded process. The app is imported by each worker after the
+fork, never before, so background threads are not forked.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def start_capture(interface=None, backend=None):
+    """Run live_packet_capture.py as a child process sharing the state store."""
+    cmd = [sys.executable, os.path.join(HERE, 'live_packet_capture.py')]
+    if interface:
+        cmd += ['--interface', interface]
+    if backend:
+        cmd += ['--backend', backend]
+    return subprocess.Popen(cmd, env=os.environ.copy())
+
+
+def run_gunicorn(host, port, workers, threads, timeout):
+    from gunicorn.app.base import BaseApplication
+
+    class IDSApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    IDSApplication({
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': timeout,
+    }).run()
+
+
+def run_waitress(host, port, threads):
+    from waitress import serve
+    from app import app
+    serve(app, host=host, port=port, threads=threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the IDS API with multiple workers')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=max(2, min(os.cpu_count() or 2, 8)))
+    parser.add_argument('--threads', type=int, default=8, help='Threads per worker')
+    parser.add_argument('--timeout', type=int, default=120, help='Worker timeout in seconds (gunicorn)')
+    parser.add_argument('--state-db', default=os.environ.get('IDS_STATE_DB', 'ids_state.db'))
+    parser.add_argument('--no-capture', action='store_true', help='Do not start the live capture process')
+    parser.add_argument('--interface', default=None, help='Capture interface (default: auto)')
+    parser.add_argument('--capture-backend', choices=['raw', 'pyshark'], default=None)
+    args = parser.parse_args()
+
+    # Must be set before app or live_packet_capture is imported anywhere
+    os.environ['IDS_STATE_BACKEND'] = 'sqlite'
+    os.environ['IDS_STATE_DB'] = os.path.abspath(args.state_db)
+    # Each process publishes its telemetry here so any worker's /telemetry covers all of them
+    os.environ.setdefault('IDS_TELEMETRY_DIR', os.path.abspath('telemetry'))
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+    # Every worker has its own scoring pool; split the cores between them
+    workers = args.workers if gunicorn is not None else 1
+    os.environ.setdefault('IDS_SCORING_WORKERS', str(max(1, (os.cpu_count() or 1) // workers)))
+    # Each /stream client holds a server thread; leave at least two for ordinary requests
+    os.environ.setdefault('IDS_STREAM_MAX_CLIENTS', str(max(1, args.threads - 2)))
+
+    capture = None if args.no_capture else start_capture(args.interface, args.capture_backend)
+    try:
+        if gunicorn is not None:
+            run_gunicorn(args.host, args.port, args.workers, args.threads, args.timeout)
+        else:
+            print('gunicorn not installed; serving one process with waitress')
+            run_waitress(args.host, args.port, args.threads)
+    finally:
+        if capture is not None:
+            capture.terminate()
+            capture.wait()
+
+
+if __name__ == '__main__':
+    main()
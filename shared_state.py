@@ -0,0 +1,521 @@
+"""State shared by API workers and the capture process.
+
+Two interchangeable backends, picked with IDS_STATE_BACKEND:
+
+- 'memory' (default): process globals, as under the single-process dev
+  server. The capture thread and the API share one PredictionRing.
+- 'sqlite': one SQLite database in WAL mode (IDS_STATE_DB, default
+  ids_state.db). Every API worker and the separate capture process open
+  it, so any worker can answer /history, /metrics, /system-status,
+  /live-predictions, /alerts and /explain/<id> for predictions made (and
+  alerts raised) by any other.
+
+Both backends expose the same methods, so callers never check which one
+is in use. Tables are trimmed as they are written, keeping only what the
+endpoints can ask for (recent rows, the status windows, running totals).
+versions() gives counters that move whenever history, the prediction
+stats, the labelled metrics or the threats change, so responses built
+from them can be cached (see response_cache). Counters start over with
+a new process (memory) or database (sqlite), so `epoch`, the time that
+state was created, tells such restarts apart.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from prediction_ring import PredictionRing
+from streaming_metrics import ConfusionMatrix, MetricsAccumulator, PredictionStats
+
+STATE_BACKEND = os.environ.get('IDS_STATE_BACKEND', 'memory')
+STATE_DB = os.environ.get('IDS_STATE_DB', 'ids_state.db')
+
+HISTORY_SIZE = 1000  # Predictions kept for /history
+THREATS_SIZE = 100  # Active threats kept for /system-status
+ALERTS_SIZE = 100  # Alerts kept for /alerts
+STATS_BUCKET_SECONDS = 60  # SQLite time-window counts are kept per minute
+METRIC_WINDOWS = ('last_n', 'last_minutes')
+
+
+class MemoryState:
+    """Per-process state; correct only when one process serves every request."""
+
+    def __init__(self, window_count=1000, window_seconds=15 * 60, max_explainable=10000):
+        self.window_count = window_count
+        self.window_seconds = window_seconds
+        self.max_explainable = max_explainable
+        self.windows = METRIC_WINDOWS
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._threats = deque(maxlen=THREATS_SIZE)
+        self._rows = OrderedDict()  # id -> (model version, encoded row, class index)
+        self._stats = PredictionStats(window_count=window_count, window_seconds=window_seconds)
+        self._metrics = MetricsAccumulator(window_count=window_count, window_seconds=window_seconds)
+        self._versions = {'stats': 0, 'metrics': 0, 'threats': 0}
+        self.epoch = repr(time.time())
+
+    def record_predictions(self, rows, now=None):
+        """Record (prediction, label) pairs; returns their new ids."""
+        with self._lock:
+            ids = list(range(self._next_id, self._next_id + len(rows)))
+            self._next_id += len(rows)
+            for prediction_id, (prediction, label) in zip(ids, rows):
+                self._history.append({'id': prediction_id, 'prediction': prediction, 'label': label})
+        self._stats.record((prediction for prediction, _ in rows), now)
+        labelled = [(str(label), prediction) for prediction, label in rows if label is not None]
+        if labelled:
+            self._metrics.update(labelled, now)
+        # Bumped after the update, so a reader never pairs a new version with old data
+        with self._lock:
+            self._versions['stats'] += 1
+            if labelled:
+                self._versions['metrics'] += 1
+        return ids
+
+    def versions(self):
+        """{'history', 'stats', 'metrics', 'threats'}: each changes whenever that part does."""
+        with self._lock:
+            return dict(self._versions, history=self._next_id - 1)
+
+    def history(self, n=50):
+        with self._lock:
+            return list(self._history)[-n:]
+
+    def history_since(self, since=None, limit=100):
+        """(entries, next_id): predictions with id >= since, oldest first, or the latest `limit`."""
+        with self._lock:
+            if since is None:
+                entries = list(self._history)[-limit:]
+            else:
+                entries = [entry for entry in self._history if entry['id'] >= since][:limit]
+            next_id = entries[-1]['id'] + 1 if entries else (self._next_id if since is None else since)
+        return entries, next_id
+
+    def prediction_stats(self):
+        return self._stats.snapshot()
+
+    def metrics(self, window=None):
+        return self._metrics.metrics(window)
+
+    def add_threat(self, threat):
+        with self._lock:
+            self._threats.append(threat)
+            self._versions['threats'] += 1
+
+    def recent_threats(self, n=10):
+        with self._lock:
+            return list(self._threats)[-n:]
+
+    def remember_rows(self, entries):
+        """Keep (id, model version, encoded row, class index) for /explain/<id>."""
+        with self._lock:
+            for prediction_id, version, row, class_index in entries:
+                self._rows[prediction_id] = (version, np.array(row, dtype=np.float64), class_index)
+            while len(self._rows) > self.max_explainable:
+                self._rows.popitem(last=False)
+
+    def explainable(self, prediction_id):
+        with self._lock:
+            return self._rows.get(prediction_id)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, prediction TEXT NOT NULL, label TEXT);
+CREATE INDEX IF NOT EXISTS predictions_ts ON predictions(ts);
+CREATE TABLE IF NOT EXISTS prediction_counts (prediction TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS recent_counts (prediction TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS prediction_buckets (
+    bucket INTEGER NOT NULL, prediction TEXT NOT NULL, n INTEGER NOT NULL, PRIMARY KEY (bucket, prediction));
+CREATE TABLE IF NOT EXISTS labelled (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, y_true TEXT NOT NULL, y_pred TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS labelled_ts ON labelled(ts);
+CREATE TABLE IF NOT EXISTS confusion (
+    y_true TEXT NOT NULL, y_pred TEXT NOT NULL, n INTEGER NOT NULL, PRIMARY KEY (y_true, y_pred));
+CREATE TABLE IF NOT EXISTS threats (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS alert_levels (level TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS explainable (
+    id INTEGER PRIMARY KEY, version INTEGER NOT NULL, class_index INTEGER NOT NULL, row BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS live (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, src TEXT, dst TEXT, protocol TEXT,
+    length INTEGER, prediction TEXT);
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, state TEXT NOT NULL, data_path TEXT NOT NULL,
+    key TEXT NOT NULL, options TEXT NOT NULL, progress REAL NOT NULL, stage TEXT NOT NULL, created REAL NOT NULL,
+    started REAL, finished REAL, error TEXT, result TEXT, merged INTEGER NOT NULL DEFAULT 0, owner INTEGER);
+CREATE INDEX IF NOT EXISTS jobs_queue_state ON jobs(queue, state);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class SqliteStore:
+    """One SQLite database in WAL mode, with a connection per thread."""
+
+    def __init__(self, path=STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        db = self.connection()
+        db.executescript(_SCHEMA)
+        # Set by the first process to open the database; shared by all of them
+        db.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)", (repr(time.time()),))
+        self.epoch = db.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+
+    def connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def transaction(self):
+        return _Transaction(self.connection())
+
+    def query(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class SqliteState:
+    """MemoryState's interface over a SqliteStore shared between processes.
+
+    The status counters are maintained as predictions are written, like
+    PredictionStats: all-time and last-`window_count` counts per label,
+    and per-minute buckets for the time window (so it is exact to the
+    minute). Reading them never scans the predictions table.
+    """
+
+    def __init__(self, store, window_count=1000, window_seconds=15 * 60, max_explainable=10000,
+                 positive='Malicious'):
+        self.store = store
+        self.window_count = window_count
+        self.window_seconds = window_seconds
+        self.max_explainable = max_explainable
+        self.positive = positive
+        self.windows = METRIC_WINDOWS
+        self.epoch = store.epoch
+        self._backfill_counters()
+
+    def _backfill_counters(self):
+        # Databases written before the recent/bucket counters existed: build them once
+        with self.store.transaction() as db:
+            if db.execute('SELECT 1 FROM recent_counts LIMIT 1').fetchone() is not None \
+                    or db.execute('SELECT 1 FROM predictions LIMIT 1').fetchone() is None:
+                return
+            db.execute('INSERT INTO recent_counts SELECT prediction, COUNT(*) FROM (SELECT prediction FROM '
+                       'predictions ORDER BY id DESC LIMIT ?) GROUP BY prediction', (self.window_count,))
+            db.execute('DELETE FROM prediction_buckets')
+            db.execute('INSERT INTO prediction_buckets SELECT CAST(ts / ? AS INTEGER), prediction, COUNT(*) '
+                       'FROM predictions WHERE ts > ? GROUP BY 1, 2',
+                       (STATS_BUCKET_SECONDS, time.time() - self.window_seconds))
+
+    def _first_bucket(self, now):
+        """The oldest bucket inside the time window ending at `now`."""
+        return int((now - self.window_seconds) // STATS_BUCKET_SECONDS) + 1
+
+    @staticmethod
+    def _add_counts(db, table, counts, sign=1):
+        db.executemany(f'INSERT INTO {table} VALUES (?, ?) ON CONFLICT(prediction) DO UPDATE SET n = n + excluded.n',
+                       [(prediction, sign * n) for prediction, n in counts])
+
+    def record_predictions(self, rows, now=None):
+        now = time.time() if now is None else now
+        counts = {}
+        for prediction, _ in rows:
+            counts[prediction] = counts.get(prediction, 0) + 1
+        labelled = [(str(label), prediction) for prediction, label in rows if label is not None]
+        with self.store.transaction() as db:
+            last = db.execute('SELECT COALESCE(MAX(id), 0) FROM predictions').fetchone()[0]
+            ids = [db.execute('INSERT INTO predictions (ts, prediction, label) VALUES (?, ?, ?)',
+                              (now, prediction, None if label is None else str(label))).lastrowid
+                   for prediction, label in rows]
+            self._add_counts(db, 'prediction_counts', counts.items())
+            # Last window_count: add this batch, take off what it pushed out
+            self._add_counts(db, 'recent_counts', counts.items())
+            if ids:
+                leaving = db.execute('SELECT prediction, COUNT(*) FROM predictions WHERE id > ? AND id <= ? '
+                                     'GROUP BY prediction', (last - self.window_count, ids[-1] - self.window_count))
+                self._add_counts(db, 'recent_counts', leaving.fetchall(), sign=-1)
+                db.execute('DELETE FROM recent_counts WHERE n <= 0')
+            bucket = int(now // STATS_BUCKET_SECONDS)
+            db.executemany('INSERT INTO prediction_buckets VALUES (?, ?, ?) '
+                           'ON CONFLICT(bucket, prediction) DO UPDATE SET n = n + excluded.n',
+                           [(bucket, prediction, n) for prediction, n in counts.items()])
+            db.execute('DELETE FROM prediction_buckets WHERE bucket < ?', (self._first_bucket(now),))
+            if labelled:
+                db.executemany('INSERT INTO labelled (ts, y_true, y_pred) VALUES (?, ?, ?)',
+                               [(now, y_true, y_pred) for y_true, y_pred in labelled])
+                db.executemany('INSERT INTO confusion VALUES (?, ?, 1) '
+                               'ON CONFLICT(y_true, y_pred) DO UPDATE SET n = n + 1', labelled)
+            # Keep what the windows and /history can still ask for; prediction
+            # counts come from the counters, labelled metrics from the rows
+            keep = max(self.window_count, HISTORY_SIZE)
+            db.execute('DELETE FROM predictions WHERE id <= (SELECT MAX(id) FROM predictions) - ?', (keep,))
+            db.execute('DELETE FROM labelled WHERE id <= (SELECT MAX(id) FROM labelled) - ? AND ts < ?',
+                       (keep, now - self.window_seconds))
+        return ids
+
+    def versions(self):
+        # Written in one transaction, so the newest ids move together with the data
+        history, metrics, threats = self.store.query(
+            'SELECT (SELECT COALESCE(MAX(id), 0) FROM predictions), (SELECT COALESCE(MAX(id), 0) FROM labelled), '
+            '(SELECT COALESCE(MAX(id), 0) FROM threats)')[0]
+        return {'history': history, 'stats': history, 'metrics': metrics, 'threats': threats}
+
+    def history(self, n=50):
+        rows = self.store.query('SELECT id, prediction, label FROM predictions ORDER BY id DESC LIMIT ?', (n,))
+        return [{'id': i, 'prediction': p, 'label': l} for i, p, l in reversed(rows)]
+
+    def history_since(self, since=None, limit=100):
+        if since is None:
+            entries = self.history(limit)
+            if not entries:
+                last = self.store.query('SELECT MAX(id) FROM predictions')[0][0]
+                return [], (last or 0) + 1
+        else:
+            rows = self.store.query('SELECT id, prediction, label FROM predictions WHERE id >= ? ORDER BY id LIMIT ?',
+                                    (since, limit))
+            entries = [{'id': i, 'prediction': p, 'label': l} for i, p, l in rows]
+        return entries, entries[-1]['id'] + 1 if entries else since
+
+    @staticmethod
+    def _rate(part, whole):
+        return round(part / max(whole, 1) * 100, 2)
+
+    def prediction_stats(self):
+        now = time.time()
+        db = self.store.connection()
+        db.execute('BEGIN')  # One snapshot for all three
+        try:
+            totals = dict(db.execute('SELECT prediction, n FROM prediction_counts').fetchall())
+            recent = dict(db.execute('SELECT prediction, n FROM recent_counts').fetchall())
+            window = dict(db.execute('SELECT prediction, SUM(n) FROM prediction_buckets WHERE bucket >= ? '
+                                     'GROUP BY prediction', (self._first_bucket(now),)).fetchall())
+        finally:
+            db.execute('COMMIT')
+        total, recent_total, window_total = sum(totals.values()), sum(recent.values()), sum(window.values())
+        positive = totals.get(self.positive, 0)
+        recent_positive = recent.get(self.positive, 0)
+        window_positive = window.get(self.positive, 0)
+        return {
+            'total': total,
+            'positive': positive,
+            'rate': self._rate(positive, total),
+            'counts': totals,
+            'recent_total': recent_total,
+            'recent_positive': recent_positive,
+            'recent_counts': recent,
+            'recent_rate': self._rate(recent_positive, recent_total),
+            'window_total': window_total,
+            'window_positive': window_positive,
+            'window_rate': self._rate(window_positive, window_total),
+        }
+
+    def metrics(self, window=None):
+        matrix = ConfusionMatrix()
+        if window is None:
+            rows = self.store.query('SELECT y_true, y_pred, n FROM confusion')
+        elif window == 'last_n':
+            rows = self.store.query('SELECT y_true, y_pred, COUNT(*) FROM (SELECT y_true, y_pred FROM labelled '
+                                    'ORDER BY id DESC LIMIT ?) GROUP BY y_true, y_pred', (self.window_count,))
+        elif window == 'last_minutes':
+            rows = self.store.query('SELECT y_true, y_pred, COUNT(*) FROM labelled WHERE ts >= ? '
+                                    'GROUP BY y_true, y_pred', (time.time() - self.window_seconds,))
+        else:
+            raise KeyError(window)
+        for y_true, y_pred, n in rows:
+            matrix.add(y_true, y_pred, n)
+        return matrix.metrics()
+
+    def add_threat(self, threat):
+        with self.store.transaction() as db:
+            db.execute('INSERT INTO threats (data) VALUES (?)', (json.dumps(threat),))
+            db.execute('DELETE FROM threats WHERE id <= (SELECT MAX(id) FROM threats) - ?', (THREATS_SIZE,))
+
+    def recent_threats(self, n=10):
+        rows = self.store.query('SELECT data FROM threats ORDER BY id DESC LIMIT ?', (n,))
+        return [json.loads(data) for data, in reversed(rows)]
+
+    def remember_rows(self, entries):
+        with self.store.transaction() as db:
+            db.executemany('INSERT OR REPLACE INTO explainable VALUES (?, ?, ?, ?)',
+                           [(prediction_id, version, class_index, np.asarray(row, dtype=np.float64).tobytes())
+                            for prediction_id, version, row, class_index in entries])
+            db.execute('DELETE FROM explainable WHERE id <= (SELECT MAX(id) FROM explainable) - ?',
+                       (self.max_explainable,))
+
+    def explainable(self, prediction_id):
+        rows = self.store.query('SELECT version, row, class_index FROM explainable WHERE id = ?', (prediction_id,))
+        if not rows:
+            return None
+        version, row, class_index = rows[0]
+        return version, np.frombuffer(row, dtype=np.float64), class_index
+
+
+class SqlitePredictionFeed:
+    """PredictionRing's interface (extend/snapshot/latest) over the shared `live` table.
+
+    Sequence numbers are the table's AUTOINCREMENT ids minus one, so
+    cursors behave exactly like the in-memory ring's.
+    """
+
+    def __init__(self, store, capacity=1000):
+        self.store = store
+        self.capacity = capacity
+
+    def append(self, result):
+        self.extend([result])
+
+    def extend(self, results):
+        with self.store.transaction() as db:
+            db.executemany('INSERT INTO live (timestamp, src, dst, protocol, length, prediction) '
+                           'VALUES (?, ?, ?, ?, ?, ?)',
+                           [(r['timestamp'], r['src'], r['dst'], r['protocol'], int(r['length']), r['prediction'])
+                            for r in results])
+            db.execute('DELETE FROM live WHERE seq <= (SELECT MAX(seq) FROM live) - ?', (self.capacity,))
+
+    @property
+    def next_seq(self):
+        return self.store.query('SELECT COALESCE(MAX(seq), 0) FROM live')[0][0]
+
+    def snapshot(self, since=None, limit=100):
+        """Same contract as PredictionRing.snapshot: (entries, next_cursor, dropped)."""
+        limit = max(0, int(limit))
+        db = self.store.connection()
+        db.execute('BEGIN')
+        try:
+            head, first = db.execute('SELECT COALESCE(MAX(seq), 0), MIN(seq) FROM live').fetchone()
+            oldest = head if first is None else first - 1
+            if since is None:
+                start = max(oldest, head - limit)
+                dropped = 0
+            else:
+                since = max(0, int(since))
+                start = min(max(since, oldest), head)
+                dropped = max(0, oldest - since)
+            rows = db.execute('SELECT seq, timestamp, src, dst, protocol, length, prediction FROM live '
+                              'WHERE seq > ? ORDER BY seq LIMIT ?', (start, limit)).fetchall()
+        finally:
+            db.execute('COMMIT')
+        entries = [{'seq': seq - 1, 'timestamp': ts, 'src': src, 'dst': dst, 'protocol': protocol,
+                    'length': length, 'prediction': prediction}
+                   for seq, ts, src, dst, protocol, length, prediction in rows]
+        return entries, start + len(entries), dropped
+
+    def latest(self, n):
+        return self.snapshot(limit=n)[0]
+
+
+class MemoryAlertLog:
+    """Alerts as the in-process alert system keeps them (`alerts_fn`, `stats_fn`).
+
+    record() only counts, so cached responses know when to rebuild.
+    """
+
+    def __init__(self, alerts_fn, stats_fn):
+        self.alerts_fn = alerts_fn
+        self.stats_fn = stats_fn
+        self._version = 0
+
+    def record(self, alert):
+        self._version += 1
+
+    def version(self):
+        return self._version
+
+    def alerts(self):
+        return self.alerts_fn()
+
+    def stats(self):
+        return self.stats_fn()
+
+
+class SqliteAlertLog:
+    """MemoryAlertLog's interface over the shared `alerts` table, for alerts raised in any process.
+
+    Keeps the last ALERTS_SIZE alerts and running counts per level.
+    """
+
+    def __init__(self, store, capacity=ALERTS_SIZE):
+        self.store = store
+        self.capacity = capacity
+
+    def record(self, alert):
+        with self.store.transaction() as db:
+            db.execute('INSERT INTO alerts (data) VALUES (?)', (json.dumps(alert, default=lambda value: value.isoformat() if hasattr(value, 'isoformat') else str(value)),))
+            db.execute('INSERT INTO alert_levels VALUES (?, 1) ON CONFLICT(level) DO UPDATE SET n = n + 1',
+                       (str(alert.get('level', 'unknown')),))
+            db.execute('DELETE FROM alerts WHERE id <= (SELECT MAX(id) FROM alerts) - ?', (self.capacity,))
+
+    def version(self):
+        return self.store.query('SELECT COALESCE(MAX(id), 0) FROM alerts')[0][0]
+
+    def alerts(self):
+        rows = self.store.query('SELECT data FROM alerts ORDER BY id DESC LIMIT ?', (self.capacity,))
+        return [json.loads(data) for data, in reversed(rows)]
+
+    def stats(self):
+        levels = dict(self.store.query('SELECT level, n FROM alert_levels'))
+        return {'total_alerts': sum(levels.values()), 'alerts_by_level': levels}
+
+
+_stores = {}
+
+
+def _store(path):
+    if path not in _stores:
+        _stores[path] = SqliteStore(path)
+    return _stores[path]
+
+
+def open_store():
+    """The SqliteStore at IDS_STATE_DB, shared by everything in this process that uses it."""
+    return _store(STATE_DB)
+
+
+def open_state(window_count=1000, window_seconds=15 * 60, max_explainable=10000, backend=None):
+    """The API's prediction/metrics/threat state for the configured backend."""
+    backend = backend or STATE_BACKEND
+    if backend == 'sqlite':
+        return SqliteState(_store(STATE_DB), window_count, window_seconds, max_explainable)
+    if backend != 'memory':
+        raise ValueError(f'Unknown state backend {backend!r}')
+    return MemoryState(window_count, window_seconds, max_explainable)
+
+
+def open_alert_log(alerts_fn, stats_fn, backend=None):
+    """Raised alerts: the in-process alert system's own list, or the shared table."""
+    backend = backend or STATE_BACKEND
+    if backend == 'sqlite':
+        return SqliteAlertLog(_store(STATE_DB))
+    if backend != 'memory':
+        raise ValueError(f'Unknown state backend {backend!r}')
+    return MemoryAlertLog(alerts_fn, stats_fn)
+
+
+def open_live_buffer(capacity=1000, lock=None, backend=None):
+    """The live prediction buffer: in-process ring, or the shared table."""
+    backend = backend or STATE_BACKEND
+    if backend == 'sqlite':
+        return SqlitePredictionFeed(_store(STATE_DB), capacity)
+    if backend != 'memory':
+        raise ValueError(f'Unknown state backend {backend!r}')
+    return PredictionRing(capacity, lock)
@@ -0,0 +1,187 @@
+"""Streaming classification metrics over labelled predictions.
+
+Instead of rebuilding y_true/y_pred from the whole prediction history and
+running four sklearn scorers on every request, a per-class confusion
+matrix is updated as labelled predictions arrive (O(batch)), and
+accuracy and macro precision/recall/F1 are derived from its row/column
+totals on demand (O(classes)). The results match sklearn's
+`average='macro', zero_division=0` over the labels seen so far.
+"""
+import threading
+import time
+from collections import deque
+
+
+class ConfusionMatrix:
+    """Per-class confusion counts with running row/column totals."""
+
+    def __init__(self):
+        self.total = 0
+        self.correct = 0
+        self.true_counts = {}  # label -> rows with that true label
+        self.pred_counts = {}  # label -> rows predicted as that label
+        self.true_positives = {}
+
+    def add(self, y_true, y_pred, n=1):
+        """Count `n` rows with the given true/predicted label (n=-1 removes one)."""
+        self.total += n
+        self.true_counts[y_true] = self.true_counts.get(y_true, 0) + n
+        self.pred_counts[y_pred] = self.pred_counts.get(y_pred, 0) + n
+        if y_true == y_pred:
+            self.correct += n
+            self.true_positives[y_true] = self.true_positives.get(y_true, 0) + n
+
+    def labels(self):
+        return sorted(label for label in set(self.true_counts) | set(self.pred_counts)
+                      if self.true_counts.get(label, 0) or self.pred_counts.get(label, 0))
+
+    def metrics(self):
+        if not self.total:
+            return {'accuracy': None, 'precision': None, 'recall': None, 'f1_score': None, 'samples': 0}
+        precision = recall = f1 = 0.0
+        labels = self.labels()
+        for label in labels:
+            tp = self.true_positives.get(label, 0)
+            predicted = self.pred_counts.get(label, 0)
+            actual = self.true_counts.get(label, 0)
+            precision += tp / predicted if predicted else 0.0
+            recall += tp / actual if actual else 0.0
+            f1 += 2 * tp / (predicted + actual) if predicted + actual else 0.0
+        n = len(labels)
+        return {
+            'accuracy': self.correct / self.total,
+            'precision': precision / n,
+            'recall': recall / n,
+            'f1_score': f1 / n,
+            'samples': self.total,
+        }
+
+
+class WindowedConfusionMatrix(ConfusionMatrix):
+    """Confusion matrix over the last `max_count` rows and/or `max_age` seconds."""
+
+    def __init__(self, max_count=None, max_age=None):
+        super().__init__()
+        self.max_count = max_count
+        self.max_age = max_age
+        self._rows = deque()
+
+    def push(self, y_true, y_pred, now):
+        self._rows.append((now, y_true, y_pred))
+        self.add(y_true, y_pred)
+        self.expire(now)
+
+    def expire(self, now):
+        rows = self._rows
+        while rows and ((self.max_count is not None and len(rows) > self.max_count)
+                        or (self.max_age is not None and rows[0][0] < now - self.max_age)):
+            _, y_true, y_pred = rows.popleft()
+            self.add(y_true, y_pred, -1)
+
+
+class MetricsAccumulator:
+    """Thread-safe cumulative and sliding-window metrics for labelled predictions."""
+
+    def __init__(self, window_count=1000, window_seconds=15 * 60):
+        self.lock = threading.Lock()
+        self.overall = ConfusionMatrix()
+        self.windows = {
+            'last_n': WindowedConfusionMatrix(max_count=window_count),
+            'last_minutes': WindowedConfusionMatrix(max_age=window_seconds),
+        }
+
+    def update(self, pairs, now=None):
+        """Record an iterable of (true_label, predicted_label) pairs."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for y_true, y_pred in pairs:
+                self.overall.add(y_true, y_pred)
+                for window in self.windows.values():
+                    window.push(y_true, y_pred, now)
+
+    def metrics(self, window=None, now=None):
+        """Metrics over everything, or over one of the sliding windows."""
+        with self.lock:
+            if window is None:
+                return self.overall.metrics()
+            matrix = self.windows[window]
+            matrix.expire(time.time() if now is None else now)
+            return matrix.metrics()
+
+
+class PredictionStats:
+    """Running prediction counts: all-time, last `window_count`, last `window_seconds`.
+
+    Updated as predictions are recorded so status endpoints never rescan
+    the prediction history. Time-window counts are kept in one-second
+    buckets with running sums.
+    """
+
+    def __init__(self, window_count=1000, window_seconds=15 * 60, positive='Malicious'):
+        self.lock = threading.Lock()
+        self.positive = positive
+        self.window_count = window_count
+        self.window_seconds = window_seconds
+        self.totals = {}
+        self.total = 0
+        self._recent = deque()
+        self.recent_totals = {}
+        self._buckets = deque()  # [second, total, positive]
+        self._bucket_total = 0
+        self._bucket_positive = 0
+
+    def record(self, predictions, now=None):
+        """Record an iterable of predicted labels (as strings)."""
+        now = time.time() if now is None else now
+        second = int(now)
+        with self.lock:
+            for label in predictions:
+                self.total += 1
+                self.totals[label] = self.totals.get(label, 0) + 1
+                self._recent.append(label)
+                self.recent_totals[label] = self.recent_totals.get(label, 0) + 1
+                if len(self._recent) > self.window_count:
+                    old = self._recent.popleft()
+                    self.recent_totals[old] -= 1
+                if not self._buckets or self._buckets[-1][0] != second:
+                    self._buckets.append([second, 0, 0])
+                bucket = self._buckets[-1]
+                bucket[1] += 1
+                self._bucket_total += 1
+                if label == self.positive:
+                    bucket[2] += 1
+                    self._bucket_positive += 1
+            self._expire(second)
+
+    def _expire(self, second):
+        buckets = self._buckets
+        while buckets and buckets[0][0] <= second - self.window_seconds:
+            _, total, positive = buckets.popleft()
+            self._bucket_total -= total
+            self._bucket_positive -= positive
+
+    @staticmethod
+    def _rate(part, whole):
+        return round(part / max(whole, 1) * 100, 2)
+
+    def snapshot(self, now=None):
+        """All counters at once, consistent with each other."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._expire(int(now))
+            positive = self.totals.get(self.positive, 0)
+            recent = len(self._recent)
+            recent_positive = self.recent_totals.get(self.positive, 0)
+            return {
+                'total': self.total,
+                'positive': positive,
+                'rate': self._rate(positive, self.total),
+                'counts': dict(self.totals),
+                'recent_total': recent,
+                'recent_positive': recent_positive,
+                'recent_counts': {k: v for k, v in self.recent_totals.items() if v},
+                'recent_rate': self._rate(recent_positive, recent),
+                'window_total': self._bucket_total,
+                'window_positive': self._bucket_positive,
+                'window_rate': self._rate(self._bucket_positive, self._bucket_total),
+            }
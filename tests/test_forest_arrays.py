@@ -0,0 +1,94 @@
+"""ArrayForest must predict exactly like the scikit-learn forest it was exported from."""
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forest_arrays  # noqa: E402
+from forest_arrays import ArrayForest, export  # noqa: E402
+
+
+def _fit(X, y):
+    return RandomForestClassifier(n_estimators=10, max_depth=8, random_state=0).fit(X, y)
+
+
+def _threshold_rows(model, X, count=200):
+    """Rows of X with one feature set exactly to a split threshold of the forest."""
+    rng = np.random.RandomState(1)
+    splits = [(f, t) for e in model.estimators_
+              for f, t in zip(e.tree_.feature, e.tree_.threshold)
+              if f >= 0 and np.isfinite(t)]  # NaN-only splits have an infinite threshold
+    rows = X[rng.randint(len(X), size=count)].copy()
+    for row, i in zip(rows, rng.randint(len(splits), size=count)):
+        feature, threshold = splits[i]
+        row[feature] = threshold
+    return rows
+
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.RandomState(0)
+    X = rng.rand(2000, 6)
+    X[:, 3] = rng.randint(0, 4, size=len(X))
+    X[rng.rand(*X.shape) < 0.1] = np.nan
+    # NaN in feature 0 correlates with the positive class, so some splits learn to send it left
+    y = np.where(np.isnan(X[:, 0]) | (X[:, 0] < 0.3) | (X[:, 3] == 2), 'Malicious', 'Benign')
+    return X, y
+
+
+@pytest.fixture(scope='module')
+def fitted(data, tmp_path_factory):
+    X, y = data
+    model = _fit(X, y)
+    directory = str(tmp_path_factory.mktemp('forest'))
+    export(model, directory)
+    return model, ArrayForest(directory)
+
+
+def _cases(data, model):
+    X, _ = data
+    return {'nan': X[:300], 'threshold': _threshold_rows(model, X),
+            'clean': np.nan_to_num(X[300:600], nan=0.5)}
+
+
+@pytest.mark.parametrize('case', ['nan', 'threshold', 'clean'])
+def test_batch_matches_sklearn(data, fitted, case):
+    model, forest = fitted
+    X = _cases(data, model)[case]
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+    np.testing.assert_allclose(forest.predict_proba(X), model.predict_proba(X))
+
+
+@pytest.mark.parametrize('case', ['nan', 'threshold', 'clean'])
+def test_single_row_matches_sklearn(data, fitted, case):
+    model, forest = fitted
+    X = _cases(data, model)[case]
+    for i in range(len(X)):
+        assert forest.predict(X[i:i + 1])[0] == model.predict(X[i:i + 1])[0], f'row {i}'
+
+
+def test_string_labels_round_trip(fitted):
+    model, forest = fitted
+    assert list(forest.classes_) == list(model.classes_) == ['Benign', 'Malicious']
+
+
+def test_verify_parity(data, fitted):
+    model, forest = fitted
+    X, _ = data
+    assert forest_arrays.verify_parity(model, forest, X[:500]) == 500
+
+
+def test_loads_export_without_missing_values(data, tmp_path):
+    X, y = data
+    clean = np.nan_to_num(X, nan=0.5)
+    model = _fit(clean, y)
+    export(model, str(tmp_path))
+    os.remove(os.path.join(str(tmp_path), 'missing_left.npy'))
+    forest = ArrayForest(str(tmp_path))
+    assert forest.missing_left is None
+    np.testing.assert_array_equal(forest.predict(clean[:300]), model.predict(clean[:300]))
+    assert forest.predict(clean[:1])[0] == model.predict(clean[:1])[0]